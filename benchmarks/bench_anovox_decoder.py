@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+# @file: bench_anovox_decoder.py
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import numpy as np
+import yaml
+
+
+def _load_label_utils():
+    # by file, importing the dataloader package would load the dataset wrappers and torch
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataloader", "label_utils.py")
+    spec = importlib.util.spec_from_file_location("label_utils", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+AnoVoxColorDecoder = _load_label_utils().AnoVoxColorDecoder
+
+
+def legacy_decode(sem_labels, color_palette, remap, learning_map):
+    # per-point palette search as done before AnoVoxColorDecoder
+    new_labels = np.arange(len(sem_labels))
+    for i, value in enumerate(sem_labels):
+        color_index = np.where((color_palette == value).all(axis=1))
+        new_labels[i] = color_index[0][0]
+    new_labels = remap[new_labels]
+    return np.array([learning_map[label] for label in new_labels])
+
+
+def main(args):
+    with open(args.label_mapping, "r") as stream:
+        anovox_yaml = yaml.safe_load(stream)
+    palette = np.asarray(anovox_yaml["color_map"], dtype=np.uint8)
+    remap = np.array(anovox_yaml["to_SemKITTI"])
+
+    rng = np.random.default_rng(0)
+    colors = palette[rng.integers(0, len(palette), args.num_points)]
+
+    t0 = time.perf_counter()
+    decoder = AnoVoxColorDecoder.from_yaml(anovox_yaml)
+    build_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        fast = decoder(colors)
+    fast_time = (time.perf_counter() - t0) / args.repeat
+
+    legacy_points = min(args.num_points, args.legacy_points)
+    t0 = time.perf_counter()
+    slow = legacy_decode(colors[:legacy_points], anovox_yaml["color_map"], remap, anovox_yaml["learning_map"])
+    slow_time = (time.perf_counter() - t0) * args.num_points / legacy_points
+
+    assert np.array_equal(fast[:legacy_points], slow), "decoder output differs from the legacy loop"
+
+    print("points: %d" % args.num_points)
+    print("decoder build: %.1f ms" % (build_time * 1e3))
+    print("legacy loop:   %.1f ms/frame (extrapolated from %d points)" % (slow_time * 1e3, legacy_points))
+    print("lut decoder:   %.3f ms/frame" % (fast_time * 1e3))
+    print("speedup:       %.0fx" % (slow_time / fast_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--label_mapping', default='../config/label_mapping/anovox-label.yaml')
+    parser.add_argument('--num_points', type=int, default=100000)
+    parser.add_argument('--legacy_points', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
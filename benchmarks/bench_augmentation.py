@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+# @file: bench_augmentation.py
+
+"""
+Time the four in-place augmentation passes the dataset wrappers used to run
+(np.matrix rotation, flip, scale, translation) against the fused
+PointAugmentor, and check that a seeded PointAugmentor repeats its draws.
+"""
+
+import argparse
+import sys
+import time
+sys.path.append("..")
+import numpy as np
+
+from dataloader.voxelizer import PointAugmentor
+
+
+def legacy(xyz, trans_std=(0.1, 0.1, 0.1)):
+    xyz = np.array(xyz)
+    rotate_rad = np.deg2rad(np.random.random() * 90) - np.pi / 4
+    c, s = np.cos(rotate_rad), np.sin(rotate_rad)
+    j = np.matrix([[c, s], [-s, c]])
+    xyz[:, :2] = np.dot(xyz[:, :2], j)
+
+    flip_type = np.random.choice(4, 1)
+    if flip_type == 1:
+        xyz[:, 0] = -xyz[:, 0]
+    elif flip_type == 2:
+        xyz[:, 1] = -xyz[:, 1]
+    elif flip_type == 3:
+        xyz[:, :2] = -xyz[:, :2]
+    noise_scale = np.random.uniform(0.95, 1.05)
+    xyz[:, 0] = noise_scale * xyz[:, 0]
+    xyz[:, 1] = noise_scale * xyz[:, 1]
+
+    noise_translate = np.array([np.random.normal(0, trans_std[0], 1),
+                                np.random.normal(0, trans_std[1], 1),
+                                np.random.normal(0, trans_std[2], 1)]).T
+    xyz[:, 0:3] += noise_translate
+    return xyz
+
+
+def timeit(func, repeat):
+    func()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    make = lambda: PointAugmentor(True, (-45, 45), True, True, True, seed=args.seed)
+
+    for num_points in args.num_points:
+        xyz = rng.normal(0, 20, (num_points, 3)).astype(np.float32)
+
+        a, b = make(), make()
+        for _ in range(3):
+            assert np.array_equal(a(xyz), b(xyz)), "seeded augmentation is not reproducible"
+
+        # the fused matrix must agree with applying the transforms one after another
+        aug = make()
+        matrix, translation = aug.sample()
+        assert np.allclose(xyz @ matrix + translation, make()(xyz), atol=1e-4)
+
+        print("%d points" % num_points)
+        base = timeit(lambda: legacy(xyz), args.repeat)
+        print("  %-8s %8.3f ms" % ("legacy", base * 1e3))
+        t = timeit(lambda: aug(xyz), args.repeat)
+        print("  %-8s %8.3f ms  (%.1fx)" % ("fused", t * 1e3, base / t))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--num_points', type=int, nargs='+', default=[30000, 120000, 360000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
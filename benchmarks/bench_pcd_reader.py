@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+# @file: bench_pcd_reader.py
+
+"""
+Per-frame decode time and peak memory of read_pcd against the Open3D path the
+AnoVox loaders used before. Runs on a pcd file passed with --pcd or on a
+synthetic x y z rgb scan. Every reader is measured in a fresh process so the
+peak RSS of one does not hide the other.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+sys.path.append("..")
+import numpy as np
+
+from dataloader.scan_io import read_pcd
+
+
+def write_pcd(path, num_points, encoding, seed=0):
+    rng = np.random.default_rng(seed)
+    xyz = rng.uniform(-50, 50, (num_points, 3)).astype(np.float32)
+    rgb = rng.integers(0, 256, (num_points, 3), dtype=np.uint32)
+    packed = ((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]).view(np.float32)
+    header = ("VERSION 0.7\nFIELDS x y z rgb\nSIZE 4 4 4 4\nTYPE F F F F\nCOUNT 1 1 1 1\n"
+              "WIDTH %d\nHEIGHT 1\nVIEWPOINT 0 0 0 1 0 0 0\nPOINTS %d\nDATA %s\n" % (num_points, num_points, encoding))
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        if encoding == "binary":
+            record = np.empty(num_points, dtype=[("xyz", "<f4", (3,)), ("rgb", "<f4")])
+            record["xyz"] = xyz
+            record["rgb"] = packed
+            f.write(record.tobytes())
+        else:
+            for p, c in zip(xyz, packed):
+                f.write(("%.8g %.8g %.8g %.9g\n" % (p[0], p[1], p[2], c)).encode("ascii"))
+
+
+def read_open3d(path):
+    # the decode done by AnoVox_train.__getitem__ before read_pcd
+    import open3d as o3d
+
+    pcd = o3d.io.read_point_cloud(path)
+    points = np.asarray(pcd.points)
+    colors = (np.asarray(pcd.colors) * 255.0).astype(np.uint8)
+    return points, colors
+
+
+READERS = {
+    "numpy": read_pcd,
+    "open3d": read_open3d,
+}
+
+
+def _measure(name, path, repeat, queue):
+    reader = READERS[name]
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    reader(path)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        xyz, rgb = reader(path)
+    elapsed = (time.perf_counter() - t0) / repeat
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    queue.put((elapsed, peak, np.asarray(xyz, dtype=np.float32), rgb))
+
+
+def measure(name, path, repeat):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(name, path, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def open3d_available():
+    try:
+        import open3d  # noqa: F401
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+def main(args):
+    encodings = [args.pcd] if args.pcd else ["binary", "ascii"]
+    readers = ["numpy"] + (["open3d"] if open3d_available() else [])
+    if len(readers) == 1:
+        print("open3d is not importable, timing read_pcd only")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for encoding in encodings:
+            if args.pcd:
+                path = args.pcd
+            else:
+                path = os.path.join(tmp, "scan_%s.pcd" % encoding)
+                write_pcd(path, args.num_points, encoding)
+
+            results = {name: measure(name, path, args.repeat) for name in readers}
+            print("%s (%.1f MB)" % (os.path.basename(path), os.path.getsize(path) / 2 ** 20))
+            for name, (elapsed, peak, _, _) in results.items():
+                # ru_maxrss is in KB on linux
+                print("  %-7s %8.2f ms/frame   peak rss +%.1f MB" % (name, elapsed * 1e3, peak / 1024))
+            if "open3d" in results:
+                _, _, xyz, rgb = results["numpy"]
+                _, _, ref_xyz, ref_rgb = results["open3d"]
+                assert np.array_equal(rgb, ref_rgb), "colors differ from Open3D"
+                assert np.allclose(xyz, ref_xyz), "points differ from Open3D"
+                print("  speedup %.1fx" % (results["open3d"][0] / results["numpy"][0]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--pcd', default='', help='benchmark this file instead of synthetic scans')
+    parser.add_argument('--num_points', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+# @file: bench_voxel_labels.py
+
+"""
+Time lexsort + nb_process_label against the sort-free voxel labellers on
+30k (nuScenes), 120k (SemanticKITTI) and 360k (multiscan) point scans, and
+check that all of them write the same voxel labels. --threads sets the
+numba threads of numba_parallel, 0 keeps numba's default.
+"""
+
+import argparse
+import sys
+import time
+sys.path.append("..")
+import numba as nb
+import numpy as np
+
+from dataloader.dataset_semantickitti import nb_process_label
+from dataloader.voxel_labels import VOXEL_LABEL_METHODS, process_label
+
+
+def synthetic_scan(num_points, grid_size, num_classes, rng):
+    # points concentrate near the sensor like a real scan, so many voxels hold several points
+    rho = np.minimum(rng.exponential(grid_size[0] / 6, num_points), grid_size[0] - 1)
+    grid_ind = np.stack([rho.astype(np.int64),
+                         rng.integers(0, grid_size[1], num_points),
+                         rng.normal(grid_size[2] / 3, 3, num_points).clip(0, grid_size[2] - 1).astype(np.int64)], axis=1)
+    labels = rng.integers(0, num_classes, (num_points, 1)).astype(np.uint8)
+    return grid_ind, labels
+
+
+def legacy(processed_label, grid_ind, labels):
+    label_voxel_pair = np.concatenate([grid_ind, labels], axis=1)
+    label_voxel_pair = label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
+    return nb_process_label(np.copy(processed_label), label_voxel_pair)
+
+
+def timeit(func, repeat):
+    func()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main(args):
+    if args.threads > 0:
+        nb.set_num_threads(args.threads)
+    print("numba threads: %d" % nb.get_num_threads())
+    rng = np.random.default_rng(0)
+    grid_size = args.grid_size
+    processed_label = np.full(grid_size, args.ignore_label, dtype=np.uint8)
+
+    for num_points in args.num_points:
+        grid_ind, labels = synthetic_scan(num_points, grid_size, args.num_classes, rng)
+        reference = legacy(processed_label, grid_ind, labels)
+        for method in VOXEL_LABEL_METHODS:
+            assert np.array_equal(process_label(processed_label, grid_ind, labels, method), reference), method
+
+        print("%d points, %d occupied voxels" % (num_points, len(np.unique(grid_ind, axis=0))))
+        base = timeit(lambda: legacy(processed_label, grid_ind, labels), args.repeat)
+        print("  %-16s %8.2f ms" % ("lexsort+nb", base * 1e3))
+        for method in VOXEL_LABEL_METHODS:
+            t = timeit(lambda: process_label(processed_label, grid_ind, labels, method), args.repeat)
+            print("  %-16s %8.2f ms  (%.1fx)" % (method, t * 1e3, base / t))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--num_points', type=int, nargs='+', default=[30000, 120000, 360000])
+    parser.add_argument('--grid_size', type=int, nargs=3, default=[480, 360, 32])
+    parser.add_argument('--num_classes', type=int, default=20)
+    parser.add_argument('--ignore_label', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=0, help='numba threads, 0 for the default')
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
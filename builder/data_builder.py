@@ -3,8 +3,16 @@
 # @file: data_builder.py 
 
 import torch
-from dataloader.dataset_semantickitti import get_model_class, collate_fn_BEV, collate_fn_BEV_test, collate_fn_BEV_val, collate_fn_BEV_incre
+from dataloader.dataset_semantickitti import get_model_class
 from dataloader.pc_dataset import get_pc_model_class
+from dataloader.nusc_index import has_nusc_index
+from dataloader.read_ahead import ReadAheadDataset
+from dataloader.point_batch import PointBatchCollate
+from dataloader.loader_profile import loader_kwargs
+from dataloader.budget_sampler import BudgetBatchSampler, load_scan_sizes
+from dataloader.sample_batch import BatchCollate, parse_fields
+from dataloader.sample_cache import CachedDataset, SampleCache
+from dataloader.shared_cache import SharedCachedDataset
 
 
 def build(dataset_config,
@@ -23,14 +31,33 @@ def build(dataset_config,
     SemKITTI = get_pc_model_class(dataset_config['pc_dataset_type'])
 
     nusc=None
-    if "nusc" in dataset_config['pc_dataset_type']:
+    # with saved sample indexes (tools/build_nusc_index.py) the devkit tables are not needed
+    if "nusc" in dataset_config['pc_dataset_type'] and not (
+            has_nusc_index(train_imageset) and has_nusc_index(val_imageset)):
         from nuscenes import NuScenes
         nusc = NuScenes(version='v1.0-test', dataroot=data_path, verbose=True)
 
+    # only pass reader options that were switched on, not every pc_dataset class accepts them
+    train_pt_kwargs = {}
+    val_pt_kwargs = {}
+    if train_dataloader_config.get("use_memmap", False):
+        train_pt_kwargs["use_memmap"] = True
+    if val_dataloader_config.get("use_memmap", False):
+        val_pt_kwargs["use_memmap"] = True
+
     train_pt_dataset = SemKITTI(data_path, imageset=train_imageset,
-                                return_ref=train_ref, label_mapping=label_mapping, nusc=nusc)
+                                return_ref=train_ref, label_mapping=label_mapping, nusc=nusc, **train_pt_kwargs)
     val_pt_dataset = SemKITTI(data_path, imageset=val_imageset,
-                              return_ref=val_ref, label_mapping=label_mapping, nusc=nusc)
+                              return_ref=val_ref, label_mapping=label_mapping, nusc=nusc, **val_pt_kwargs)
+    if val_dataloader_config.get("read_ahead", 0) > 0:
+        # the val loader walks the split in order, so the next samples can be read while this one is voxelized
+        if val_dataloader_config["shuffle"]:
+            raise ValueError("read_ahead needs an unshuffled val loader, set shuffle: False in val_data_loader")
+        val_pt_dataset = ReadAheadDataset(val_pt_dataset,
+                                          depth=val_dataloader_config["read_ahead"],
+                                          num_threads=val_dataloader_config.get("read_ahead_threads", 2),
+                                          report_every=val_dataloader_config.get("read_ahead_report", 0),
+                                          batch_size=val_dataloader_config["batch_size"])
 
     train_dataset = get_model_class(dataset_config['dataset_type'])(
         train_pt_dataset,
@@ -44,6 +71,12 @@ def build(dataset_config,
         scale_aug=True,
         transform_aug=True,
         ds_sample=True,
+        return_voxel_position=dataset_config.get("return_voxel_position", False),
+        sparse_label=dataset_config.get("sparse_label", False),
+        voxelize_on_device=dataset_config.get("voxelize_on_device", False),
+        voxel_index=dataset_config.get("voxel_index", False),
+        feature_dtype=dataset_config.get("feature_dtype", "float32"),
+        seed=train_dataloader_config.get("seed"),
         # incre = incre
     )
 
@@ -56,20 +89,59 @@ def build(dataset_config,
         ignore_label=dataset_config["ignore_label"],
         return_test=True,
         ds_sample=False,
+        return_voxel_position=dataset_config.get("return_voxel_position", False),
+        sparse_label=dataset_config.get("sparse_label", False),
+        voxelize_on_device=dataset_config.get("voxelize_on_device", False),
+        voxel_index=dataset_config.get("voxel_index", False),
+        feature_dtype=dataset_config.get("feature_dtype", "float32"),
     )
+    if val_dataloader_config.get("sample_cache"):
+        # val samples are not augmented, later runs read them voxelized from the cache
+        val_dataset = CachedDataset(val_dataset,
+                                    SampleCache(val_dataloader_config["sample_cache"],
+                                                max_bytes=int(val_dataloader_config.get("sample_cache_gb", 20.0) * 2 ** 30)),
+                                    label_mapping)
+    if val_dataloader_config.get("shared_cache_gb", 0) > 0:
+        # the val workers of every eval pass share the samples voxelized by the first one
+        val_dataset = SharedCachedDataset(val_dataset, int(val_dataloader_config["shared_cache_gb"] * 2 ** 30))
+
+    # a seeded loader makes the shuffling and the per worker augmentation seeds reproducible
+    generator = None
+    if train_dataloader_config.get("seed") is not None:
+        generator = torch.Generator().manual_seed(train_dataloader_config["seed"])
+
+    # only the batch_fields the loops use are collated, see dataloader/sample_batch.py
+    train_collate = BatchCollate("dis_labels" if incre is not None else None,
+                                 parse_fields(train_dataloader_config.get("batch_fields", "")))
+    val_collate = BatchCollate("path_save", parse_fields(val_dataloader_config.get("batch_fields", "")))
+    if dataset_config.get("point_batch", False):
+        # features and grid indices of a batch travel as one buffer, see dataloader/point_batch.py
+        train_collate = PointBatchCollate(train_collate)
+        val_collate = PointBatchCollate(val_collate)
+
+    train_batching = dict(batch_size=train_dataloader_config["batch_size"],
+                          shuffle=train_dataloader_config["shuffle"],
+                          drop_last=True)
+    if train_dataloader_config.get("batch_budget", 0) > 0:
+        # as many scans per batch as fit into the point / voxel budget, see dataloader/budget_sampler.py
+        scan_sizes = load_scan_sizes(train_dataset, num_workers=train_dataloader_config["num_workers"])
+        train_batching = dict(batch_sampler=BudgetBatchSampler(
+            scan_sizes.get(train_dataloader_config.get("budget_by", "points")),
+            train_dataloader_config["batch_budget"],
+            shuffle=train_dataloader_config["shuffle"],
+            max_batch_size=train_dataloader_config.get("max_batch_size", 0),
+            generator=generator))
 
     train_dataset_loader = torch.utils.data.DataLoader(dataset=train_dataset,
-                                                       batch_size=train_dataloader_config["batch_size"],
-                                                       collate_fn=collate_fn_BEV_incre if incre is not None else collate_fn_BEV,
-                                                       shuffle=train_dataloader_config["shuffle"],
-                                                       num_workers=train_dataloader_config["num_workers"],
-                                                       pin_memory=False,
-                                                       drop_last=True)
+                                                       collate_fn=train_collate,
+                                                       generator=generator,
+                                                       **train_batching,
+                                                       **loader_kwargs(train_dataloader_config))
     val_dataset_loader = torch.utils.data.DataLoader(dataset=val_dataset,
                                                      batch_size=val_dataloader_config["batch_size"],
-                                                     collate_fn=collate_fn_BEV_test,
+                                                     collate_fn=val_collate,
                                                      shuffle=val_dataloader_config["shuffle"],
-                                                     num_workers=val_dataloader_config["num_workers"],
-                                                     pin_memory=False)
+                                                     # persistent workers serve every eval pass of a run
+                                                     **loader_kwargs(val_dataloader_config))
 
     return train_dataset_loader, val_dataset_loader
@@ -3,7 +3,8 @@
 # @file: loss_builder.py 
 
 import torch
-from utils.lovasz_losses import lovasz_softmax
+from utils.lovasz_losses import lovasz_softmax, lovasz_softmax_flat
+from dataloader.sparse_labels import SparseVoxelLabelBatch
 
 
 def build(wce=True, lovasz=True, num_class=20, ignore_label=0):
@@ -33,3 +34,20 @@ def build_ood(wce=True, lovasz=True, num_class=20, ignore_label=0, weight=1):
         return lovasz_softmax
     else:
         raise NotImplementedError
+
+
+def voxel_loss(outputs, label, loss_func, ignore_label=0):
+    """
+    lovasz_softmax(softmax(outputs), label, ignore) + loss_func(outputs, label)
+    for a dense (B, *grid_size) target or a SparseVoxelLabelBatch.
+
+    The sparse target only scores the occupied voxels, which are the only ones
+    the dense target does not ignore, so both give the same loss.
+    """
+    if not isinstance(label, SparseVoxelLabelBatch):
+        return lovasz_softmax(torch.nn.functional.softmax(outputs, dim=1), label, ignore=ignore_label) + loss_func(
+            outputs, label)
+    logits = label.gather(outputs)
+    valid = label.labels != ignore_label
+    return lovasz_softmax_flat(torch.nn.functional.softmax(logits[valid], dim=1), label.labels[valid]) + loss_func(
+        logits, label.labels)
@@ -1,9 +1,10 @@
 # -*- coding:utf-8 -*-
 # author: Xinge
 
+import re
 from pathlib import Path
 
-from strictyaml import Bool, Float, Int, Map, Seq, Str, as_document, load
+from strictyaml import Bool, Float, Int, Map, Optional, Seq, Str, as_document, load
 
 model_params = Map(
     {
@@ -28,6 +29,12 @@ dataset_params = Map(
         "label_mapping": Str(),
         "max_volume_space": Seq(Float()),
         "min_volume_space": Seq(Float()),
+        Optional("return_voxel_position", default=False): Bool(),
+        Optional("sparse_label", default=False): Bool(),
+        Optional("voxelize_on_device", default=False): Bool(),
+        Optional("voxel_index", default=False): Bool(),
+        Optional("point_batch", default=False): Bool(),
+        Optional("feature_dtype", default="float32"): Str(),
     }
 )
 
@@ -40,6 +47,17 @@ train_data_loader = Map(
         "batch_size": Int(),
         "shuffle": Bool(),
         "num_workers": Int(),
+        Optional("use_memmap", default=False): Bool(),
+        Optional("seed"): Int(),
+        Optional("pin_memory", default=False): Bool(),
+        Optional("persistent_workers", default=False): Bool(),
+        Optional("prefetch_factor", default=2): Int(),
+        Optional("cpu_affinity", default=""): Str(),
+        Optional("worker_threads", default=0): Int(),
+        Optional("batch_fields", default=""): Str(),
+        Optional("batch_budget", default=0): Int(),
+        Optional("budget_by", default="points"): Str(),
+        Optional("max_batch_size", default=0): Int(),
     }
 )
 
@@ -51,6 +69,19 @@ val_data_loader = Map(
         "batch_size": Int(),
         "shuffle": Bool(),
         "num_workers": Int(),
+        Optional("use_memmap", default=False): Bool(),
+        Optional("pin_memory", default=False): Bool(),
+        Optional("persistent_workers", default=False): Bool(),
+        Optional("prefetch_factor", default=2): Int(),
+        Optional("cpu_affinity", default=""): Str(),
+        Optional("worker_threads", default=0): Int(),
+        Optional("read_ahead", default=0): Int(),
+        Optional("read_ahead_threads", default=2): Int(),
+        Optional("read_ahead_report", default=0): Int(),
+        Optional("sample_cache", default=""): Str(),
+        Optional("sample_cache_gb", default=20.0): Float(),
+        Optional("shared_cache_gb", default=0.0): Float(),
+        Optional("batch_fields", default=""): Str(),
     }
 )
 
@@ -95,6 +126,52 @@ def load_config_data(path: str) -> dict:
     return cfg
 
 
+def _yaml_scalar(value) -> str:
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"%s"' % str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def update_config_file(path: str, section: str, values: dict) -> None:
+    """
+    set values of one section in the YAML at path. Only the lines of those
+    keys change, keys the section does not have yet are appended to it, the
+    rest of the file is left as it is. The result is validated before it is
+    written.
+    """
+    lines = Path(path).read_text().splitlines(keepends=True)
+    header = re.compile(r"^%s:\s*(#.*)?$" % re.escape(section))
+    start = next((i for i, line in enumerate(lines) if header.match(line)), None)
+    if start is None:
+        raise KeyError("section %s not found in %s" % (section, path))
+    # the section ends at the next top level key
+    end = start + 1
+    while end < len(lines) and not re.match(r"^[^\s#]", lines[end]):
+        end += 1
+    indent = "  "
+    last = start
+    pending = dict(values)
+    for i in range(start + 1, end):
+        match = re.match(r"^(\s+)([^\s:#]+):(\s*)([^#\n]*?)(\s*#.*)?(\n?)$", lines[i])
+        if match is None:
+            continue
+        indent, key = match.group(1), match.group(2)
+        last = i
+        if key in pending:
+            lines[i] = "%s%s:%s%s%s%s" % (indent, key, match.group(3) or " ", _yaml_scalar(pending.pop(key)),
+                                          match.group(5) or "", match.group(6))
+    if lines[last] and not lines[last].endswith("\n"):
+        lines[last] += "\n"
+    lines[last + 1:last + 1] = ["%s%s: %s\n" % (indent, key, _yaml_scalar(value)) for key, value in pending.items()]
+
+    yaml_string = "".join(lines)
+    schema_version = int(load(yaml_string, schema=None)["format_version"])
+    load(yaml_string, schema=SCHEMA_FORMAT_VERSION_TO_SCHEMA[schema_version])
+    Path(path).write_text(yaml_string)
+
+
 def config_data_to_config(data):  # type: ignore
     return as_document(data, schema_v4)
 
@@ -0,0 +1,144 @@
+# -*- coding:utf-8 -*-
+# @file: batch_voxelizer.py
+
+"""
+Voxelization of a whole batch with torch, after collate.
+
+With voxelize_on_device set in dataset_params the DataLoader workers only
+load and augment the scans: the dataset wrappers return the augmented points
+[x, y, z(, intensity)] in place of the point features and None for the grid
+indices and voxel labels. BatchVoxelizer then computes cart2polar, grid_ind,
+the point features and the voxel labels of all scans at once, on the device
+it was moved to (CPU included), with the arithmetic of CylindricalVoxelizer:
+polar coordinates in float64 rounded to float32, intervals of the float32
+extent divided in float64, the rest in float32. On the CPU grid indices,
+features and labels are identical to the worker path. On a GPU atan2 may
+round differently in rare cases, which moves a point on a voxel border into
+the neighbouring voxel.
+
+Only train_cylinder_asym.py and train_cylinder_asym_nuscenes.py voxelize the
+batches, point_tensors raises for raw-point batches in every other loop.
+
+    train_voxelizer = for_dataset(train_dataset_loader.dataset, pytorch_device)
+    if train_voxelizer is not None:
+        vox_label, grid_ten, pt_fea_ten = train_voxelizer(train_pt_fea, train_pt_labs)
+"""
+
+import numpy as np
+import torch
+
+from dataloader.sparse_labels import SparseVoxelLabelBatch
+
+
+class BatchVoxelizer(torch.nn.Module):
+    def __init__(self, grid_size, fixed_bounds=None, ignore_label=0, polar=True, sparse_label=False):
+        super(BatchVoxelizer, self).__init__()
+        self.grid_size = tuple(int(g) for g in grid_size)
+        self.ignore_label = ignore_label
+        self.polar = polar
+        self.sparse_label = sparse_label
+        self.fixed_volume_space = fixed_bounds is not None
+        # bounds follow the module to its device, per-scan bounds are computed in forward
+        if fixed_bounds is None:
+            fixed_bounds = np.zeros((3, 3), dtype=np.float32)
+        self.register_buffer("min_bound", torch.as_tensor(np.asarray(fixed_bounds[0], dtype=np.float32)))
+        self.register_buffer("max_bound", torch.as_tensor(np.asarray(fixed_bounds[1], dtype=np.float32)))
+        self.register_buffer("intervals", torch.as_tensor(np.asarray(fixed_bounds[2], dtype=np.float32)))
+
+    @classmethod
+    def from_voxelizer(cls, voxelizer):
+        """same volume, labels and features as a CylindricalVoxelizer"""
+        return cls(voxelizer.grid_size, voxelizer.fixed_bounds, voxelizer.ignore_label, voxelizer.polar,
+                   voxelizer.sparse_label)
+
+    def bounds(self, xyz_vox, batch_ind, batch_size):
+        """(B, 3) min_bound, max_bound and voxel size of every scan"""
+        if self.fixed_volume_space:
+            expand = lambda t: t.unsqueeze(0).expand(batch_size, 3)
+            return expand(self.min_bound), expand(self.max_bound), expand(self.intervals)
+        index = batch_ind.unsqueeze(1).expand(-1, 3)
+        min_bound = xyz_vox.new_full((batch_size, 3), float("inf")).scatter_reduce(0, index, xyz_vox, "amin")
+        max_bound = xyz_vox.new_full((batch_size, 3), -float("inf")).scatter_reduce(0, index, xyz_vox, "amax")
+        # CylindricalVoxelizer divides the float32 extent by the int64 grid size, i.e. in float64
+        grid_size = torch.tensor(self.grid_size, dtype=torch.float64, device=xyz_vox.device)
+        intervals = ((max_bound - min_bound).double() / (grid_size - 1)).float()
+        if (intervals == 0).any():
+            print("Zero interval!")
+        return min_bound, max_bound, intervals
+
+    def voxel_label(self, grid_ind, labels, batch_ind, batch_size):
+        """
+        majority label of every occupied voxel, ties go to the smallest label
+        like process_label. Returns a SparseVoxelLabelBatch of int64 labels, or
+        its (B, *grid_size) dense volume.
+        """
+        labels = labels.long()
+        num_labels = int(labels.max()) + 1 if len(labels) else 1
+        g0, g1, g2 = self.grid_size
+        voxel_ids = ((batch_ind * g0 + grid_ind[:, 0]) * g1 + grid_ind[:, 1]) * g2 + grid_ind[:, 2]
+        pairs, counts = torch.unique(voxel_ids * num_labels + labels, return_counts=True)
+        pair_voxels, pair_labels = pairs // num_labels, pairs % num_labels
+        voxels, rows = torch.unique(pair_voxels, return_inverse=True)
+        # highest count first, smallest label among equal counts
+        score = counts * num_labels + (num_labels - 1 - pair_labels)
+        best = torch.full((len(voxels),), -1, dtype=score.dtype, device=score.device)
+        best = best.scatter_reduce(0, rows, score, "amax")
+        best_labels = num_labels - 1 - best % num_labels
+
+        z = voxels % g2
+        y = voxels // g2 % g1
+        x = voxels // (g1 * g2) % g0
+        b = voxels // (g0 * g1 * g2)
+        label = SparseVoxelLabelBatch(torch.stack((b, x, y, z), dim=1), best_labels, batch_size, self.grid_size,
+                                      self.ignore_label)
+        return label if self.sparse_label else label.dense()
+
+    def forward(self, points, labels=None):
+        """
+        points: per scan (N, 3/4) augmented [x, y, z(, intensity)], labels: per scan (N, 1) point labels
+        returns the voxel labels (None without labels), per scan (N, 3) int64
+        grid_ind and (N, 8/9/10) float32 point features, all on the module's device
+        """
+        device = self.min_bound.device
+        batch_size = len(points)
+        num_points = [len(p) for p in points]
+        cat_points = torch.cat([torch.as_tensor(p) for p in points]).to(device, torch.float32, non_blocking=True)
+        batch_ind = torch.repeat_interleave(torch.arange(batch_size, device=device),
+                                            torch.tensor(num_points, device=device))
+
+        xyz = cat_points[:, :3]
+        if self.polar:
+            # in float64 like CylindricalVoxelizer.polar_coordinates
+            xyz64 = xyz.double()
+            rho = torch.sqrt(xyz64[:, 0] ** 2 + xyz64[:, 1] ** 2)
+            phi = torch.atan2(xyz64[:, 1], xyz64[:, 0])
+            xyz_vox = torch.stack((rho, phi, xyz64[:, 2]), dim=1).float()
+        else:
+            xyz_vox = xyz
+        min_bound, max_bound, intervals = self.bounds(xyz_vox, batch_ind, batch_size)
+        min_bound, max_bound, intervals = min_bound[batch_ind], max_bound[batch_ind], intervals[batch_ind]
+
+        grid_ind = torch.floor((torch.minimum(torch.maximum(xyz_vox, min_bound), max_bound) - min_bound)
+                               / intervals).long()
+
+        # center data on each voxel for PTnet
+        voxel_centers = (grid_ind.float() + 0.5) * intervals + min_bound
+        fea = [xyz_vox - voxel_centers, xyz_vox]
+        if self.polar:
+            fea.append(xyz[:, :2])
+        fea.append(cat_points[:, 3:])
+        pt_fea = torch.cat(fea, dim=1)
+
+        vox_label = None
+        if labels is not None:
+            cat_labels = torch.cat([torch.as_tensor(l).reshape(-1) for l in labels]).to(device, non_blocking=True)
+            vox_label = self.voxel_label(grid_ind, cat_labels, batch_ind, batch_size)
+        return vox_label, list(grid_ind.split(num_points)), list(pt_fea.split(num_points))
+
+
+def for_dataset(dataset, device=None):
+    """BatchVoxelizer of a dataset wrapper built with voxelize_on_device, None otherwise"""
+    voxelizer = getattr(dataset, "voxelizer", None)
+    if voxelizer is None or not voxelizer.raw_points:
+        return None
+    return BatchVoxelizer.from_voxelizer(voxelizer).to(device)
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+# @file: budget_sampler.py
+
+"""
+Train batches packed under a point or voxel budget.
+
+Memory and time of a cylinder_asym step grow with the points and occupied
+voxels of the batch, not with the number of scans, so a fixed batch_size
+either runs out of memory on dense scans or leaves the GPU idle on sparse
+ones. With batch_budget set in train_data_loader, BudgetBatchSampler forms
+batches of as many scans as fit into batch_budget points (budget_by: points)
+or occupied voxels (budget_by: voxels), at most max_batch_size scans when
+that is set. A scan above the budget is a batch of its own.
+
+The sizes of every scan come from ScanSizes: points and occupied voxels of
+the unaugmented scan, counted once by DataLoader workers and cached under
+SCAN_SIZES_CACHE_DIR (~/.cache/cylinder3d/scan_sizes unless overridden by the
+environment variable, an empty value turns caching off), keyed by the scan
+files and the voxelizer settings.
+
+Batches hold a varying number of scans, the training loops pass
+len(train_pt_fea) as batch size to the model.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from torch.utils import data
+
+from dataloader.sample_cache import file_identity, sample_sources
+
+SCAN_SIZES_VERSION = 1
+SCAN_SIZES_CACHE_DIR = os.environ.get(
+    "SCAN_SIZES_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "cylinder3d", "scan_sizes"))
+BUDGET_BY = ("points", "voxels")
+
+
+class _ScanCounts(data.Dataset):
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        xyz = self.dataset.point_cloud_dataset[index][0]
+        return len(xyz), self.dataset.voxelizer.occupied_voxels(xyz)
+
+
+class ScanSizes(object):
+    """points: (N,) int64 points per scan, voxels: (N,) int64 occupied voxels per scan"""
+
+    def __init__(self, points, voxels):
+        self.points = points
+        self.voxels = voxels
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def count(cls, dataset, num_workers=0):
+        print("counting points and voxels of %d scans" % len(dataset))
+        loader = data.DataLoader(_ScanCounts(dataset), batch_size=None, num_workers=num_workers)
+        counts = np.array([(int(p), int(v)) for p, v in loader], dtype=np.int64).reshape(-1, 2)
+        return cls(counts[:, 0], counts[:, 1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["points"], f["voxels"])
+
+    def save(self, path):
+        tmp = "%s.%d.tmp.npz" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez(tmp, points=self.points, voxels=self.voxels)
+            os.replace(tmp, path)
+        except OSError as e:
+            print("could not write scan sizes %s: %s" % (path, e))
+
+    def get(self, budget_by):
+        if budget_by not in BUDGET_BY:
+            raise ValueError("budget_by must be one of %s, got %s" % (", ".join(BUDGET_BY), budget_by))
+        return getattr(self, budget_by)
+
+
+def scan_sizes_key(dataset):
+    """scan files and voxelizer settings the sizes of dataset depend on"""
+    voxelizer = dataset.voxelizer
+    fixed_bounds = None
+    if voxelizer.fixed_bounds is not None:
+        fixed_bounds = [np.asarray(b).tolist() for b in voxelizer.fixed_bounds]
+    return {
+        "version": SCAN_SIZES_VERSION,
+        "grid_size": np.asarray(voxelizer.grid_size).tolist(),
+        "fixed_bounds": fixed_bounds,
+        "polar": voxelizer.polar,
+        "scans": [file_identity(sample_sources(dataset.point_cloud_dataset, i)[0]) for i in range(len(dataset))],
+    }
+
+
+def load_scan_sizes(dataset, num_workers=0, cache_dir=None):
+    """ScanSizes of the scans of a dataset wrapper, from the cache when the scans did not change"""
+    cache_dir = SCAN_SIZES_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return ScanSizes.count(dataset, num_workers)
+    digest = hashlib.sha1(json.dumps(scan_sizes_key(dataset)).encode("utf-8")).hexdigest()[:20]
+    path = os.path.join(cache_dir, "%s.npz" % digest)
+    try:
+        return ScanSizes.load(path)
+    except (OSError, ValueError, KeyError):
+        pass
+    sizes = ScanSizes.count(dataset, num_workers)
+    sizes.save(path)
+    return sizes
+
+
+class BudgetBatchSampler(data.Sampler):
+    """
+    batches of dataset indices whose sizes sum to at most budget.
+
+    With shuffle the scans are drawn in random order and sorted by size in
+    pools of pool scans before packing, so that scans of similar size share
+    a batch, and the batches are shuffled again. generator seeds both.
+    """
+
+    def __init__(self, sizes, budget, shuffle=True, max_batch_size=0, pool=100, generator=None):
+        self.sizes = np.asarray(sizes)
+        self.budget = budget
+        self.shuffle = shuffle
+        self.max_batch_size = max_batch_size
+        self.pool = pool
+        self.generator = generator
+        # batches of the next epoch, planned early when __len__ is asked first
+        self._next = None
+
+    def _order(self):
+        if not self.shuffle:
+            return np.arange(len(self.sizes))
+        order = torch.randperm(len(self.sizes), generator=self.generator).numpy()
+        for start in range(0, len(order), self.pool):
+            pool = order[start:start + self.pool]
+            order[start:start + self.pool] = pool[np.argsort(self.sizes[pool], kind="stable")]
+        return order
+
+    def _plan(self):
+        batches = []
+        batch, total = [], 0
+        for index in self._order():
+            size = self.sizes[index]
+            if batch and (total + size > self.budget or len(batch) == self.max_batch_size):
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(int(index))
+            total += size
+        if batch:
+            batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=self.generator).tolist()]
+        return batches
+
+    def __len__(self):
+        if self._next is None:
+            self._next = self._plan()
+        return len(self._next)
+
+    def __iter__(self):
+        batches = self._next if self._next is not None else self._plan()
+        self._next = None
+        return iter(batches)
@@ -7,12 +7,9 @@ import torch
 import numba as nb
 from torch.utils import data
 from dataloader.dataset_semantickitti import register_dataset
-
-
-def cart2polar(input_xyz):
-    rho = np.sqrt(input_xyz[:, 0] ** 2 + input_xyz[:, 1] ** 2)
-    phi = np.arctan2(input_xyz[:, 1], input_xyz[:, 0])
-    return np.stack((rho, phi, input_xyz[:, 2]), axis=1)
+from dataloader.sample_batch import BatchCollate
+from dataloader.voxelizer import CylindricalVoxelizer, PointAugmentor, cart2polar
+from dataloader.instance_groups import rescale_instances
 
 
 def polar2cat(input_xyz_polar):
@@ -41,9 +38,17 @@ class cylinder_dataset_nuscenes(data.Dataset):
         max_rad=np.pi / 4,
         ds_sample=False,
         incre=None,
+        return_voxel_position=False,
+        sparse_label=False,
+        voxelize_on_device=False,
+        seed=None,
+        voxel_index=False,
+        feature_dtype="float32",
     ):
         "Initialization"
         self.point_cloud_dataset = in_dataset
+        self.return_voxel_position = return_voxel_position
+        self.sparse_label = sparse_label
         self.grid_size = np.asarray(grid_size)
         self.rotate_aug = rotate_aug
         self.flip_aug = flip_aug
@@ -56,6 +61,13 @@ class cylinder_dataset_nuscenes(data.Dataset):
         self.transform = transform_aug
         self.trans_std = trans_std
 
+        self.augmentor = PointAugmentor(rotate_aug, (-180, 180), flip_aug, scale_aug, transform_aug, trans_std, seed=seed)
+        self.voxelizer = CylindricalVoxelizer(grid_size, fixed_volume_space, max_volume_space, min_volume_space,
+                                              ignore_label, polar=True, sparse_label=sparse_label,
+                                              return_voxel_position=return_voxel_position,
+                                              raw_points=voxelize_on_device, return_voxel_index=voxel_index,
+                                              feature_dtype=feature_dtype)
+
         self.noise_rotation = np.random.uniform(min_rad, max_rad)
 
     def __len__(self):
@@ -65,6 +77,7 @@ class cylinder_dataset_nuscenes(data.Dataset):
         data = self.point_cloud_dataset[index]
         if len(data) == 2:
             xyz, labels = data
+            sig = None
         elif len(data) == 3:
             xyz, labels, sig = data
             if len(sig.shape) == 2:
@@ -72,86 +85,17 @@ class cylinder_dataset_nuscenes(data.Dataset):
         else:
             raise Exception("Return invalid data tuple")
 
-        # random data augmentation by rotation
-        if self.rotate_aug:
-            rotate_rad = np.deg2rad(np.random.random() * 360) - np.pi
-            c, s = np.cos(rotate_rad), np.sin(rotate_rad)
-            j = np.matrix([[c, s], [-s, c]])
-            xyz[:, :2] = np.dot(xyz[:, :2], j)
-
-        # random data augmentation by flip x , y or x+y
-        if self.flip_aug:
-            flip_type = np.random.choice(4, 1)
-            if flip_type == 1:
-                xyz[:, 0] = -xyz[:, 0]
-            elif flip_type == 2:
-                xyz[:, 1] = -xyz[:, 1]
-            elif flip_type == 3:
-                xyz[:, :2] = -xyz[:, :2]
-        if self.scale_aug:
-            noise_scale = np.random.uniform(0.95, 1.05)
-            xyz[:, 0] = noise_scale * xyz[:, 0]
-            xyz[:, 1] = noise_scale * xyz[:, 1]
-        # convert coordinate into polar coordinates
-
-        if self.transform:
-            noise_translate = np.array(
-                [
-                    np.random.normal(0, self.trans_std[0], 1),
-                    np.random.normal(0, self.trans_std[1], 1),
-                    np.random.normal(0, self.trans_std[2], 1),
-                ]
-            ).T
-
-            xyz[:, 0:3] += noise_translate
-
-        xyz_pol = cart2polar(xyz)
-
-        max_bound_r = np.percentile(xyz_pol[:, 0], 100, axis=0)
-        min_bound_r = np.percentile(xyz_pol[:, 0], 0, axis=0)
-        max_bound = np.max(xyz_pol[:, 1:], axis=0)
-        min_bound = np.min(xyz_pol[:, 1:], axis=0)
-        max_bound = np.concatenate(([max_bound_r], max_bound))
-        min_bound = np.concatenate(([min_bound_r], min_bound))
-        if self.fixed_volume_space:
-            max_bound = np.asarray(self.max_volume_space)
-            min_bound = np.asarray(self.min_volume_space)
-        # get grid index
-        crop_range = max_bound - min_bound
-        cur_grid_size = self.grid_size
-        intervals = crop_range / (cur_grid_size - 1)
-
-        if (intervals == 0).any():
-            print("Zero interval!")
-        grid_ind = (np.floor((np.clip(xyz_pol, min_bound, max_bound) - min_bound) / intervals)).astype(int)
-
-        voxel_position = np.zeros(self.grid_size, dtype=np.float32)
-        dim_array = np.ones(len(self.grid_size) + 1, int)
-        dim_array[0] = -1
-        voxel_position = np.indices(self.grid_size) * intervals.reshape(dim_array) + min_bound.reshape(dim_array)
-        voxel_position = polar2cat(voxel_position)
-
-        # process labels
-        processed_label = np.ones(self.grid_size, dtype=np.uint8) * self.ignore_label
-        label_voxel_pair = np.concatenate([grid_ind, labels], axis=1)
-        label_voxel_pair = label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
-        processed_label = nb_process_label(np.copy(processed_label), label_voxel_pair)
+        xyz = self.augmentor(xyz)
+        voxel_position, processed_label, grid_ind, return_fea = self.voxelizer(xyz, labels, sig)
+        labels = self.voxelizer.point_labels(labels)
         data_tuple = (voxel_position, processed_label)
 
-        # center data on each voxel for PTnet
-        voxel_centers = (grid_ind.astype(np.float32) + 0.5) * intervals + min_bound
-        return_xyz = xyz_pol - voxel_centers
-        return_xyz = np.concatenate((return_xyz, xyz_pol, xyz[:, :2]), axis=1)
-
-        if len(data) == 2:
-            return_fea = return_xyz
-        elif len(data) == 3:
-            return_fea = np.concatenate((return_xyz, sig[..., np.newaxis]), axis=1)
-
         if self.return_test:
             data_tuple += (grid_ind, labels, return_fea, index)
         else:
             data_tuple += (grid_ind, labels, return_fea)
+        if self.voxelizer.return_voxel_index:
+            data_tuple += (self.voxelizer.voxel_index(grid_ind),)
         return data_tuple
 
 
@@ -175,9 +119,17 @@ class cylinder_dataset_nuscenes_test(data.Dataset):
         max_rad=np.pi / 4,
         ds_sample=False,
         incre=None,
+        return_voxel_position=False,
+        sparse_label=False,
+        voxelize_on_device=False,
+        seed=None,
+        voxel_index=False,
+        feature_dtype="float32",
     ):
         "Initialization"
         self.point_cloud_dataset = in_dataset
+        self.return_voxel_position = return_voxel_position
+        self.sparse_label = sparse_label
         self.grid_size = np.asarray(grid_size)
         self.rotate_aug = rotate_aug
         self.flip_aug = flip_aug
@@ -190,6 +142,13 @@ class cylinder_dataset_nuscenes_test(data.Dataset):
         self.transform = transform_aug
         self.trans_std = trans_std
 
+        self.augmentor = PointAugmentor(rotate_aug, (-180, 180), flip_aug, scale_aug, transform_aug, trans_std, seed=seed)
+        self.voxelizer = CylindricalVoxelizer(grid_size, fixed_volume_space, max_volume_space, min_volume_space,
+                                              ignore_label, polar=True, sparse_label=sparse_label,
+                                              return_voxel_position=return_voxel_position,
+                                              raw_points=voxelize_on_device, return_voxel_index=voxel_index,
+                                              feature_dtype=feature_dtype)
+
         self.noise_rotation = np.random.uniform(min_rad, max_rad)
 
     def __len__(self):
@@ -199,6 +158,7 @@ class cylinder_dataset_nuscenes_test(data.Dataset):
         data, sd_token = self.point_cloud_dataset[index]
         if len(data) == 2:
             xyz, labels = data
+            sig = None
         elif len(data) == 3:
             xyz, labels, sig = data
             if len(sig.shape) == 2:
@@ -206,86 +166,17 @@ class cylinder_dataset_nuscenes_test(data.Dataset):
         else:
             raise Exception("Return invalid data tuple")
 
-        # random data augmentation by rotation
-        if self.rotate_aug:
-            rotate_rad = np.deg2rad(np.random.random() * 360) - np.pi
-            c, s = np.cos(rotate_rad), np.sin(rotate_rad)
-            j = np.matrix([[c, s], [-s, c]])
-            xyz[:, :2] = np.dot(xyz[:, :2], j)
-
-        # random data augmentation by flip x , y or x+y
-        if self.flip_aug:
-            flip_type = np.random.choice(4, 1)
-            if flip_type == 1:
-                xyz[:, 0] = -xyz[:, 0]
-            elif flip_type == 2:
-                xyz[:, 1] = -xyz[:, 1]
-            elif flip_type == 3:
-                xyz[:, :2] = -xyz[:, :2]
-        if self.scale_aug:
-            noise_scale = np.random.uniform(0.95, 1.05)
-            xyz[:, 0] = noise_scale * xyz[:, 0]
-            xyz[:, 1] = noise_scale * xyz[:, 1]
-        # convert coordinate into polar coordinates
-
-        if self.transform:
-            noise_translate = np.array(
-                [
-                    np.random.normal(0, self.trans_std[0], 1),
-                    np.random.normal(0, self.trans_std[1], 1),
-                    np.random.normal(0, self.trans_std[2], 1),
-                ]
-            ).T
-
-            xyz[:, 0:3] += noise_translate
-
-        xyz_pol = cart2polar(xyz)
-
-        max_bound_r = np.percentile(xyz_pol[:, 0], 100, axis=0)
-        min_bound_r = np.percentile(xyz_pol[:, 0], 0, axis=0)
-        max_bound = np.max(xyz_pol[:, 1:], axis=0)
-        min_bound = np.min(xyz_pol[:, 1:], axis=0)
-        max_bound = np.concatenate(([max_bound_r], max_bound))
-        min_bound = np.concatenate(([min_bound_r], min_bound))
-        if self.fixed_volume_space:
-            max_bound = np.asarray(self.max_volume_space)
-            min_bound = np.asarray(self.min_volume_space)
-        # get grid index
-        crop_range = max_bound - min_bound
-        cur_grid_size = self.grid_size
-        intervals = crop_range / (cur_grid_size - 1)
-
-        if (intervals == 0).any():
-            print("Zero interval!")
-        grid_ind = (np.floor((np.clip(xyz_pol, min_bound, max_bound) - min_bound) / intervals)).astype(int)
-
-        voxel_position = np.zeros(self.grid_size, dtype=np.float32)
-        dim_array = np.ones(len(self.grid_size) + 1, int)
-        dim_array[0] = -1
-        voxel_position = np.indices(self.grid_size) * intervals.reshape(dim_array) + min_bound.reshape(dim_array)
-        voxel_position = polar2cat(voxel_position)
-
-        # process labels
-        processed_label = np.ones(self.grid_size, dtype=np.uint8) * self.ignore_label
-        label_voxel_pair = np.concatenate([grid_ind, labels], axis=1)
-        label_voxel_pair = label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
-        processed_label = nb_process_label(np.copy(processed_label), label_voxel_pair)
+        xyz = self.augmentor(xyz)
+        voxel_position, processed_label, grid_ind, return_fea = self.voxelizer(xyz, labels, sig)
+        labels = self.voxelizer.point_labels(labels)
         data_tuple = (voxel_position, processed_label)
 
-        # center data on each voxel for PTnet
-        voxel_centers = (grid_ind.astype(np.float32) + 0.5) * intervals + min_bound
-        return_xyz = xyz_pol - voxel_centers
-        return_xyz = np.concatenate((return_xyz, xyz_pol, xyz[:, :2]), axis=1)
-
-        if len(data) == 2:
-            return_fea = return_xyz
-        elif len(data) == 3:
-            return_fea = np.concatenate((return_xyz, sig[..., np.newaxis]), axis=1)
-
         if self.return_test:
             data_tuple += (grid_ind, labels, return_fea, sd_token)
         else:
             data_tuple += (grid_ind, labels, return_fea)
+        if self.voxelizer.return_voxel_index:
+            data_tuple += (self.voxelizer.voxel_index(grid_ind),)
         return data_tuple
 
 
@@ -309,9 +200,17 @@ class cylinder_dataset_nuscenes_panop(data.Dataset):
         max_rad=np.pi / 4,
         ds_sample=False,
         incre=None,
+        return_voxel_position=False,
+        sparse_label=False,
+        voxelize_on_device=False,
+        seed=None,
+        voxel_index=False,
+        feature_dtype="float32",
     ):
         "Initialization"
         self.point_cloud_dataset = in_dataset
+        self.return_voxel_position = return_voxel_position
+        self.sparse_label = sparse_label
         self.grid_size = np.asarray(grid_size)
         self.rotate_aug = rotate_aug
         self.flip_aug = flip_aug
@@ -325,6 +224,13 @@ class cylinder_dataset_nuscenes_panop(data.Dataset):
         self.trans_std = trans_std
         self.ds_sample = ds_sample
 
+        self.augmentor = PointAugmentor(rotate_aug, (-180, 180), flip_aug, scale_aug, transform_aug, trans_std, seed=seed)
+        self.voxelizer = CylindricalVoxelizer(grid_size, fixed_volume_space, max_volume_space, min_volume_space,
+                                              ignore_label, polar=True, sparse_label=sparse_label,
+                                              return_voxel_position=return_voxel_position,
+                                              raw_points=voxelize_on_device, return_voxel_index=voxel_index,
+                                              feature_dtype=feature_dtype)
+
         self.noise_rotation = np.random.uniform(min_rad, max_rad)
 
     def __len__(self):
@@ -334,6 +240,7 @@ class cylinder_dataset_nuscenes_panop(data.Dataset):
         data = self.point_cloud_dataset[index]
         if len(data) == 3:
             xyz, labels, instances = data
+            sig = None
         elif len(data) == 4:
             xyz, labels, instances, sig = data
             if len(sig.shape) == 2:
@@ -343,106 +250,22 @@ class cylinder_dataset_nuscenes_panop(data.Dataset):
 
         if self.ds_sample:
             minimum_pts_thre = 300
-            instances = instances.squeeze()
-            cls, cnt = np.unique(instances, return_counts=True)
-            inst_basic_idx = cls[cnt >= minimum_pts_thre][1:]
             unknown_clss = [1, 5, 8, 9]
-            for instance_idx in inst_basic_idx:
-                rnd = np.random.rand()
-                if rnd > 0.5 or labels[instances == instance_idx][0] in unknown_clss:
-                    continue
-
-                obj_ins = xyz[instances == instance_idx]
-                obj_ins_center = np.mean(obj_ins, axis=0)
-                obj_ins = obj_ins - obj_ins_center
-                scale_ds_large = np.random.rand() * 1.5 + 1.5
-                scale_ds_small = np.random.rand() * 0.25 + 0.25
-                rnd = np.random.rand()
-                scale_ds = scale_ds_large if rnd > 0.5 else scale_ds_small
-                obj_ins = obj_ins * scale_ds + obj_ins_center
-                xyz[instances == instance_idx] = obj_ins
-                labels[instances == instance_idx] = 17
-
-        # random data augmentation by rotation
-        if self.rotate_aug:
-            rotate_rad = np.deg2rad(np.random.random() * 360) - np.pi
-            c, s = np.cos(rotate_rad), np.sin(rotate_rad)
-            j = np.matrix([[c, s], [-s, c]])
-            xyz[:, :2] = np.dot(xyz[:, :2], j)
-
-        # random data augmentation by flip x , y or x+y
-        if self.flip_aug:
-            flip_type = np.random.choice(4, 1)
-            if flip_type == 1:
-                xyz[:, 0] = -xyz[:, 0]
-            elif flip_type == 2:
-                xyz[:, 1] = -xyz[:, 1]
-            elif flip_type == 3:
-                xyz[:, :2] = -xyz[:, :2]
-        if self.scale_aug:
-            noise_scale = np.random.uniform(0.95, 1.05)
-            xyz[:, 0] = noise_scale * xyz[:, 0]
-            xyz[:, 1] = noise_scale * xyz[:, 1]
-        # convert coordinate into polar coordinates
-
-        if self.transform:
-            noise_translate = np.array(
-                [
-                    np.random.normal(0, self.trans_std[0], 1),
-                    np.random.normal(0, self.trans_std[1], 1),
-                    np.random.normal(0, self.trans_std[2], 1),
-                ]
-            ).T
-
-            xyz[:, 0:3] += noise_translate
-
-        xyz_pol = cart2polar(xyz)
-
-        max_bound_r = np.percentile(xyz_pol[:, 0], 100, axis=0)
-        min_bound_r = np.percentile(xyz_pol[:, 0], 0, axis=0)
-        max_bound = np.max(xyz_pol[:, 1:], axis=0)
-        min_bound = np.min(xyz_pol[:, 1:], axis=0)
-        max_bound = np.concatenate(([max_bound_r], max_bound))
-        min_bound = np.concatenate(([min_bound_r], min_bound))
-        if self.fixed_volume_space:
-            max_bound = np.asarray(self.max_volume_space)
-            min_bound = np.asarray(self.min_volume_space)
-        # get grid index
-        crop_range = max_bound - min_bound
-        cur_grid_size = self.grid_size
-        intervals = crop_range / (cur_grid_size - 1)
-
-        if (intervals == 0).any():
-            print("Zero interval!")
-        grid_ind = (np.floor((np.clip(xyz_pol, min_bound, max_bound) - min_bound) / intervals)).astype(int)
-
-        voxel_position = np.zeros(self.grid_size, dtype=np.float32)
-        dim_array = np.ones(len(self.grid_size) + 1, int)
-        dim_array[0] = -1
-        voxel_position = np.indices(self.grid_size) * intervals.reshape(dim_array) + min_bound.reshape(dim_array)
-        voxel_position = polar2cat(voxel_position)
-
-        # process labels
-        processed_label = np.ones(self.grid_size, dtype=np.uint8) * self.ignore_label
-        label_voxel_pair = np.concatenate([grid_ind, labels], axis=1)
-        label_voxel_pair = label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
-        processed_label = nb_process_label(np.copy(processed_label), label_voxel_pair)
-        data_tuple = (voxel_position, processed_label)
-
-        # center data on each voxel for PTnet
-        voxel_centers = (grid_ind.astype(np.float32) + 0.5) * intervals + min_bound
-        return_xyz = xyz_pol - voxel_centers
-        return_xyz = np.concatenate((return_xyz, xyz_pol, xyz[:, :2]), axis=1)
+            rescale_instances(xyz, labels, instances, self.augmentor.rng, prob=0.5,
+                              keep=lambda label: ~np.isin(label, unknown_clss), new_label=17,
+                              minimum_pts_thre=minimum_pts_thre)
 
-        if len(data) == 3:
-            return_fea = return_xyz
-        elif len(data) == 4:
-            return_fea = np.concatenate((return_xyz, sig[..., np.newaxis]), axis=1)
+        xyz = self.augmentor(xyz)
+        voxel_position, processed_label, grid_ind, return_fea = self.voxelizer(xyz, labels, sig)
+        labels = self.voxelizer.point_labels(labels)
+        data_tuple = (voxel_position, processed_label)
 
         if self.return_test:
             data_tuple += (grid_ind, labels, return_fea, index)
         else:
             data_tuple += (grid_ind, labels, return_fea)
+        if self.voxelizer.return_voxel_index:
+            data_tuple += (self.voxelizer.voxel_index(grid_ind),)
         return data_tuple
 
 
@@ -466,9 +289,17 @@ class cylinder_dataset_nuscenes_panop_incre(data.Dataset):
         max_rad=np.pi / 4,
         ds_sample=False,
         incre=None,
+        return_voxel_position=False,
+        sparse_label=False,
+        voxelize_on_device=False,
+        seed=None,
+        voxel_index=False,
+        feature_dtype="float32",
     ):
         "Initialization"
         self.point_cloud_dataset = in_dataset
+        self.return_voxel_position = return_voxel_position
+        self.sparse_label = sparse_label
         self.grid_size = np.asarray(grid_size)
         self.rotate_aug = rotate_aug
         self.flip_aug = flip_aug
@@ -483,6 +314,13 @@ class cylinder_dataset_nuscenes_panop_incre(data.Dataset):
         self.ds_sample = ds_sample
         self.incre = incre
 
+        self.augmentor = PointAugmentor(rotate_aug, (-180, 180), flip_aug, scale_aug, transform_aug, trans_std, seed=seed)
+        self.voxelizer = CylindricalVoxelizer(grid_size, fixed_volume_space, max_volume_space, min_volume_space,
+                                              ignore_label, polar=True, sparse_label=sparse_label,
+                                              return_voxel_position=return_voxel_position,
+                                              raw_points=voxelize_on_device, return_voxel_index=voxel_index,
+                                              feature_dtype=feature_dtype)
+
         self.noise_rotation = np.random.uniform(min_rad, max_rad)
 
     def __len__(self):
@@ -492,6 +330,7 @@ class cylinder_dataset_nuscenes_panop_incre(data.Dataset):
         data = self.point_cloud_dataset[index]
         if len(data) == 4:
             xyz, labels, instances, dis_labels = data
+            sig = None
         elif len(data) == 5:
             xyz, labels, instances, dis_labels, sig = data
             if len(sig.shape) == 2:
@@ -501,113 +340,26 @@ class cylinder_dataset_nuscenes_panop_incre(data.Dataset):
 
         if self.ds_sample:
             minimum_pts_thre = 300
-            instances = instances.squeeze()
-            cls, cnt = np.unique(instances, return_counts=True)
-            inst_basic_idx = cls[cnt >= minimum_pts_thre][1:]
             unknown_clss = [1, 5, 8, 9]
-            for instance_idx in inst_basic_idx:
-                rnd = np.random.rand()
-                if rnd > 0.2 or labels[instances == instance_idx][0] != self.incre:
-                    continue
-
-                obj_ins = xyz[instances == instance_idx]
-                obj_ins_center = np.mean(obj_ins, axis=0)
-                obj_ins = obj_ins - obj_ins_center
-                scale_ds_large = np.random.rand() * 1.5 + 1.5
-                scale_ds_small = np.random.rand() * 0.25 + 0.25
-                rnd = np.random.rand()
-                scale_ds = scale_ds_large if rnd > 0.5 else scale_ds_small
-                obj_ins = obj_ins * scale_ds + obj_ins_center
-                xyz[instances == instance_idx] = obj_ins
-                labels[instances == instance_idx] = 17
-
-        # random data augmentation by rotation
-        if self.rotate_aug:
-            rotate_rad = np.deg2rad(np.random.random() * 360) - np.pi
-            c, s = np.cos(rotate_rad), np.sin(rotate_rad)
-            j = np.matrix([[c, s], [-s, c]])
-            xyz[:, :2] = np.dot(xyz[:, :2], j)
-
-        # random data augmentation by flip x , y or x+y
-        if self.flip_aug:
-            flip_type = np.random.choice(4, 1)
-            if flip_type == 1:
-                xyz[:, 0] = -xyz[:, 0]
-            elif flip_type == 2:
-                xyz[:, 1] = -xyz[:, 1]
-            elif flip_type == 3:
-                xyz[:, :2] = -xyz[:, :2]
-        if self.scale_aug:
-            noise_scale = np.random.uniform(0.95, 1.05)
-            xyz[:, 0] = noise_scale * xyz[:, 0]
-            xyz[:, 1] = noise_scale * xyz[:, 1]
-        # convert coordinate into polar coordinates
-
-        if self.transform:
-            noise_translate = np.array(
-                [
-                    np.random.normal(0, self.trans_std[0], 1),
-                    np.random.normal(0, self.trans_std[1], 1),
-                    np.random.normal(0, self.trans_std[2], 1),
-                ]
-            ).T
-
-            xyz[:, 0:3] += noise_translate
-
-        xyz_pol = cart2polar(xyz)
-
-        max_bound_r = np.percentile(xyz_pol[:, 0], 100, axis=0)
-        min_bound_r = np.percentile(xyz_pol[:, 0], 0, axis=0)
-        max_bound = np.max(xyz_pol[:, 1:], axis=0)
-        min_bound = np.min(xyz_pol[:, 1:], axis=0)
-        max_bound = np.concatenate(([max_bound_r], max_bound))
-        min_bound = np.concatenate(([min_bound_r], min_bound))
-        if self.fixed_volume_space:
-            max_bound = np.asarray(self.max_volume_space)
-            min_bound = np.asarray(self.min_volume_space)
-        # get grid index
-        crop_range = max_bound - min_bound
-        cur_grid_size = self.grid_size
-        intervals = crop_range / (cur_grid_size - 1)
-
-        if (intervals == 0).any():
-            print("Zero interval!")
-        grid_ind = (np.floor((np.clip(xyz_pol, min_bound, max_bound) - min_bound) / intervals)).astype(int)
-
-        voxel_position = np.zeros(self.grid_size, dtype=np.float32)
-        dim_array = np.ones(len(self.grid_size) + 1, int)
-        dim_array[0] = -1
-        voxel_position = np.indices(self.grid_size) * intervals.reshape(dim_array) + min_bound.reshape(dim_array)
-        voxel_position = polar2cat(voxel_position)
-
-        # process labels
-        processed_label = np.ones(self.grid_size, dtype=np.uint8) * self.ignore_label
-        label_voxel_pair = np.concatenate([grid_ind, labels], axis=1)
-        label_voxel_pair = label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
-        processed_label = nb_process_label(np.copy(processed_label), label_voxel_pair)
+            rescale_instances(xyz, labels, instances, self.augmentor.rng, prob=0.2,
+                              keep=lambda label: label == self.incre, new_label=17,
+                              minimum_pts_thre=minimum_pts_thre)
+
+        xyz = self.augmentor(xyz)
+        voxel_position, processed_label, grid_ind, return_fea = self.voxelizer(xyz, labels, sig)
+        labels = self.voxelizer.point_labels(labels)
         data_tuple = (voxel_position, processed_label)
 
         # process distillation labels
         if self.return_test == False:
-            processed_dis_label = np.ones(self.grid_size, dtype=np.uint8) * self.ignore_label
-            dis_label_voxel_pair = np.concatenate([grid_ind, dis_labels], axis=1)
-            dis_label_voxel_pair = dis_label_voxel_pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
-            processed_dis_label = nb_process_label(np.copy(processed_dis_label), dis_label_voxel_pair)
-
-        # center data on each voxel for PTnet
-        voxel_centers = (grid_ind.astype(np.float32) + 0.5) * intervals + min_bound
-        return_xyz = xyz_pol - voxel_centers
-        return_xyz = np.concatenate((return_xyz, xyz_pol, xyz[:, :2]), axis=1)
-
-        if len(data) == 4:
-            return_fea = return_xyz
-        elif len(data) == 5:
-            return_fea = np.concatenate((return_xyz, sig[..., np.newaxis]), axis=1)
+            processed_dis_label = self.voxelizer.voxel_label(grid_ind, dis_labels)
 
         if self.return_test:
             data_tuple += (grid_ind, labels, return_fea, index)
         else:
             data_tuple += (grid_ind, labels, return_fea, processed_dis_label)
+        if self.voxelizer.return_voxel_index:
+            data_tuple += (self.voxelizer.voxel_index(grid_ind),)
         return data_tuple
 
 
@@ -628,21 +380,7 @@ def nb_process_label(processed_label, sorted_label_voxel_pair):
     return processed_label
 
 
-def collate_fn_BEV(data):
-    data2stack = np.stack([d[0] for d in data]).astype(np.float32)
-    label2stack = np.stack([d[1] for d in data]).astype(int)
-    grid_ind_stack = [d[2] for d in data]
-    point_label = [d[3] for d in data]
-    xyz = [d[4] for d in data]
-    dis_labels = np.stack([d[5] for d in data]).astype(int)
-    return (
-        torch.from_numpy(data2stack),
-        torch.from_numpy(label2stack),
-        grid_ind_stack,
-        point_label,
-        xyz,
-        torch.from_numpy(dis_labels),
-    )
+collate_fn_BEV = BatchCollate(extra="dis_labels")
 
 
 # SemKITTI_label_name = {0: 'noise',
@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-
+# @file: file_manifest.py
+
+"""
+Persistent cache of dataset file listings.
+
+A manifest stores the file list of a dataset together with the mtime of every
+directory that was listed to build it. Adding or removing a file changes the
+mtime of its directory, so a manifest is reused as long as all recorded mtimes
+still match and rebuilt otherwise. Manifests live under MANIFEST_CACHE_DIR
+(~/.cache/cylinder3d/manifests unless overridden by the environment variable of
+the same name, an empty value turns caching off).
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_VERSION = 1
+MANIFEST_CACHE_DIR = os.environ.get(
+    "MANIFEST_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "cylinder3d", "manifests"))
+SCAN_WORKERS = 16
+
+
+def dir_mtime(path):
+    """mtime in ns of a directory, None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _manifest_path(kind, key, cache_dir):
+    digest = hashlib.sha1(json.dumps([MANIFEST_VERSION, kind, key]).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, "%s-%s.json" % (kind, digest))
+
+
+def _load(path, key):
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("key") != key:
+        return None
+    for directory, mtime in manifest["dirs"].items():
+        if dir_mtime(directory) != mtime:
+            return None
+    return manifest["payload"]
+
+
+def _save(path, key, dirs, payload):
+    manifest = {"version": MANIFEST_VERSION, "key": key, "dirs": dirs, "payload": payload}
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        # several workers or jobs may build the same manifest, the last rename wins
+        os.replace(tmp, path)
+    except OSError as e:
+        print("could not write file manifest %s: %s" % (path, e))
+
+
+def cached_manifest(kind, key, build, cache_dir=None):
+    """
+    return build()'s payload, from the cache when it is still valid.
+
+    kind: short name used in the file name, e.g. "files" or "anovox"
+    key: json-serializable description of what is listed (roots, filters, ...)
+    build: callable returning (payload, dirs), dirs maps every directory that
+           was listed to dir_mtime() taken before listing it
+    """
+    cache_dir = MANIFEST_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return build()[0]
+    path = _manifest_path(kind, key, cache_dir)
+    payload = _load(path, key)
+    if payload is None:
+        payload, dirs = build()
+        _save(path, key, dirs, payload)
+    return payload
+
+
+def _scan_one(directory):
+    mtime = dir_mtime(directory)
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                else:
+                    files.append(entry.name)
+    except OSError:
+        pass
+    return mtime, sorted(files), sorted(subdirs)
+
+
+def scan_files(roots, contains=None, workers=SCAN_WORKERS):
+    """
+    list the files below roots with os.scandir, one thread per directory.
+
+    Returns (files, dirs): absolute paths in top-down walk order with file names
+    sorted per directory as in absoluteFilePaths (subdirectories are visited in
+    name order, so the result does not depend on the file system), and the
+    mtime of every directory visited.
+    """
+    roots = [os.path.abspath(os.path.expanduser(root)) for root in roots]
+    listed, level = {}, list(roots)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # breadth first so all directories of one level, across roots, are listed concurrently
+        while level:
+            for directory, result in zip(level, pool.map(_scan_one, level)):
+                listed[directory] = result
+            level = [d for directory in level for d in listed[directory][2] if d not in listed]
+
+    files = []
+    for root in roots:
+        # flatten back into top-down walk order
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            files += [os.path.join(directory, f) for f in listed[directory][1] if contains is None or contains in f]
+            stack.extend(reversed(listed[directory][2]))
+    return files, {directory: result[0] for directory, result in listed.items()}
+
+
+def list_files(roots, contains=None, cache_dir=None):
+    """cached, sorted-per-directory absolute file paths below one directory or a list of them"""
+    if isinstance(roots, str):
+        roots = [roots]
+    roots = [os.path.abspath(os.path.expanduser(r)) for r in roots]
+    return cached_manifest("files", {"roots": roots, "contains": contains},
+                           lambda: scan_files(roots, contains), cache_dir)
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+# @file: instance_groups.py
+
+"""
+Per-instance segment operations for the ds_sample augmentation of the
+panoptic dataset wrappers.
+
+The points are argsorted by instance id once. Every instance is then a
+contiguous slice [start, start + count) of that order, and the centroids,
+scales and relabelling of all instances run as segment operations, instead
+of one `instances == instance_idx` mask over the whole scan per instance.
+"""
+
+import numpy as np
+
+
+class InstanceGroups(object):
+    """
+    points grouped by instance id.
+
+    order: (N,) stable argsort of the ids, ids / starts / counts: (G,) id,
+    first position in order and number of points of every instance
+    """
+
+    def __init__(self, instances):
+        instances = np.asarray(instances).reshape(-1)
+        # stable, so the first point of a slice is the first point of the instance in the scan
+        self.order = np.argsort(instances, kind="stable")
+        sorted_ids = instances[self.order]
+        boundary = np.ones(len(sorted_ids), dtype=bool)
+        boundary[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        self.starts = np.flatnonzero(boundary)
+        self.ids = sorted_ids[self.starts]
+        self.counts = np.diff(np.append(self.starts, len(sorted_ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def first(self, values):
+        """(G,) value of the first point of every instance"""
+        return np.asarray(values).reshape(len(self.order), -1)[self.order[self.starts], 0]
+
+    def members(self, selected):
+        """indices of the points of the selected instances ((G,) bool mask), one slice after the other"""
+        return self.order[np.repeat(selected, self.counts)]
+
+
+def rescale_instances(xyz, labels, instances, rng, prob, keep, new_label, minimum_pts_thre=300):
+    """
+    scale instances with at least minimum_pts_thre points around their
+    centroid, by [1.5, 3) or [0.25, 0.5) with equal odds, and relabel their
+    points to new_label. The first qualifying instance (the unlabelled points
+    when there are enough of them) is never picked, every other one with
+    probability prob when keep(label) is true for the label of its first point.
+
+    xyz and labels are changed in place.
+    """
+    groups = InstanceGroups(instances)
+    candidates = groups.counts >= minimum_pts_thre
+    candidates[np.flatnonzero(candidates)[:1]] = False
+
+    num = len(groups)
+    selected = candidates & (rng.random(num) <= prob) & keep(groups.first(labels))
+    if not selected.any():
+        return
+
+    scale_ds_large = rng.random(num) * 1.5 + 1.5
+    scale_ds_small = rng.random(num) * 0.25 + 0.25
+    scale_ds = np.where(rng.random(num) > 0.5, scale_ds_large, scale_ds_small)
+
+    # segment sums over the slices of the selected instances
+    points = groups.members(selected)
+    counts = groups.counts[selected]
+    obj_ins = np.asarray(xyz[points], dtype=np.float64)
+    obj_ins_center = np.add.reduceat(obj_ins, np.cumsum(counts) - counts, axis=0) / counts[:, None]
+    obj_ins_center = np.repeat(obj_ins_center, counts, axis=0)
+    scale = np.repeat(scale_ds[selected], counts)[:, None]
+    xyz[points] = (obj_ins - obj_ins_center) * scale + obj_ins_center
+    labels[points] = new_label
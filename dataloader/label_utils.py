@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+# @file: label_utils.py
+
+import numpy as np
+import yaml
+
+
+def pack_rgb(rgb):
+    """pack an (N, 3) uint8 color array into (N,) 24-bit integer keys"""
+    rgb = np.asarray(rgb).reshape(-1, 3).astype(np.uint32)
+    return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+
+class AnoVoxColorDecoder(object):
+    """
+    Decode AnoVox semantic colors into training labels.
+
+    The chain color -> AnoVox id -> to_SemKITTI -> learning_map is folded into a
+    single dense lookup table indexed by the packed 24-bit RGB key, so decoding a
+    scan is one gather instead of a palette search per point.
+
+    unknown: "raise" raises a ValueError on colors missing from the palette,
+             "ignore" maps them to unknown_label.
+    """
+
+    UNKNOWN = 255
+
+    def __init__(self, color_map, to_semkitti, learning_map, unknown="raise", unknown_label=0):
+        if unknown not in ("raise", "ignore"):
+            raise ValueError("unknown must be 'raise' or 'ignore', got %r" % unknown)
+        self.unknown = unknown
+        self.unknown_label = unknown_label
+
+        palette = np.asarray(color_map, dtype=np.uint8).reshape(-1, 3)
+        fused = np.array([learning_map[to_semkitti[i]] for i in range(len(palette))], dtype=np.int64)
+        if (fused == self.UNKNOWN).any() or fused.max() > 255 or fused.min() < 0:
+            raise ValueError("learning_map values must lie in [0, 254] to fit the color table")
+
+        # the legacy decoder took the first palette entry matching a color, keep that for duplicates
+        keys = pack_rgb(palette)
+        _, first = np.unique(keys, return_index=True)
+        self.lut = np.full(1 << 24, self.UNKNOWN, dtype=np.uint8)
+        self.lut[keys[first]] = fused[first]
+
+    @classmethod
+    def from_yaml(cls, anovox_yaml, **kwargs):
+        return cls(anovox_yaml["color_map"], anovox_yaml["to_SemKITTI"], anovox_yaml["learning_map"], **kwargs)
+
+    def __call__(self, rgb):
+        """rgb: (N, 3) uint8 colors. Returns (N,) uint8 training labels."""
+        keys = pack_rgb(rgb)
+        labels = self.lut[keys]
+        unknown = labels == self.UNKNOWN
+        if unknown.any():
+            if self.unknown == "raise":
+                bad = np.unique(keys[unknown])
+                bad = [((k >> 16) & 255, (k >> 8) & 255, k & 255) for k in bad[:5].tolist()]
+                raise ValueError("%d points have colors outside the AnoVox palette, e.g. %s" % (unknown.sum(), bad))
+            labels[unknown] = self.unknown_label
+        return labels
+
+
+def lut_sentinel(dtype):
+    """value dense_lut gives unmapped keys, the largest value of dtype"""
+    return np.iinfo(dtype).max
+
+
+def dense_lut(mapping, dtype):
+    """turn an {int: int} label mapping into a dense array indexed by key, unmapped keys give lut_sentinel(dtype)"""
+    sentinel = lut_sentinel(dtype)
+    values = np.asarray(list(mapping.values()), dtype=np.int64)
+    if values.size and (values.min() < 0 or values.max() >= sentinel):
+        raise ValueError("label mapping values must lie in [0, %d] to fit a %s table" % (sentinel - 1, np.dtype(dtype)))
+    lut = np.full(max(mapping.keys()) + 1, sentinel, dtype=dtype)
+    lut[list(mapping.keys())] = values
+    return lut
+
+
+class LabelRemapper(object):
+    """
+    Dense lookup tables for a label-mapping yaml.
+
+    Forward (learning_map) and inverse (learning_map_inv) remaps are single
+    fancy-indexing operations with the output dtype fixed at construction:
+    uint8 for training labels, uint32 for the .label files written on export.
+    Labels missing from the mapping raise a KeyError.
+    """
+
+    def __init__(self, learning_map, learning_map_inv=None, dtype=np.uint8, inv_dtype=np.uint32):
+        self.lut = dense_lut(learning_map, dtype)
+        self.inv_lut = dense_lut(learning_map_inv, inv_dtype) if learning_map_inv is not None else None
+
+    @classmethod
+    def from_yaml(cls, label_yaml, **kwargs):
+        """label_yaml: path to a label-mapping yaml or its already loaded dict"""
+        if isinstance(label_yaml, str):
+            with open(label_yaml, "r") as stream:
+                label_yaml = yaml.safe_load(stream)
+        return cls(label_yaml["learning_map"], label_yaml.get("learning_map_inv"), **kwargs)
+
+    @staticmethod
+    def _remap(lut, labels):
+        labels = np.asarray(labels)
+        if labels.size and labels.max() >= len(lut):
+            raise KeyError("label %d is not in the label mapping" % labels.max())
+        remapped = lut[labels]
+        missing = remapped == lut_sentinel(lut.dtype)
+        if missing.any():
+            raise KeyError("labels %s are not in the label mapping" % np.unique(labels[missing]).tolist())
+        return remapped
+
+    def __call__(self, labels):
+        return self._remap(self.lut, labels)
+
+    def inverse(self, labels):
+        if self.inv_lut is None:
+            raise KeyError("label mapping has no learning_map_inv")
+        return self._remap(self.inv_lut, labels)
@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+# @file: loader_profile.py
+
+"""
+DataLoader settings of train_data_loader / val_data_loader beyond num_workers.
+
+The training scripts iterate the val loader for every eval pass. Without
+persistent_workers each pass forks new workers, which import the dataset
+modules again and load the numba kernels from their cache before the first
+sample. The profile is
+
+    persistent_workers: keep the workers alive between passes (default False)
+    prefetch_factor:    batches loaded in advance per worker (default 2)
+    pin_memory:         pin the batches for non-blocking copies (default False)
+    cpu_affinity:       CPUs the workers are spread over, e.g. "0-7,16-23",
+                        "all" for the CPUs of the main process, "" leaves it
+    worker_threads:     numba / BLAS / torch threads per worker, 0 leaves it
+
+tools/autotune_loader.py measures samples/s over a grid of these settings
+and writes the fastest to the config.
+"""
+
+import os
+import torch
+
+PROFILE_KEYS = ("num_workers", "persistent_workers", "prefetch_factor", "pin_memory", "cpu_affinity", "worker_threads")
+
+_THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+def parse_cpus(cpu_affinity):
+    """sorted CPU ids of a cpu_affinity string, None when it is empty"""
+    if not cpu_affinity:
+        return None
+    if cpu_affinity == "all":
+        return sorted(os.sched_getaffinity(0))
+    cpus = set()
+    for part in cpu_affinity.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+class WorkerInit(object):
+    """
+    worker_init_fn that pins every worker to its share of cpus and caps its
+    thread pools at num_threads
+    """
+
+    def __init__(self, cpus=None, num_threads=0):
+        self.cpus = cpus
+        self.num_threads = num_threads
+
+    def __call__(self, worker_id):
+        if self.cpus:
+            num_workers = torch.utils.data.get_worker_info().num_workers
+            # contiguous blocks, workers share CPUs when there are fewer CPUs than workers
+            share = self.cpus[worker_id * len(self.cpus) // num_workers:(worker_id + 1) * len(self.cpus) // num_workers]
+            os.sched_setaffinity(0, share or [self.cpus[worker_id % len(self.cpus)]])
+        if self.num_threads > 0:
+            for name in _THREAD_VARIABLES:
+                os.environ[name] = str(self.num_threads)
+            torch.set_num_threads(self.num_threads)
+            try:
+                import numba
+                numba.set_num_threads(min(self.num_threads, numba.config.NUMBA_NUM_THREADS))
+            except ImportError:
+                pass
+            try:
+                # BLAS pools that already started ignore the environment
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(self.num_threads)
+            except ImportError:
+                pass
+
+
+def loader_kwargs(loader_config):
+    """DataLoader keyword arguments of the profile in loader_config"""
+    kwargs = {"num_workers": loader_config["num_workers"],
+              "pin_memory": loader_config.get("pin_memory", False)}
+    if kwargs["num_workers"] == 0:
+        # the remaining settings only apply to worker processes
+        return kwargs
+    kwargs["persistent_workers"] = loader_config.get("persistent_workers", False)
+    kwargs["prefetch_factor"] = loader_config.get("prefetch_factor", 2)
+    cpus = parse_cpus(loader_config.get("cpu_affinity", ""))
+    num_threads = loader_config.get("worker_threads", 0)
+    if cpus or num_threads > 0:
+        kwargs["worker_init_fn"] = WorkerInit(cpus, num_threads)
+    return kwargs
@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+# @file: nusc_index.py
+
+"""
+Offline nuScenes sample index.
+
+For every entry of a nuscenes_infos_*.pkl the index stores, as fixed-width
+byte-string columns in one .npz next to the pkl:
+
+    sample_token     sample token of the info entry
+    lidar_sd_token   LIDAR_TOP sample-data token
+    lidar_path       point cloud path relative to the dataroot
+    lidarseg_path    lidarseg label path relative to the dataroot ("" if absent)
+    panoptic_path    panoptic label path relative to the dataroot ("" if absent)
+
+With the index the nuScenes pc_datasets neither build a NuScenes object nor
+ship it (or the infos) to DataLoader workers. Build it with
+tools/build_nusc_index.py.
+"""
+
+import os
+import pickle
+import numpy as np
+
+NUSC_INDEX_VERSION = 1
+COLUMNS = ("sample_token", "lidar_sd_token", "lidar_path", "lidarseg_path", "panoptic_path")
+
+
+def nusc_index_path(infos_path):
+    return os.path.splitext(infos_path)[0] + "_index.npz"
+
+
+def has_nusc_index(infos_path):
+    """whether an up-to-date index of infos_path was saved, see NuscSampleIndex.for_infos"""
+    index_path = nusc_index_path(infos_path)
+    if not os.path.isfile(index_path):
+        return False
+    try:
+        with np.load(index_path, allow_pickle=False) as f:
+            # members of an npz are read on access, the columns are not loaded
+            return (int(f["version"]) == NUSC_INDEX_VERSION
+                    and int(f["source_size"]) == os.path.getsize(infos_path))
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def _label_filename(nusc, table, sd_token):
+    # lidarseg / panoptic tables are only loaded when their folders exist in the dataroot,
+    # NuScenes.get asserts that the table is loaded
+    if table not in getattr(nusc, "table_names", ()):
+        return ""
+    try:
+        return nusc.get(table, sd_token)["filename"]
+    except KeyError:
+        return ""
+
+
+class NuscSampleIndex(object):
+    def __init__(self, columns, source_size=-1):
+        self.columns = columns
+        self.source_size = source_size
+
+    def __len__(self):
+        return len(self.columns["sample_token"])
+
+    @classmethod
+    def build(cls, infos, nusc, source_size=-1):
+        """resolve every info entry with a NuScenes object"""
+        rows = {name: [] for name in COLUMNS}
+        for info in infos:
+            lidar_sd_token = nusc.get("sample", info["token"])["data"]["LIDAR_TOP"]
+            rows["sample_token"].append(info["token"])
+            rows["lidar_sd_token"].append(lidar_sd_token)
+            # infos store "./data/nuscenes/<path>", the datasets drop that prefix
+            rows["lidar_path"].append(info["lidar_path"][16:])
+            rows["lidarseg_path"].append(_label_filename(nusc, "lidarseg", lidar_sd_token))
+            rows["panoptic_path"].append(_label_filename(nusc, "panoptic", lidar_sd_token))
+        columns = {name: np.array(values, dtype=np.bytes_) for name, values in rows.items()}
+        return cls(columns, source_size)
+
+    def save(self, path):
+        np.savez(path, version=np.int64(NUSC_INDEX_VERSION), source_size=np.int64(self.source_size), **self.columns)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            if int(f["version"]) != NUSC_INDEX_VERSION:
+                raise Exception("Unsupported nuScenes index version: %d" % int(f["version"]))
+            return cls({name: f[name] for name in COLUMNS}, int(f["source_size"]))
+
+    @classmethod
+    def for_infos(cls, infos_path, nusc=None):
+        """
+        index of an infos pkl: the saved one when it is up to date, otherwise
+        built in memory from nusc.
+        """
+        index_path = nusc_index_path(infos_path)
+        if os.path.isfile(index_path):
+            index = cls.load(index_path)
+            if index.source_size == os.path.getsize(infos_path):
+                return index
+            print("%s does not match %s, rebuilding it" % (index_path, infos_path))
+        if nusc is None:
+            raise Exception("No nuScenes index for %s, run tools/build_nusc_index.py or pass a NuScenes object"
+                            % infos_path)
+        with open(infos_path, "rb") as f:
+            infos = pickle.load(f)["infos"]
+        return cls.build(infos, nusc, os.path.getsize(infos_path))
+
+    def get(self, name, index):
+        return self.columns[name][index].decode("utf-8")
@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+# @file: packed_scans.py
+
+"""
+Packed scan format.
+
+A split is stored as a directory with a few large shards instead of one small
+file per scan and label:
+
+    <root>/<split>/meta.json          format version, shard list, per-sample names
+    <root>/<split>/index.npy          int64 (num_samples, 3): shard, point offset, point count
+    <root>/<split>/points_XXX.bin     float32 (n, 4): x, y, z, intensity
+    <root>/<split>/semantic_XXX.bin   uint16 (n,) raw semantic ids (before learning_map)
+    <root>/<split>/instance_XXX.bin   uint16 (n,) raw instance ids
+
+Samples of one shard are contiguous, so any sample is three memmap slices.
+"""
+
+import json
+import os
+import numpy as np
+
+PACK_FORMAT_VERSION = 1
+POINT_DIMS = 4
+
+
+class PackedScanWriter(object):
+    def __init__(self, root, split, has_labels=True, shard_bytes=1 << 30):
+        self.out_dir = os.path.join(root, split)
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.has_labels = has_labels
+        self.shard_bytes = shard_bytes
+        self.index = []
+        self.names = []
+        self.shards = []
+        self._files = None
+        self._shard_points = 0
+
+    def _open_shard(self):
+        self.close_shard()
+        shard = len(self.shards)
+        self.shards.append({"points": 0})
+        names = ["points"] + (["semantic", "instance"] if self.has_labels else [])
+        self._files = {k: open(os.path.join(self.out_dir, "%s_%03d.bin" % (k, shard)), "wb") for k in names}
+        self._shard_points = 0
+
+    def close_shard(self):
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self.shards[-1]["points"] = self._shard_points
+            self._files = None
+
+    def add(self, points, semantic=None, instance=None, name=""):
+        points = np.ascontiguousarray(points[:, :POINT_DIMS], dtype=np.float32)
+        n = len(points)
+        bytes_per_point = POINT_DIMS * 4 + (4 if self.has_labels else 0)
+        if self._files is None or (self._shard_points and (self._shard_points + n) * bytes_per_point > self.shard_bytes):
+            self._open_shard()
+
+        self._files["points"].write(points.tobytes())
+        if self.has_labels:
+            instance = np.zeros(n, dtype=np.uint16) if instance is None else instance
+            self._files["semantic"].write(np.asarray(semantic, dtype=np.uint16).reshape(-1).tobytes())
+            self._files["instance"].write(np.asarray(instance, dtype=np.uint16).reshape(-1).tobytes())
+
+        self.index.append((len(self.shards) - 1, self._shard_points, n))
+        self.names.append(name)
+        self._shard_points += n
+
+    def close(self):
+        self.close_shard()
+        np.save(os.path.join(self.out_dir, "index.npy"), np.asarray(self.index, dtype=np.int64).reshape(-1, 3))
+        meta = {
+            "version": PACK_FORMAT_VERSION,
+            "point_dims": POINT_DIMS,
+            "has_labels": self.has_labels,
+            "shards": self.shards,
+            "names": self.names,
+        }
+        with open(os.path.join(self.out_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+
+class PackedScanReader(object):
+    """O(1) random access to a packed split. Shards are mapped lazily, i.e. once per DataLoader worker."""
+
+    def __init__(self, root, split):
+        self.split_dir = os.path.join(root, split)
+        with open(os.path.join(self.split_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != PACK_FORMAT_VERSION:
+            raise Exception("Unsupported packed scan version: %s" % meta["version"])
+        self.has_labels = meta["has_labels"]
+        self.names = meta["names"]
+        self.num_shards = len(meta["shards"])
+        self.index = np.load(os.path.join(self.split_dir, "index.npy"))
+        self._maps = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        # never ship open mappings to worker processes
+        state = self.__dict__.copy()
+        state["_maps"] = None
+        return state
+
+    def _map(self, kind, shard, dtype, shape):
+        path = os.path.join(self.split_dir, "%s_%03d.bin" % (kind, shard))
+        if os.path.getsize(path) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.asarray(np.memmap(path, dtype=dtype, mode="r")).reshape(shape)
+
+    def _open(self):
+        self._maps = []
+        for shard in range(self.num_shards):
+            maps = {"points": self._map("points", shard, np.float32, (-1, POINT_DIMS))}
+            if self.has_labels:
+                maps["semantic"] = self._map("semantic", shard, np.uint16, (-1,))
+                maps["instance"] = self._map("instance", shard, np.uint16, (-1,))
+            self._maps.append(maps)
+
+    def __getitem__(self, index):
+        """returns read-only (points, semantic, instance) views, labels are None for unlabeled splits"""
+        if self._maps is None:
+            self._open()
+        shard, offset, count = self.index[index]
+        maps = self._maps[shard]
+        points = maps["points"][offset:offset + count]
+        if not self.has_labels:
+            return points, None, None
+        return points, maps["semantic"][offset:offset + count], maps["instance"][offset:offset + count]
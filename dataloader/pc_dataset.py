@@ -6,8 +6,14 @@ import os
 import numpy as np
 from torch.utils import data
 import yaml
-import pickle
-import open3d as o3d
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataloader.label_utils import AnoVoxColorDecoder, LabelRemapper
+from dataloader.scan_io import ReadStats, read_label, read_pcd, read_points
+from dataloader.packed_scans import PackedScanReader
+from dataloader.nusc_index import NuscSampleIndex
+from dataloader.pseudo_labels import PseudoLabelStore, pseudo_label_store_path
+from dataloader.file_manifest import SCAN_WORKERS, cached_manifest, dir_mtime, list_files
 # from nuscenes.eval.lidarseg.utils import get_samples_in_eval_set
 
 REGISTERED_PC_DATASET_CLASSES = {}
@@ -29,7 +35,8 @@ def get_pc_model_class(name):
 
 @register_dataset
 class AnoVox_val(data.Dataset):
-    def __init__(self, data_path, imageset="val", return_ref=False, label_mapping="anovox-label.yaml", nusc=None):
+    def __init__(self, data_path, imageset="val", return_ref=False, label_mapping="anovox-label.yaml", nusc=None,
+                 unknown_color="raise"):
         self.root = data_path
         self.return_ref = return_ref
         with open(label_mapping, "r") as stream:
@@ -38,6 +45,7 @@ class AnoVox_val(data.Dataset):
         self.COLOR_PALETTE = anovox_yaml["color_map"]
         self.remap = np.array(anovox_yaml["to_SemKITTI"])
         self.remap_remap = anovox_yaml["learning_map"]
+        self.color_decoder = AnoVoxColorDecoder.from_yaml(anovox_yaml, unknown=unknown_color)
         self.datapath_list()
         # print('The size of %s data is %d'%(split,len(self.points_datapath)))
 
@@ -47,34 +55,9 @@ class AnoVox_val(data.Dataset):
         return len(self.labels_datapath)
 
     def datapath_list(self):
-        def sorter(file_path):
-            identifier = (os.path.basename(file_path).split('.')[0]).split('_')[-1]
-            return int(identifier)
         print("root", self.root)
-        self.points_datapath = []
-        self.labels_datapath = []
-        # self.instance_datapath = []
-
-        for i, scenario in enumerate(os.listdir(self.root)):
-            if scenario == 'Scenario_Configuration_Files':
-                continue
-            if i > 814: # 4070 / 5 = 814
-                break
-            point_dir = os.path.join(self.root, scenario, 'PCD')
-
-            # print("point dir:", os.listdir(point_dir))
-            # os.listdir(point_dir).sort()
-            sem_point_dir = os.path.join(self.root, scenario, "SEMANTIC_PCD")
-            # os.listdir(sem_point_dir).sort()
-            try:
-                self.points_datapath += [os.path.join(point_dir, point_file) for point_file in os.listdir(point_dir)]
-                # self.points_datapath = sorted(points_datapath, key=sorter)
-                self.labels_datapath += [os.path.join(sem_point_dir, sem_point_file) for sem_point_file in os.listdir(sem_point_dir)]
-                # self.labels_datapath = sorted(labels_datapath, key=sorter)
-            except:
-                pass
-        self.points_datapath = sorted(self.points_datapath, key=sorter)
-        self.labels_datapath = sorted(self.labels_datapath, key=sorter)
+        # 4070 / 5 = 814
+        self.points_datapath, self.labels_datapath = anovox_datapaths(self.root, max_index=814)
 
         # print("points datapath:", self.points_datapath)
 
@@ -102,25 +85,15 @@ class AnoVox_val(data.Dataset):
         #         pass
 
     def __getitem__(self, index):
-        pcd = self.points_datapath[index]
-        pcd = o3d.io.read_point_cloud(pcd)
-        points_set = np.asarray(pcd.points)
-        intensities = np.asarray(pcd.colors)[:,0].reshape(-1,1)
+        points_set, colors = read_pcd(self.points_datapath[index])
+        intensities = (colors[:, 0] / 255.0).reshape(-1,1)
 
 
-        semantic_pcd = self.labels_datapath[index]
-        semantic_pcd = o3d.io.read_point_cloud(semantic_pcd)
-        # semantic_points = np.asarray(semantic_pcd.points)
-        color_labels = np.asarray(semantic_pcd.colors)
+        # semantic colors as uint8, only the rgb field is needed
+        _, sem_labels = read_pcd(self.labels_datapath[index], with_points=False)
 
         # transform color labels to labels as integer value
-        sem_labels = (np.asarray(color_labels) * 255.0).astype(np.uint8)
-        new_labels = np.arange(len(sem_labels))
-        for i, value in enumerate(sem_labels): # convert color into label
-            color_index = np.where((self.COLOR_PALETTE == value).all(axis = 1))
-            new_labels[i] = color_index[0][0]
-        new_labels = self.remap[new_labels]
-        new_labels = np.array([self.remap_remap[label] for label in new_labels])
+        new_labels = self.color_decoder(sem_labels)
         sem_labels = new_labels.reshape(-1,1)
         data_tuple = (points_set[:, :3], sem_labels.astype(np.uint8)) # instance_data.astype(np.uint8))
         if self.return_ref:
@@ -159,7 +132,8 @@ class AnoVox_val(data.Dataset):
 
 @register_dataset
 class AnoVox_train(data.Dataset):
-    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="anovox-label.yaml", nusc=None):
+    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="anovox-label.yaml", nusc=None,
+                 unknown_color="raise"):
         self.root = data_path
         self.imageset = imageset
         self.return_ref = return_ref
@@ -169,6 +143,7 @@ class AnoVox_train(data.Dataset):
         self.COLOR_PALETTE = anovox_yaml["color_map"]
         self.remap = np.array(anovox_yaml["to_SemKITTI"])
         self.train_remap = anovox_yaml["learning_map"]
+        self.color_decoder = AnoVoxColorDecoder.from_yaml(anovox_yaml, unknown=unknown_color)
         self.datapath_list()
         print("length: ", len(self.labels_datapath))
 
@@ -180,35 +155,10 @@ class AnoVox_train(data.Dataset):
         return len(self.labels_datapath)
 
     def datapath_list(self):
-        def sorter(file_path):
-            identifier = (os.path.basename(file_path).split('.')[0]).split('_')[-1]
-            return int(identifier)
         print("root", self.root)
-        self.points_datapath = []
-        self.labels_datapath = []
-        # self.instance_datapath = []
-
-        for i, scenario in enumerate(os.listdir(self.root)):
-            if scenario == 'Scenario_Configuration_Files':
-                continue
-            if i > 814 and self.imageset == "val": # 4070 / 5 = 814
-                break
-            point_dir = os.path.join(self.root, scenario, 'PCD')
-
-            # print("point dir:", os.listdir(point_dir))
-            # os.listdir(point_dir).sort()
-            sem_point_dir = os.path.join(self.root, scenario, "SEMANTIC_PCD")
-            # os.listdir(sem_point_dir).sort()
-            try:
-                self.points_datapath += [os.path.join(point_dir, point_file) for point_file in os.listdir(point_dir)]
-                # self.points_datapath = sorted(points_datapath, key=sorter)
-                # print("points datapath:", self.points_datapath)
-                self.labels_datapath += [os.path.join(sem_point_dir, sem_point_file) for sem_point_file in os.listdir(sem_point_dir)]
-                # self.labels_datapath = sorted(labels_datapath, key=sorter)
-            except:
-                pass
-        self.points_datapath = sorted(self.points_datapath, key=sorter)
-        self.labels_datapath = sorted(self.labels_datapath, key=sorter)
+        # 4070 / 5 = 814
+        max_index = 814 if self.imageset == "val" else None
+        self.points_datapath, self.labels_datapath = anovox_datapaths(self.root, max_index=max_index)
 
         # print("points datapath:", self.points_datapath)
 
@@ -236,24 +186,14 @@ class AnoVox_train(data.Dataset):
         #         pass
 
     def __getitem__(self, index):
-        pcd = self.points_datapath[index]
-        pcd = o3d.io.read_point_cloud(pcd)
-        points_set = np.asarray(pcd.points)
-        intensities = np.asarray(pcd.colors)[:,0].reshape(-1,1)
+        points_set, colors = read_pcd(self.points_datapath[index])
+        intensities = (colors[:, 0] / 255.0).reshape(-1,1)
 
-        semantic_pcd = self.labels_datapath[index]
-        semantic_pcd = o3d.io.read_point_cloud(semantic_pcd)
-        # semantic_points = np.asarray(semantic_pcd.points)
-        color_labels = np.asarray(semantic_pcd.colors)
+        # semantic colors as uint8, only the rgb field is needed
+        _, sem_labels = read_pcd(self.labels_datapath[index], with_points=False)
 
         # transform color labels to labels as integer value
-        sem_labels = (np.asarray(color_labels) * 255.0).astype(np.uint8)
-        new_labels = np.arange(len(sem_labels))
-        for i, value in enumerate(sem_labels): # convert color into label
-            color_index = np.where((self.COLOR_PALETTE == value).all(axis = 1))
-            new_labels[i] = color_index[0][0]
-        new_labels = self.remap[new_labels]
-        new_labels = np.array([self.train_remap[label] for label in new_labels])
+        new_labels = self.color_decoder(sem_labels)
         sem_labels = new_labels.reshape(-1,1)
         data_tuple = (points_set[:, :3], sem_labels.astype(np.uint8)) # instance_data.astype(np.uint8))
         if self.return_ref:
@@ -266,35 +206,38 @@ class AnoVox_train(data.Dataset):
 @register_dataset
 class SemKITTI_demo(data.Dataset):
     def __init__(
-        self, data_path, imageset="demo", return_ref=True, label_mapping="semantic-kitti.yaml", demo_label_path=None
+        self, data_path, imageset="demo", return_ref=True, label_mapping="semantic-kitti.yaml", demo_label_path=None,
+        use_memmap=False
     ):
         with open(label_mapping, "r") as stream:
             semkittiyaml = yaml.safe_load(stream)
         self.learning_map = semkittiyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(semkittiyaml)
         self.imageset = imageset
         self.return_ref = return_ref
+        self.use_memmap = use_memmap
+        self.read_stats = ReadStats()
 
-        self.im_idx = []
-        self.im_idx += absoluteFilePaths(data_path)
+        self.im_idx = list_files(data_path)
         self.label_idx = []
         if self.imageset == "val":
             print(demo_label_path)
-            self.label_idx += absoluteFilePaths(demo_label_path)
+            self.label_idx = list_files(demo_label_path)
 
     def __len__(self):
         "Denotes the total number of samples"
         return len(self.im_idx)
 
     def __getitem__(self, index):
-        raw_data = np.fromfile(self.im_idx[index], dtype=np.float32).reshape((-1, 4))
+        raw_data = read_points(self.im_idx[index], self.use_memmap, self.read_stats)
         if self.imageset == "demo":
-            annotated_data = np.expand_dims(np.zeros_like(raw_data[:, 0], dtype=int), axis=1)
+            annotated_data = np.zeros((len(raw_data), 1), dtype=np.uint8)
         elif self.imageset == "val":
-            annotated_data = np.fromfile(self.label_idx[index], dtype=np.uint32).reshape((-1, 1))
-            annotated_data = annotated_data & 0xFFFF  # delete high 16 digits binary
-            annotated_data = np.vectorize(self.learning_map.__getitem__)(annotated_data)
+            semantic_data, _ = read_label(self.label_idx[index], self.use_memmap, self.read_stats)
+            annotated_data = self.label_remapper(semantic_data.reshape((-1, 1)))
+        self.read_stats.count_sample()
 
-        data_tuple = (raw_data[:, :3], annotated_data.astype(np.uint8))
+        data_tuple = (raw_data[:, :3], annotated_data.astype(np.uint8, copy=False))
         if self.return_ref:
             data_tuple += (raw_data[:, 3],)
         return data_tuple
@@ -302,11 +245,15 @@ class SemKITTI_demo(data.Dataset):
 
 @register_dataset
 class SemKITTI_sk(data.Dataset):
-    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti.yaml", nusc=None):
+    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti.yaml", nusc=None,
+                 use_memmap=False):
         self.return_ref = return_ref
+        self.use_memmap = use_memmap
+        self.read_stats = ReadStats()
         with open(label_mapping, "r") as stream:
             semkittiyaml = yaml.safe_load(stream)
         self.learning_map = semkittiyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(semkittiyaml)
         self.imageset = imageset
         if imageset == "train":
             split = semkittiyaml["split"]["train"]
@@ -317,9 +264,7 @@ class SemKITTI_sk(data.Dataset):
         else:
             raise Exception("Split must be train/val/test")
 
-        self.im_idx = []
-        for i_folder in split:
-            self.im_idx += absoluteFilePaths("/".join([data_path, str(i_folder).zfill(2), "velodyne"]))
+        self.im_idx = list_files(["/".join([data_path, str(i_folder).zfill(2), "velodyne"]) for i_folder in split])
         print("length: ", len(self.im_idx))
 
 
@@ -328,22 +273,22 @@ class SemKITTI_sk(data.Dataset):
         return len(self.im_idx)
 
     def __getitem__(self, index):
-        raw_data = np.fromfile(self.im_idx[index], dtype=np.float32).reshape((-1, 4))
+        raw_data = read_points(self.im_idx[index], self.use_memmap, self.read_stats)
         if self.imageset == "test":
             path_save = self.im_idx[index].replace("velodyne", "predictions")
             path_save = path_save.replace("bin", "label")
             path_save = path_save.replace("dataset", "predictions_test/predictions_incre_latest")
-            annotated_data = np.expand_dims(np.zeros_like(raw_data[:, 0], dtype=int), axis=1)
+            annotated_data = np.zeros((len(raw_data), 1), dtype=np.uint8)
         else:
-            annotated_data = np.fromfile(
-                self.im_idx[index].replace("velodyne", "labels")[:-3] + "label", dtype=np.uint32
-            ).reshape((-1, 1))
-            annotated_data = annotated_data & 0xFFFF  # delete high 16 digits binary
-            annotated_data = np.vectorize(self.learning_map.__getitem__)(annotated_data)
+            semantic_data, _ = read_label(
+                self.im_idx[index].replace("velodyne", "labels")[:-3] + "label", self.use_memmap, self.read_stats
+            )
+            annotated_data = self.label_remapper(semantic_data.reshape((-1, 1)))
             # print("max: ", annotated_data.max())
             # print("min: ", annotated_data.min())
+        self.read_stats.count_sample()
 
-        data_tuple = (raw_data[:, :3], annotated_data.astype(np.uint8))
+        data_tuple = (raw_data[:, :3], annotated_data.astype(np.uint8, copy=False))
         if self.return_ref:
             data_tuple += (raw_data[:, 3],)
 
@@ -355,11 +300,15 @@ class SemKITTI_sk(data.Dataset):
 
 @register_dataset
 class SemKITTI_sk_panop(data.Dataset):
-    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti.yaml", nusc=None):
+    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti.yaml", nusc=None,
+                 use_memmap=False):
         self.return_ref = return_ref
+        self.use_memmap = use_memmap
+        self.read_stats = ReadStats()
         with open(label_mapping, "r") as stream:
             semkittiyaml = yaml.safe_load(stream)
         self.learning_map = semkittiyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(semkittiyaml)
         self.imageset = imageset
         if imageset == "train":
             split = semkittiyaml["split"]["train"]
@@ -370,27 +319,26 @@ class SemKITTI_sk_panop(data.Dataset):
         else:
             raise Exception("Split must be train/val/test")
 
-        self.im_idx = []
-        for i_folder in split:
-            self.im_idx += absoluteFilePaths("/".join([data_path, str(i_folder).zfill(2), "velodyne"]))
+        self.im_idx = list_files(["/".join([data_path, str(i_folder).zfill(2), "velodyne"]) for i_folder in split])
 
     def __len__(self):
         "Denotes the total number of samples"
         return len(self.im_idx)
 
     def __getitem__(self, index):
-        raw_data = np.fromfile(self.im_idx[index], dtype=np.float32).reshape((-1, 4))
+        raw_data = read_points(self.im_idx[index], self.use_memmap, self.read_stats)
         if self.imageset == "test":
             annotated_data = np.expand_dims(np.zeros_like(raw_data[:, 0], dtype=int), axis=1)
         else:
-            annotated_data = np.fromfile(
-                self.im_idx[index].replace("velodyne", "labels")[:-3] + "label", dtype=np.uint32
-            ).reshape((-1, 1))
-            semantic_data = annotated_data & 0xFFFF
-            instance_data = annotated_data >> 16
-            semantic_data = np.vectorize(self.learning_map.__getitem__)(semantic_data)
+            semantic_data, instance_data = read_label(
+                self.im_idx[index].replace("velodyne", "labels")[:-3] + "label", self.use_memmap, self.read_stats
+            )
+            semantic_data = self.label_remapper(semantic_data.reshape((-1, 1)))
+            instance_data = instance_data.reshape((-1, 1)).astype(np.uint8)
+            self.read_stats.update(bytes_copied=instance_data.nbytes)
+        self.read_stats.count_sample()
 
-        data_tuple = (raw_data[:, :3], semantic_data.astype(np.uint8), instance_data.astype(np.uint8))
+        data_tuple = (raw_data[:, :3], semantic_data.astype(np.uint8, copy=False), instance_data)
         if self.return_ref:
             data_tuple += (raw_data[:, 3],)
         return data_tuple
@@ -403,6 +351,7 @@ class SemKITTI_sk_panop_incre(data.Dataset):
         with open(label_mapping, "r") as stream:
             semkittiyaml = yaml.safe_load(stream)
         self.learning_map = semkittiyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(semkittiyaml)
         self.imageset = imageset
         if imageset == "train":
             split = semkittiyaml["split"]["train"]
@@ -413,23 +362,28 @@ class SemKITTI_sk_panop_incre(data.Dataset):
         else:
             raise Exception("Split must be train/val/test")
 
-        self.im_idx = []
-        for i_folder in split:
-            self.im_idx += absoluteFilePaths("/".join([data_path, str(i_folder).zfill(2), "velodyne"]))
+        self.im_idx = list_files(["/".join([data_path, str(i_folder).zfill(2), "velodyne"]) for i_folder in split])
 
         self.pred_names = []
         pred_paths = "/harddisk/jcenaa/semantic_kitti/predictions/sequences/08/predictions_base_train"
-        # populate the label names
-        seq_pred_names = [
-            os.path.join(dp, f) for dp, dn, fn in os.walk(os.path.expanduser(pred_paths)) for f in fn if ".label" in f
-        ]
-        seq_pred_names.sort()
-        self.pred_names.extend(seq_pred_names)
+        # a pseudo label store built by tools/pack_pseudo_labels.py replaces the per-frame .label files
+        store_path = pseudo_label_store_path(pred_paths)
+        self.pseudo_labels = PseudoLabelStore(store_path) if os.path.isdir(store_path) else None
+        if self.pseudo_labels is None:
+            # populate the label names
+            seq_pred_names = sorted(list_files(pred_paths, contains=".label"))
+            self.pred_names.extend(seq_pred_names)
 
     def __len__(self):
         "Denotes the total number of samples"
         return len(self.im_idx)
 
+    def load_distill_label(self, index):
+        if self.pseudo_labels is not None:
+            return self.pseudo_labels["%06d" % index]
+        distill_label = np.fromfile(self.pred_names[index], dtype=np.int32)
+        return distill_label.reshape([-1, 1]).astype(np.uint8)
+
     def __getitem__(self, index):
         raw_data = np.fromfile(self.im_idx[index], dtype=np.float32).reshape((-1, 4))
         if self.imageset == "test":
@@ -440,17 +394,15 @@ class SemKITTI_sk_panop_incre(data.Dataset):
             ).reshape((-1, 1))
             semantic_data = annotated_data & 0xFFFF
             instance_data = annotated_data >> 16
-            semantic_data = np.vectorize(self.learning_map.__getitem__)(semantic_data)
+            semantic_data = self.label_remapper(semantic_data)
 
-        distill_label_path = self.pred_names[index]
-        distill_label = np.fromfile(distill_label_path, dtype=int32)
-        distill_label = distill_label.reshape([-1, 1])
+        distill_label = self.load_distill_label(index)
 
         data_tuple = (
             raw_data[:, :3],
             semantic_data.astype(np.uint8),
             instance_data.astype(np.uint8),
-            distill_label.astype(np.uint8),
+            distill_label,
         )
         if self.return_ref:
             data_tuple += (raw_data[:, 3],)
@@ -462,33 +414,27 @@ class SemKITTI_nusc_panop(data.Dataset):
     def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="nuscenes.yaml", nusc=None):
         self.return_ref = return_ref
 
-        with open(imageset, "rb") as f:
-            data = pickle.load(f)
-
         with open(label_mapping, "r") as stream:
             nuscenesyaml = yaml.safe_load(stream)
         self.learning_map = nuscenesyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(nuscenesyaml)
 
-        self.nusc_infos = data["infos"]
+        # label paths and tokens are resolved offline, nusc is only needed without a saved index
+        self.sample_index = NuscSampleIndex.for_infos(imageset, nusc)
         self.data_path = data_path
-        self.nusc = nusc
 
     def __len__(self):
         "Denotes the total number of samples"
-        return len(self.nusc_infos)
+        return len(self.sample_index)
 
     def __getitem__(self, index):
-        info = self.nusc_infos[index]
-        lidar_path = info["lidar_path"][16:]
-        lidar_sd_token = self.nusc.get("sample", info["token"])["data"]["LIDAR_TOP"]
-        lidarseg_labels_filename = os.path.join(
-            self.nusc.dataroot, self.nusc.get("panoptic", lidar_sd_token)["filename"]
-        )
+        lidar_path = self.sample_index.get("lidar_path", index)
+        lidarseg_labels_filename = os.path.join(self.data_path, self.sample_index.get("panoptic_path", index))
 
         points_label = np.load(lidarseg_labels_filename)["data"].reshape([-1, 1])
         sem_label = (points_label // 1000).astype(np.uint8)
         inst_label = (points_label % 1000).astype(np.uint8)
-        sem_label = np.vectorize(self.learning_map.__getitem__)(sem_label)
+        sem_label = self.label_remapper(sem_label)
         points = np.fromfile(os.path.join(self.data_path, lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])
 
         data_tuple = (points[:, :3], sem_label.astype(np.uint8), inst_label.astype(np.uint8))
@@ -502,53 +448,52 @@ class SemKITTI_nusc_panop_incre(data.Dataset):
     def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="nuscenes.yaml", nusc=None):
         self.return_ref = return_ref
 
-        with open(imageset, "rb") as f:
-            data = pickle.load(f)
-
         with open(label_mapping, "r") as stream:
             nuscenesyaml = yaml.safe_load(stream)
         self.learning_map = nuscenesyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(nuscenesyaml)
 
-        self.nusc_infos = data["infos"]
+        # label paths and tokens are resolved offline, nusc is only needed without a saved index
+        self.sample_index = NuscSampleIndex.for_infos(imageset, nusc)
         self.data_path = data_path
-        self.nusc = nusc
 
         self.pred_names = []
         pred_paths = os.path.join(self.data_path, "predictions", "predictions_incre158_train")
-        # populate the label names
-        seq_pred_names = [
-            os.path.join(dp, f) for dp, dn, fn in os.walk(os.path.expanduser(pred_paths)) for f in fn if ".label" in f
-        ]
-        seq_pred_names.sort()
-        self.pred_names.extend(seq_pred_names)
+        # a pseudo label store built by tools/pack_pseudo_labels.py replaces the per-frame .label files
+        store_path = pseudo_label_store_path(pred_paths)
+        self.pseudo_labels = PseudoLabelStore(store_path) if os.path.isdir(store_path) else None
+        if self.pseudo_labels is None:
+            # populate the label names
+            seq_pred_names = sorted(list_files(pred_paths, contains=".label"))
+            self.pred_names.extend(seq_pred_names)
 
     def __len__(self):
         "Denotes the total number of samples"
-        return len(self.nusc_infos)
+        return len(self.sample_index)
+
+    def load_distill_label(self, index):
+        if self.pseudo_labels is not None:
+            return self.pseudo_labels["%06d" % index]
+        distill_label = np.fromfile(self.pred_names[index], dtype=np.int32)
+        return distill_label.reshape([-1, 1]).astype(np.uint8)
 
     def __getitem__(self, index):
-        info = self.nusc_infos[index]
-        lidar_path = info["lidar_path"][16:]
-        lidar_sd_token = self.nusc.get("sample", info["token"])["data"]["LIDAR_TOP"]
-        lidarseg_labels_filename = os.path.join(
-            self.nusc.dataroot, self.nusc.get("panoptic", lidar_sd_token)["filename"]
-        )
+        lidar_path = self.sample_index.get("lidar_path", index)
+        lidarseg_labels_filename = os.path.join(self.data_path, self.sample_index.get("panoptic_path", index))
 
         points_label = np.load(lidarseg_labels_filename)["data"].reshape([-1, 1])
         sem_label = (points_label // 1000).astype(np.uint8)
         inst_label = (points_label % 1000).astype(np.uint8)
-        sem_label = np.vectorize(self.learning_map.__getitem__)(sem_label)
+        sem_label = self.label_remapper(sem_label)
         points = np.fromfile(os.path.join(self.data_path, lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])
 
-        distill_label_path = self.pred_names[index]
-        distill_label = np.fromfile(distill_label_path, dtype=int32)
-        distill_label = distill_label.reshape([-1, 1])
+        distill_label = self.load_distill_label(index)
 
         data_tuple = (
             points[:, :3],
             sem_label.astype(np.uint8),
             inst_label.astype(np.uint8),
-            distill_label.astype(np.uint8),
+            distill_label,
         )
         if self.return_ref:
             data_tuple += (points[:, 3],)
@@ -560,38 +505,33 @@ class SemKITTI_nusc(data.Dataset):
     def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="nuscenes.yaml", nusc=None):
         self.return_ref = return_ref
 
-        with open(imageset, "rb") as f:
-            data = pickle.load(f)
-
         with open(label_mapping, "r") as stream:
             nuscenesyaml = yaml.safe_load(stream)
         self.learning_map = nuscenesyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(nuscenesyaml)
 
-        self.nusc_infos = data["infos"]
+        # label paths and tokens are resolved offline, nusc is only needed without a saved index
+        self.sample_index = NuscSampleIndex.for_infos(imageset, nusc)
         self.data_path = data_path
-        self.nusc = nusc
         self.imageset = imageset
 
     def __len__(self):
         "Denotes the total number of samples"
-        return len(self.nusc_infos)
+        return len(self.sample_index)
 
     def __getitem__(self, index):
-        info = self.nusc_infos[index]
-        lidar_path = info["lidar_path"][16:]
+        lidar_path = self.sample_index.get("lidar_path", index)
         points = np.fromfile(os.path.join(self.data_path, lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])
 
-        lidar_sd_token = self.nusc.get("sample", info["token"])["data"]["LIDAR_TOP"]
+        lidar_sd_token = self.sample_index.get("lidar_sd_token", index)
 
         if self.imageset.find("test") != -1:
             points_label = np.expand_dims(np.zeros_like(points[:, 0], dtype=int), axis=1)
         else:
-            lidarseg_labels_filename = os.path.join(
-                self.nusc.dataroot, self.nusc.get("lidarseg", lidar_sd_token)["filename"]
-            )
+            lidarseg_labels_filename = os.path.join(self.data_path, self.sample_index.get("lidarseg_path", index))
 
             points_label = np.fromfile(lidarseg_labels_filename, dtype=np.uint8).reshape([-1, 1])
-            points_label = np.vectorize(self.learning_map.__getitem__)(points_label)
+            points_label = self.label_remapper(points_label)
 
         data_tuple = (points[:, :3], points_label.astype(np.uint8))
         if self.return_ref:
@@ -603,6 +543,109 @@ class SemKITTI_nusc(data.Dataset):
             return data_tuple
 
 
+@register_dataset
+class SemKITTI_packed(data.Dataset):
+    """
+    SemanticKITTI or nuScenes scans packed by tools/pack_dataset.py.
+
+    data_path is the pack root and imageset the packed split. Samples match
+    SemKITTI_sk / SemKITTI_nusc, unlabeled splits also return the saved name
+    (prediction path or lidar sample-data token) like their test modes do.
+    """
+
+    panoptic = False
+
+    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti.yaml", nusc=None):
+        self.return_ref = return_ref
+        with open(label_mapping, "r") as stream:
+            labelyaml = yaml.safe_load(stream)
+        self.learning_map = labelyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(labelyaml)
+        self.imageset = imageset
+        self.read_stats = ReadStats()
+        self.reader = PackedScanReader(data_path, imageset)
+        print("length: ", len(self.reader))
+
+    def __len__(self):
+        "Denotes the total number of samples"
+        return len(self.reader)
+
+    def __getitem__(self, index):
+        points, semantic_data, instance_data = self.reader[index]
+        self.read_stats.update(bytes_read=points.nbytes)
+        if semantic_data is None:
+            annotated_data = np.zeros((len(points), 1), dtype=np.uint8)
+            instance_data = annotated_data
+        else:
+            self.read_stats.update(bytes_read=semantic_data.nbytes + instance_data.nbytes)
+            annotated_data = self.label_remapper(semantic_data.reshape((-1, 1)))
+            if self.panoptic:
+                instance_data = instance_data.reshape((-1, 1)).astype(np.uint8)
+        self.read_stats.count_sample()
+
+        data_tuple = (points[:, :3], annotated_data)
+        if self.panoptic:
+            data_tuple += (instance_data,)
+        if self.return_ref:
+            data_tuple += (points[:, 3],)
+
+        if not self.reader.has_labels:
+            return data_tuple, self.reader.names[index]
+        return data_tuple
+
+
+@register_dataset
+class SemKITTI_packed_panop(SemKITTI_packed):
+    panoptic = True
+
+
+def anovox_datapaths(root, max_index=None):
+    """
+    sorted (points, labels) .pcd paths of an AnoVox root, cached in a file manifest.
+
+    Scenarios are taken in directory order and, like before, listing stops at
+    the first scenario whose position is past max_index.
+    """
+    def sorter(file_path):
+        identifier = (os.path.basename(file_path).split('.')[0]).split('_')[-1]
+        return int(identifier)
+
+    def listdir(directory):
+        mtime = dir_mtime(directory)
+        try:
+            return mtime, os.listdir(directory)
+        except OSError:
+            return mtime, None
+
+    def build():
+        dirs = {root: dir_mtime(root)}
+        scenarios = []
+        for i, scenario in enumerate(os.listdir(root)):
+            if scenario == 'Scenario_Configuration_Files':
+                continue
+            if max_index is not None and i > max_index:
+                break
+            scenarios.append(scenario)
+        scenario_dirs = [(os.path.join(root, scenario, 'PCD'), os.path.join(root, scenario, "SEMANTIC_PCD"))
+                         for scenario in scenarios]
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+            listings = list(pool.map(listdir, [d for pair in scenario_dirs for d in pair]))
+
+        points_datapath, labels_datapath = [], []
+        for (point_dir, sem_point_dir), (point_mtime, point_files), (sem_mtime, sem_files) in zip(
+                scenario_dirs, listings[0::2], listings[1::2]):
+            dirs[point_dir] = point_mtime
+            if point_files is None:
+                continue
+            points_datapath += [os.path.join(point_dir, point_file) for point_file in point_files]
+            dirs[sem_point_dir] = sem_mtime
+            if sem_files is not None:
+                labels_datapath += [os.path.join(sem_point_dir, sem_point_file) for sem_point_file in sem_files]
+        return [sorted(points_datapath, key=sorter), sorted(labels_datapath, key=sorter)], dirs
+
+    return cached_manifest("anovox", {"root": os.path.abspath(root), "max_index": max_index}, build)
+
+
 def absoluteFilePaths(directory):
     for dirpath, _, filenames in os.walk(directory):
         filenames.sort()
@@ -629,11 +672,13 @@ from os.path import join
 
 @register_dataset
 class SemKITTI_sk_multiscan(data.Dataset):
-    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti-multiscan.yaml"):
+    def __init__(self, data_path, imageset="train", return_ref=False, label_mapping="semantic-kitti-multiscan.yaml",
+                 cache_frames=None):
         self.return_ref = return_ref
         with open(label_mapping, "r") as stream:
             semkittiyaml = yaml.safe_load(stream)
         self.learning_map = semkittiyaml["learning_map"]
+        self.label_remapper = LabelRemapper.from_yaml(semkittiyaml)
         self.imageset = imageset
         self.data_path = data_path
         if imageset == "train":
@@ -647,46 +692,48 @@ class SemKITTI_sk_multiscan(data.Dataset):
 
         multiscan = 2  # additional two frames are fused with target-frame. Hence, 3 point clouds in total
         self.multiscan = multiscan
-        self.im_idx = []
 
-        self.calibrations = []
-        self.times = []
-        self.poses = []
+        # calibrations, times and poses are parsed on first use of a sequence
+        self.calibrations = {}
+        self.times = {}
+        self.poses = {}
 
-        self.load_calib_poses()
+        # raw frames of the last samples, sample i reuses the frames sample i - 1 just read
+        self.cache_frames = multiscan + 1 if cache_frames is None else cache_frames
+        self.frame_cache = OrderedDict()
 
-        for i_folder in split:
-            self.im_idx += absoluteFilePaths("/".join([data_path, str(i_folder).zfill(2), "velodyne"]))
+        self.im_idx = list_files(["/".join([data_path, str(i_folder).zfill(2), "velodyne"]) for i_folder in split])
 
     def __len__(self):
         "Denotes the total number of samples"
         return len(self.im_idx)
 
-    def load_calib_poses(self):
+    def __getstate__(self):
+        # every DataLoader worker starts with an empty frame cache
+        state = self.__dict__.copy()
+        state["frame_cache"] = OrderedDict()
+        return state
+
+    def load_calib_poses(self, seq):
         """
-        load calib poses and times.
+        load calib poses and times of one sequence.
         """
+        seq_folder = os.path.join(self.data_path, str(seq).zfill(2))
 
-        ###########
-        # Load data
-        ###########
-
-        self.calibrations = []
-        self.times = []
-        self.poses = []
-
-        for seq in range(0, 22):
-            seq_folder = join(self.data_path, str(seq).zfill(2))
+        # Read Calib
+        self.calibrations[seq] = self.parse_calibration(os.path.join(seq_folder, "calib.txt"))
 
-            # Read Calib
-            self.calibrations.append(self.parse_calibration(join(seq_folder, "calib.txt")))
+        # Read times
+        self.times[seq] = np.loadtxt(os.path.join(seq_folder, "times.txt"), dtype=np.float32)
 
-            # Read times
-            self.times.append(np.loadtxt(join(seq_folder, "times.txt"), dtype=np.float32))
+        # Read poses
+        self.poses[seq] = self.parse_poses(os.path.join(seq_folder, "poses.txt"), self.calibrations[seq]).astype(
+            np.float32)
 
-            # Read poses
-            poses_f64 = self.parse_poses(join(seq_folder, "poses.txt"), self.calibrations[-1])
-            self.poses.append([pose.astype(np.float32) for pose in poses_f64])
+    def get_pose(self, seq, frame):
+        if seq not in self.poses:
+            self.load_calib_poses(seq)
+        return self.poses[seq][frame]
 
     def parse_calibration(self, filename):
         """read calibration file with given filename
@@ -720,85 +767,85 @@ class SemKITTI_sk_multiscan(data.Dataset):
 
         Returns
         -------
-        list
-            list of poses as 4x4 numpy arrays.
+        np.ndarray
+            (num_scans, 4, 4) float64 poses.
         """
-        file = open(filename)
-
-        poses = []
+        values = np.loadtxt(filename, dtype=np.float64, ndmin=2).reshape((-1, 3, 4))
+        poses = np.zeros((len(values), 4, 4))
+        poses[:, :3] = values
+        poses[:, 3, 3] = 1.0
 
         Tr = calibration["Tr"]
         Tr_inv = np.linalg.inv(Tr)
 
-        for line in file:
-            values = [float(v) for v in line.strip().split()]
-
-            pose = np.zeros((4, 4))
-            pose[0, 0:4] = values[0:4]
-            pose[1, 0:4] = values[4:8]
-            pose[2, 0:4] = values[8:12]
-            pose[3, 3] = 1.0
-
-            poses.append(np.matmul(Tr_inv, np.matmul(pose, Tr)))
-
-        return poses
+        return np.matmul(Tr_inv, np.matmul(poses, Tr))
 
     def fuse_multi_scan(self, points, pose0, pose):
-        # pose = poses[0][idx]
+        # hpoints.dot(pose.T)[:, :3] - pose0[:3, 3], then .dot(pose0[:3, :3]), folded into one affine map
+        rot = pose[:3, :3].T.astype(np.float64) @ pose0[:3, :3]
+        shift = (pose[:3, 3].astype(np.float64) - pose0[:3, 3]) @ pose0[:3, :3]
 
-        hpoints = np.hstack((points[:, :3], np.ones_like(points[:, :1])))
-        # new_points = hpoints.dot(pose.T)
-        new_points = np.sum(np.expand_dims(hpoints, 2) * pose.T, axis=1)
-
-        new_points = new_points[:, :3]
-        new_coords = new_points - pose0[:3, 3]
-        # new_coords = new_coords.dot(pose0[:3, :3])
-        new_coords = np.sum(np.expand_dims(new_coords, 2) * pose0[:3, :3], axis=1)
+        new_coords = points[:, :3] @ rot.astype(np.float32)
+        new_coords += shift.astype(np.float32)
         new_coords = np.hstack((new_coords, points[:, 3:]))
 
         return new_coords
 
-    def __getitem__(self, index):
-        raw_data = np.fromfile(self.im_idx[index], dtype=np.float32).reshape((-1, 4))
-        origin_len = len(raw_data)
+    def load_frame(self, path):
+        """raw (N, 4) points and (N, 1) uint16 semantic labels of a scan, read-only and cached"""
+        # pop and re-insert instead of move_to_end, read-ahead threads may share the cache
+        frame = self.frame_cache.pop(path, None)
+        if frame is not None:
+            self.frame_cache[path] = frame
+            return frame
+
+        raw_data = read_points(path)
         if self.imageset == "test":
-            annotated_data = np.expand_dims(np.zeros_like(raw_data[:, 0], dtype=int), axis=1)
+            annotated_data = np.zeros((len(raw_data), 1), dtype=np.uint16)
         else:
-            annotated_data = np.fromfile(
-                self.im_idx[index].replace("velodyne", "labels")[:-3] + "label", dtype=int32
-            ).reshape((-1, 1))
-            annotated_data = annotated_data & 0xFFFF  # delete high 16 digits binary
-            # annotated_data = np.vectorize(self.learning_map.__getitem__)(annotated_data)
+            # low 16 bits only, high 16 bits are the instance id
+            annotated_data, _ = read_label(path.replace("velodyne", "labels")[:-3] + "label")
+            annotated_data = annotated_data.reshape((-1, 1))
+        raw_data.flags.writeable = False
+        annotated_data.flags.writeable = False
+        frame = (raw_data, annotated_data)
+
+        if self.cache_frames > 0:
+            self.frame_cache[path] = frame
+            while len(self.frame_cache) > self.cache_frames:
+                try:
+                    self.frame_cache.popitem(last=False)
+                except KeyError:
+                    break
+        return frame
+
+    def __getitem__(self, index):
+        raw_data, annotated_data = self.load_frame(self.im_idx[index])
+        origin_len = len(raw_data)
 
         number_idx = int(self.im_idx[index][-10:-4])
         dir_idx = int(self.im_idx[index][-22:-20])
 
-        pose0 = self.poses[dir_idx][number_idx]
+        pose0 = self.get_pose(dir_idx, number_idx)
 
         if number_idx - self.multiscan >= 0:
+            raw_frames = [raw_data]
+            label_frames = [annotated_data]
             for fuse_idx in range(self.multiscan):
                 plus_idx = fuse_idx + 1
 
-                pose = self.poses[dir_idx][number_idx - plus_idx]
+                pose = self.get_pose(dir_idx, number_idx - plus_idx)
 
                 newpath2 = self.im_idx[index][:-10] + str(number_idx - plus_idx).zfill(6) + self.im_idx[index][-4:]
-                raw_data2 = np.fromfile(newpath2, dtype=np.float32).reshape((-1, 4))
-
-                if self.imageset == "test":
-                    annotated_data2 = np.expand_dims(np.zeros_like(raw_data2[:, 0], dtype=int), axis=1)
-                else:
-                    annotated_data2 = np.fromfile(
-                        newpath2.replace("velodyne", "labels")[:-3] + "label", dtype=int32
-                    ).reshape((-1, 1))
-                    annotated_data2 = annotated_data2 & 0xFFFF  # delete high 16 digits binary
-
-                raw_data2 = self.fuse_multi_scan(raw_data2, pose0, pose)
+                raw_data2, annotated_data2 = self.load_frame(newpath2)
 
                 if len(raw_data2) != 0:
-                    raw_data = np.concatenate((raw_data, raw_data2), 0)
-                    annotated_data = np.concatenate((annotated_data, annotated_data2), 0)
+                    raw_frames.append(self.fuse_multi_scan(raw_data2, pose0, pose))
+                    label_frames.append(annotated_data2)
+            raw_data = np.concatenate(raw_frames, 0)
+            annotated_data = np.concatenate(label_frames, 0)
 
-        annotated_data = np.vectorize(self.learning_map.__getitem__)(annotated_data)
+        annotated_data = self.label_remapper(annotated_data)
 
         data_tuple = (raw_data[:, :3], annotated_data.astype(np.uint8))
 
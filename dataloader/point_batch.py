@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+# @file: point_batch.py
+
+"""
+Point features and grid indices of a batch in one buffer.
+
+The loops used to move a batch to the device sample by sample: a CPU cast,
+a pageable allocation and a synchronous copy per sample, for the features
+and again for the grid indices. With point_batch set in dataset_params the
+collate functions replace the per-sample feature list with a PointBatch: one
+(N, F + 4) float32 tensor holding the features of all points followed by
+[batch, x, y, z] (exact, grid indices are far below 2 ** 24), plus the
+sample offsets. With feature_dtype float16 the buffer is float16 as long as
+the batch and grid indices stay below 2 ** 11, which float16 holds exactly.
+With pin_memory in the loader config the DataLoader pins it
+once per batch and .to(device, non_blocking=True) is a single copy that
+overlaps the compute of the previous batch.
+
+cylinder_fea takes a PointBatch in place of the feature list. The loops get
+their model inputs either way from
+
+    train_pt_fea_ten, train_vox_ten = point_tensors(train_pt_fea, train_grid, pytorch_device)
+
+The per-sample grid arrays of the batch stay numpy for the metrics.
+"""
+
+import numpy as np
+import torch
+
+
+class PointBatch(object):
+    """
+    data: (N, num_features + 4) float32 or float16 [features, batch, x, y, z],
+    offsets: (B + 1,) int64 first row of every sample, on the CPU
+    """
+
+    def __init__(self, data, offsets, num_features):
+        self.data = data
+        self.offsets = offsets
+        self.num_features = num_features
+
+    @classmethod
+    def collate(cls, pt_fea, grid):
+        num_points = [len(f) for f in pt_fea]
+        offsets = np.concatenate([[0], np.cumsum(num_points)]).astype(np.int64)
+        num_features = pt_fea[0].shape[1]
+        dtype = pt_fea[0].dtype
+        if dtype == np.float16 and max(len(pt_fea), max(int(i.max(initial=0)) for i in grid) + 1) > 2 ** 11:
+            dtype = np.float32
+        data = np.empty((offsets[-1], num_features + 4), dtype=dtype)
+        for b, (fea, ind) in enumerate(zip(pt_fea, grid)):
+            rows = data[offsets[b]:offsets[b + 1]]
+            rows[:, :num_features] = fea
+            rows[:, num_features] = b
+            rows[:, num_features + 1:] = ind
+        return cls(torch.from_numpy(data), torch.from_numpy(offsets), num_features)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def device(self):
+        return self.data.device
+
+    def pin_memory(self):
+        # called by the DataLoader's pin thread
+        return PointBatch(self.data.pin_memory(), self.offsets, self.num_features)
+
+    def to(self, device, non_blocking=False):
+        return PointBatch(self.data.to(device, non_blocking=non_blocking), self.offsets, self.num_features)
+
+    @property
+    def features(self):
+        """(N, num_features) float32 features of all points"""
+        return self.data[:, :self.num_features].float()
+
+    @property
+    def indices(self):
+        """(N, 4) int64 [batch, x, y, z] of all points"""
+        return self.data[:, self.num_features:].long()
+
+    def _split(self, tensor):
+        return list(tensor.split(torch.diff(self.offsets).tolist()))
+
+    def split_features(self):
+        return self._split(self.features)
+
+    def split_grid(self):
+        """per sample (N_b, 3) int64 grid indices"""
+        return self._split(self.data[:, self.num_features + 1:].long())
+
+
+class PointBatchCollate(object):
+    """collate_fn wrapper that packs the point features and grid indices of a SampleBatch into a PointBatch"""
+
+    def __init__(self, collate_fn):
+        self.collate_fn = collate_fn
+
+    def __call__(self, data):
+        batch = self.collate_fn(data)
+        if batch.pt_fea is None or batch.grid is None or batch.grid[0] is None:
+            # not collated, or scans are voxelized on the device, see batch_voxelizer.py
+            return batch
+        return batch.replace(pt_fea=PointBatch.collate(batch.pt_fea, batch.grid))
+
+
+def point_tensors(pt_fea, grid, device):
+    """
+    model inputs of a batch on device: the PointBatch and its per-sample grid
+    indices, or lists of per-sample feature and grid tensors
+    """
+    if grid is None or (len(grid) and grid[0] is None):
+        raise ValueError("the batch holds raw points (voxelize_on_device in dataset_params), only "
+                         "train_cylinder_asym.py and train_cylinder_asym_nuscenes.py voxelize them, "
+                         "see dataloader/batch_voxelizer.py")
+    if isinstance(pt_fea, PointBatch):
+        pt_fea = pt_fea.to(device, non_blocking=True)
+        return pt_fea, pt_fea.split_grid()
+    # compact on the host, widened after the copy
+    return ([torch.from_numpy(i).to(device).float() for i in pt_fea],
+            [torch.from_numpy(i).to(device).long() for i in grid])
@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+# @file: pseudo_labels.py
+
+"""
+Pseudo-label store for the incremental-learning distillation labels.
+
+All frames of a split are kept as uint8 in one file instead of one int32
+.label file per frame:
+
+    <store>/meta.json      format version and the scan id of every frame
+    <store>/offsets.npy    int64 (num_frames, 2): label offset, label count
+    <store>/labels.bin     uint8 labels of all frames back to back
+
+Scan ids are the names the generate_incre_labels scripts give their .label
+files ("%06d" % sample index). A store is looked up next to the prediction
+folder as <folder>_store, see pseudo_label_store_path.
+"""
+
+import json
+import os
+import numpy as np
+
+PSEUDO_LABEL_VERSION = 1
+
+
+def pseudo_label_store_path(pred_dir):
+    return os.path.normpath(pred_dir) + "_store"
+
+
+class PseudoLabelWriter(object):
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.keys = []
+        self.offsets = []
+        self.num_labels = 0
+        self._file = open(os.path.join(path, "labels.bin"), "wb")
+
+    def add(self, key, labels):
+        labels = np.asarray(labels).reshape(-1)
+        if labels.size and (labels.min() < 0 or labels.max() > 255):
+            raise ValueError("pseudo labels of %s do not fit into uint8" % key)
+        self._file.write(labels.astype(np.uint8).tobytes())
+        self.keys.append(key)
+        self.offsets.append((self.num_labels, labels.size))
+        self.num_labels += labels.size
+
+    def close(self):
+        self._file.close()
+        np.save(os.path.join(self.path, "offsets.npy"), np.asarray(self.offsets, dtype=np.int64).reshape(-1, 2))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": PSEUDO_LABEL_VERSION, "keys": self.keys}, f)
+
+
+class PseudoLabelStore(object):
+    """uint8 pseudo labels by scan id, returned as read-only views of a lazily opened memmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != PSEUDO_LABEL_VERSION:
+            raise Exception("Unsupported pseudo label store version: %s" % meta["version"])
+        self.keys = meta["keys"]
+        self.key_to_row = {key: row for row, key in enumerate(self.keys)}
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self._labels = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.key_to_row
+
+    def __getstate__(self):
+        # never ship the open mapping to worker processes
+        state = self.__dict__.copy()
+        state["_labels"] = None
+        return state
+
+    def __getitem__(self, key):
+        """(N, 1) uint8 labels of one frame"""
+        if self._labels is None:
+            labels_path = os.path.join(self.path, "labels.bin")
+            if os.path.getsize(labels_path) == 0:
+                self._labels = np.zeros(0, dtype=np.uint8)
+            else:
+                self._labels = np.asarray(np.memmap(labels_path, dtype=np.uint8, mode="r"))
+        offset, count = self.offsets[self.key_to_row[key]]
+        return self._labels[offset:offset + count].reshape((-1, 1))
@@ -0,0 +1,129 @@
+# -*- coding:utf-8 -*-
+# @file: read_ahead.py
+
+"""
+Read-ahead for sequential passes over a pc_dataset.
+
+ReadAheadDataset wraps a pc_dataset and, after every request, loads the next
+`depth` samples with a small thread pool. A sample is the whole pc_dataset
+item, so scans, labels, multiscan neighbours and distillation labels are all
+fetched ahead. The samples a process reads next follow from the order of a
+DataLoader without shuffling: batch b holds indices b * batch_size up to
+(b + 1) * batch_size - 1 and goes to worker b % num_workers, so a worker
+reads its batch through and then skips the batches of the other workers.
+batch_size has to be the one of the DataLoader, with a shuffling sampler
+nothing is read ahead usefully.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from torch.utils import data
+
+
+class ReadAheadStats(object):
+    """
+    hits: sample was ready, late: sample was in flight and waited for,
+    misses: sample was not scheduled and read synchronously.
+    Counters are per process, i.e. per DataLoader worker.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.late = 0
+        self.misses = 0
+        self.stall_time = 0.0
+
+    @property
+    def requests(self):
+        return self.hits + self.late + self.misses
+
+    def hit_rate(self):
+        return self.hits / max(self.requests, 1)
+
+    def __repr__(self):
+        return "ReadAheadStats(requests=%d, hit rate=%.1f%%, late=%d, misses=%d, stall=%.1f ms/sample)" % (
+            self.requests, self.hit_rate() * 100, self.late, self.misses,
+            self.stall_time * 1e3 / max(self.requests, 1))
+
+
+class ReadAheadDataset(data.Dataset):
+    def __init__(self, dataset, depth=4, num_threads=2, report_every=0, batch_size=1):
+        if batch_size < 1:
+            raise ValueError("read-ahead needs a batch_size of at least 1, got %d" % batch_size)
+        self.dataset = dataset
+        self.depth = depth
+        self.num_threads = num_threads
+        self.report_every = report_every
+        self.batch_size = batch_size
+        self.stats = ReadAheadStats()
+        self._pool = None
+        self._buffer = {}
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, name):
+        # expose the wrapped pc_dataset, e.g. read_stats or im_idx
+        if name.startswith("__") or name == "dataset":
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __getstate__(self):
+        # threads and pending reads stay in the process that created them
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_buffer"] = {}
+        state["stats"] = ReadAheadStats()
+        return state
+
+    def next_indices(self, index):
+        """the depth indices this process reads after index"""
+        worker = data.get_worker_info()
+        num_workers = worker.num_workers if worker is not None else 1
+        wanted = []
+        batch, offset = divmod(index, self.batch_size)
+        while len(wanted) < self.depth:
+            offset += 1
+            if offset == self.batch_size:
+                batch, offset = batch + num_workers, 0
+            i = batch * self.batch_size + offset
+            if i >= len(self.dataset):
+                break
+            wanted.append(i)
+        return wanted
+
+    def _schedule(self, index):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.num_threads)
+        wanted = self.next_indices(index)
+        # drop reads that fell out of the window, the buffer never holds more than depth samples
+        for i in list(self._buffer):
+            if i not in wanted:
+                self._buffer.pop(i).cancel()
+        for i in wanted:
+            if i not in self._buffer:
+                self._buffer[i] = self._pool.submit(self.dataset.__getitem__, i)
+
+    def __getitem__(self, index):
+        future = self._buffer.pop(index, None)
+        if future is None:
+            self.stats.misses += 1
+            t0 = time.perf_counter()
+            sample = self.dataset[index]
+            self.stats.stall_time += time.perf_counter() - t0
+        elif future.done():
+            self.stats.hits += 1
+            sample = future.result()
+        else:
+            self.stats.late += 1
+            t0 = time.perf_counter()
+            sample = future.result()
+            self.stats.stall_time += time.perf_counter() - t0
+
+        if self.depth > 0:
+            self._schedule(index)
+        if self.report_every and self.stats.requests % self.report_every == 0:
+            worker = data.get_worker_info()
+            print("read-ahead worker %d: %s" % (worker.id if worker is not None else 0, self.stats))
+        return sample
@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+# @file: sample_batch.py
+
+"""
+One collate function and batch type for all dataset wrappers.
+
+The wrappers return (voxel_position, voxel labels, grid_ind, point labels,
+point features) followed, depending on the wrapper, by the sample index, the
+save path or the voxel labels for distillation, and by the VoxelIndex with
+voxel_index set. collate_fn_BEV, collate_fn_BEV_val, collate_fn_BEV_test,
+collate_fn_BEV_incre and the nuScenes collate_fn_BEV are BatchCollate
+instances that only differ in the name of that sixth entry.
+
+A BatchCollate with fields collates only the named fields, every other field
+of the SampleBatch is None: e.g. the dense voxel labels a test loop never
+looks at are neither stacked nor pickled back from the workers. Set them with
+batch_fields in train_data_loader / val_data_loader, e.g.
+
+    batch_fields: "grid, pt_fea, path_save"
+
+A SampleBatch unpacks like the tuples the collate functions used to return,
+
+    for i_iter, (_, train_vox_label, train_grid, _, train_pt_fea) in enumerate(train_dataset_loader):
+
+and the fields are also available by name (batch.vox_label, batch.grid ...).
+The VoxelIndexBatch is only available by name, batch.voxel_index, so the
+loops unpack the same number of entries with and without voxel_index.
+"""
+
+import torch
+
+from dataloader.sparse_labels import collate_voxel_label
+from dataloader.voxel_grid import stack_voxel_position
+from dataloader.voxel_index import VoxelIndexBatch
+
+# regular sample entries, the extra entry and the VoxelIndex follow
+BASE_FIELDS = ("voxel_position", "vox_label", "grid", "pt_labs", "pt_fea")
+EXTRA_FIELDS = ("index", "path_save", "dis_labels")
+FIELDS = BASE_FIELDS + EXTRA_FIELDS + ("voxel_index",)
+
+
+def parse_fields(fields):
+    """field names of a comma separated batch_fields string, None (all fields) for an empty one"""
+    names = tuple(name.strip() for name in fields.split(",") if name.strip())
+    return names or None
+
+
+class SampleBatch(object):
+    """
+    collated samples. layout is the order the fields unpack in, fields that
+    were not collated are None. voxel_index is never part of the layout.
+    """
+
+    def __init__(self, layout, batch_size, **fields):
+        self.layout = tuple(layout)
+        self.batch_size = batch_size
+        for name in FIELDS:
+            setattr(self, name, fields.get(name))
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.layout)
+
+    def fields(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def replace(self, **fields):
+        values = self.fields()
+        values.update(fields)
+        return SampleBatch(self.layout, self.batch_size, **values)
+
+    def pin_memory(self):
+        # called by the DataLoader's pin thread, numpy lists stay as they are
+        return self.replace(**{name: value.pin_memory() for name, value in self.fields().items()
+                               if hasattr(value, "pin_memory")})
+
+
+class BatchCollate(object):
+    """
+    collate_fn of the dataset wrappers.
+
+    extra: name of the entry after the point features, one of EXTRA_FIELDS or
+    None when the samples end with them. fields: names to collate, None for all.
+    """
+
+    def __init__(self, extra=None, fields=None):
+        if extra is not None and extra not in EXTRA_FIELDS:
+            raise ValueError("unknown extra field %s, expected one of %s" % (extra, ", ".join(EXTRA_FIELDS)))
+        if fields is not None:
+            unknown = sorted(set(fields) - set(FIELDS))
+            if unknown:
+                raise ValueError("unknown batch fields %s, expected any of %s" % (", ".join(unknown), ", ".join(FIELDS)))
+            fields = frozenset(fields)
+        self.extra = extra
+        self.fields = fields
+
+    def wants(self, name):
+        return self.fields is None or name in self.fields
+
+    def __call__(self, data):
+        layout = BASE_FIELDS
+        num_fields = len(BASE_FIELDS)
+        values = {}
+        if self.wants("voxel_position"):
+            voxel_position = stack_voxel_position(data)
+            values["voxel_position"] = torch.from_numpy(voxel_position) if voxel_position is not None else None
+        if self.wants("vox_label"):
+            values["vox_label"] = collate_voxel_label([d[1] for d in data])
+        for i, name in enumerate(("grid", "pt_labs", "pt_fea"), 2):
+            if self.wants(name):
+                values[name] = [d[i] for d in data]
+        if self.extra is not None:
+            layout += (self.extra,)
+            num_fields += 1
+            if self.wants(self.extra):
+                entries = [d[num_fields - 1] for d in data]
+                values[self.extra] = collate_voxel_label(entries) if self.extra == "dis_labels" else entries
+        if len(data[0]) > num_fields and self.wants("voxel_index"):
+            values["voxel_index"] = VoxelIndexBatch.collate([d[num_fields] for d in data])
+        return SampleBatch(layout, len(data), **values)
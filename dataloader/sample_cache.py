@@ -0,0 +1,419 @@
+# -*- coding:utf-8 -*-
+# @file: sample_cache.py
+
+"""
+On-disk cache of voxelized validation and test samples.
+
+Without augmentation a sample of a dataset wrapper (grid_ind, point features,
+voxel targets, ...) only depends on the scan, the label mapping and the grid
+config. CachedDataset wraps such a wrapper and stores every sample it
+produces in one file per sample:
+
+    <cache_dir>/<config digest>/config.json     what the digest was built from
+    <cache_dir>/<config digest>/<key>.smp       one sample
+
+The config digest covers the wrapper and pc_dataset classes, the voxelizer
+settings and the content of the label mapping. The sample key covers the
+index and the path, size and mtime of every file the sample is read from, so
+an edited scan or label file is a miss and gets rewritten.
+
+A .smp file is a small JSON header followed by 64-byte aligned arrays. Hits
+are served as copy-on-write views of a memory map of the file. Dense label
+volumes are stored as their non-ignore voxels only and integer arrays in the
+narrowest type that holds them. They are restored to the exact arrays the
+wrapper returned.
+
+The cache is bounded by max_bytes over the whole cache_dir. Hits refresh the
+mtime of their file and the least recently used files are removed when a
+write crosses the bound. Warm or clear it with tools/sample_cache.py.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+from torch.utils import data
+
+from dataloader.sparse_labels import SparseVoxelLabel
+from dataloader.voxel_index import VoxelIndex
+
+SAMPLE_CACHE_VERSION = 3
+SAMPLE_SUFFIX = ".smp"
+_MAGIC = b"C3DSMPL1"
+_ALIGN = 64
+# eviction removes files until this fraction of max_bytes is left
+_LOW_WATER = 0.9
+
+
+def _digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def file_identity(path):
+    try:
+        st = os.stat(path)
+        return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    except OSError:
+        return [os.path.abspath(path), None, None]
+
+
+def _base_dataset(pc_dataset):
+    # unwrap ReadAheadDataset
+    while "dataset" in vars(pc_dataset):
+        pc_dataset = vars(pc_dataset)["dataset"]
+    return pc_dataset
+
+
+def sample_sources(pc_dataset, index):
+    """paths of the files sample index of a pc_dataset is read from"""
+    pc_dataset = _base_dataset(pc_dataset)
+    if hasattr(pc_dataset, "im_idx"):
+        scan = pc_dataset.im_idx[index]
+        return [scan, scan.replace("velodyne", "labels")[:-3] + "label"]
+    if hasattr(pc_dataset, "sample_index"):
+        columns = ("lidar_path", "lidarseg_path", "panoptic_path")
+        paths = [pc_dataset.sample_index.get(c, index) for c in columns if c in pc_dataset.sample_index.columns]
+        return [os.path.join(pc_dataset.data_path, p) for p in paths if p]
+    if hasattr(pc_dataset, "reader"):
+        # a repacked split rewrites its index
+        split_dir = pc_dataset.reader.split_dir
+        return [os.path.join(split_dir, "meta.json"), os.path.join(split_dir, "index.npy")]
+    if hasattr(pc_dataset, "points_datapath"):
+        return [pc_dataset.points_datapath[index], pc_dataset.labels_datapath[index]]
+    raise ValueError("cannot tell which files the samples of %s are read from" % type(pc_dataset).__name__)
+
+
+def config_key(dataset, label_mapping):
+    """everything except the scan a sample of dataset depends on"""
+    voxelizer = dataset.voxelizer
+    pc_dataset = _base_dataset(dataset.point_cloud_dataset)
+    fixed_bounds = None
+    if voxelizer.fixed_bounds is not None:
+        fixed_bounds = [np.asarray(b).tolist() for b in voxelizer.fixed_bounds]
+    return {
+        "version": SAMPLE_CACHE_VERSION,
+        "dataset": type(dataset).__name__,
+        "pc_dataset": type(pc_dataset).__name__,
+        "imageset": getattr(pc_dataset, "imageset", None),
+        "return_ref": getattr(pc_dataset, "return_ref", None),
+        "return_test": dataset.return_test,
+        "grid_size": np.asarray(voxelizer.grid_size).tolist(),
+        "fixed_bounds": fixed_bounds,
+        "ignore_label": int(voxelizer.ignore_label),
+        "polar": voxelizer.polar,
+        "sparse_label": voxelizer.sparse_label,
+        "raw_points": voxelizer.raw_points,
+        "voxel_index": voxelizer.return_voxel_index,
+        "feature_dtype": voxelizer.feature_dtype.str,
+        "label_mapping": _file_digest(label_mapping),
+    }
+
+
+def _narrow(array):
+    """array in the narrowest signed integer type that holds its values, other arrays unchanged"""
+    if array.dtype.kind not in "iu" or array.dtype.itemsize <= 2 or array.size == 0:
+        return array
+    low, high = array.min(), array.max()
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if dtype().itemsize < array.dtype.itemsize and info.min <= low and high <= info.max:
+            return array.astype(dtype)
+    return array
+
+
+class _Writer(object):
+    def __init__(self):
+        self.arrays = []
+        self.nbytes = 0
+
+    def add(self, array):
+        array = np.asarray(array)
+        stored = _narrow(array)
+        ref = {"dtype": stored.dtype.str, "shape": list(array.shape), "offset": self.nbytes}
+        if stored.dtype != array.dtype:
+            ref["restore"] = array.dtype.str
+        self.arrays.append(np.ascontiguousarray(stored))
+        self.nbytes += -(-stored.nbytes // _ALIGN) * _ALIGN
+        return ref
+
+
+def _encode(field, writer, grid_size, ignore_label):
+    if field is None:
+        return {"kind": "none"}
+    if isinstance(field, (int, np.integer)):
+        return {"kind": "int", "value": int(field)}
+    if isinstance(field, str):
+        return {"kind": "str", "value": field}
+    if isinstance(field, SparseVoxelLabel):
+        return {"kind": "sparse_label", "grid_size": list(field.grid_size), "ignore_label": field.ignore_label,
+                "coords": writer.add(field.coords), "labels": writer.add(field.labels)}
+    if isinstance(field, VoxelIndex):
+        return {"kind": "voxel_index", "coords": writer.add(field.coords), "inverse": writer.add(field.inverse)}
+    if isinstance(field, np.ndarray):
+        if field.dtype == np.uint8 and field.shape == grid_size:
+            # a label volume holds the ignore label everywhere but in the occupied voxels
+            flat = field.reshape(-1)
+            voxels = np.flatnonzero(flat != ignore_label).astype(np.uint32)
+            return {"kind": "volume", "shape": list(field.shape), "fill": ignore_label,
+                    "voxels": writer.add(voxels), "values": writer.add(flat[voxels])}
+        return {"kind": "array", "array": writer.add(field)}
+    raise TypeError("cannot cache sample field of type %s" % type(field).__name__)
+
+
+def _decode(spec, buffer):
+    def array(ref):
+        dtype = np.dtype(ref["dtype"])
+        count = int(np.prod(ref["shape"], dtype=np.int64))
+        a = buffer[ref["offset"]:ref["offset"] + count * dtype.itemsize].view(dtype).reshape(ref["shape"])
+        return a.astype(ref["restore"]) if "restore" in ref else a
+
+    kind = spec["kind"]
+    if kind == "none":
+        return None
+    if kind in ("int", "str"):
+        return spec["value"]
+    if kind == "sparse_label":
+        return SparseVoxelLabel(array(spec["coords"]), array(spec["labels"]), spec["grid_size"], spec["ignore_label"])
+    if kind == "voxel_index":
+        return VoxelIndex(array(spec["coords"]), array(spec["inverse"]))
+    if kind == "volume":
+        volume = np.full(spec["shape"], spec["fill"], dtype=np.uint8)
+        volume.reshape(-1)[array(spec["voxels"])] = array(spec["values"])
+        return volume
+    if kind == "array":
+        return array(spec["array"])
+    raise ValueError("unknown sample field kind %s" % kind)
+
+
+class PackedSample(object):
+    """header and aligned arrays of one sample, see pack_sample"""
+
+    def __init__(self, head, arrays, nbytes):
+        self.head = head
+        self.arrays = arrays
+        self.nbytes = nbytes
+
+    def write(self, f):
+        f.write(self.head)
+        for a in self.arrays:
+            f.write(a.tobytes())
+            f.write(b"\0" * (-a.nbytes % _ALIGN))
+
+    def copy_into(self, buffer):
+        """write into a writable buffer of at least nbytes, e.g. a SharedMemory's buf"""
+        out = np.frombuffer(buffer, dtype=np.uint8, count=self.nbytes)
+        out[:len(self.head)] = np.frombuffer(self.head, dtype=np.uint8)
+        offset = len(self.head)
+        for a in self.arrays:
+            out[offset:offset + a.nbytes] = a.reshape(-1).view(np.uint8)
+            offset += -(-a.nbytes // _ALIGN) * _ALIGN
+
+
+def pack_sample(sample, grid_size, ignore_label):
+    writer = _Writer()
+    fields = [_encode(f, writer, tuple(int(g) for g in grid_size), int(ignore_label)) for f in sample]
+    header = json.dumps({"version": SAMPLE_CACHE_VERSION, "fields": fields}).encode("utf-8")
+    head = _MAGIC + struct.pack("<Q", len(header)) + header
+    head += b"\0" * (-len(head) % _ALIGN)
+    return PackedSample(head, writer.arrays, len(head) + writer.nbytes)
+
+
+def unpack_sample(buffer):
+    """sample tuple from a (N,) uint8 array holding a packed sample, arrays are views of it"""
+    if bytes(buffer[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError("not a cached sample")
+    header_len, = struct.unpack("<Q", bytes(buffer[len(_MAGIC):len(_MAGIC) + 8]))
+    header_end = len(_MAGIC) + 8 + header_len
+    header = json.loads(bytes(buffer[len(_MAGIC) + 8:header_end]).decode("utf-8"))
+    if header["version"] != SAMPLE_CACHE_VERSION:
+        raise ValueError("unsupported cached sample version %s" % header["version"])
+    start = -(-header_end // _ALIGN) * _ALIGN
+    return tuple(_decode(spec, buffer[start:]) for spec in header["fields"])
+
+
+def write_sample(path, sample, grid_size, ignore_label):
+    packed = pack_sample(sample, grid_size, ignore_label)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        packed.write(f)
+    # workers of several jobs may write the same sample, the last rename wins
+    os.replace(tmp, path)
+    return packed.nbytes
+
+
+def read_sample(path):
+    """sample tuple stored in path, arrays are copy-on-write views of a memory map"""
+    if os.path.getsize(path) < len(_MAGIC) + 8:
+        raise ValueError("%s is not a cached sample" % path)
+    return unpack_sample(np.asarray(np.memmap(path, dtype=np.uint8, mode="c")))
+
+
+class SampleCacheStats(object):
+    """counters are per process, i.e. per DataLoader worker"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_written = 0
+        self.bytes_evicted = 0
+
+    def __repr__(self):
+        return "SampleCacheStats(hits=%d, misses=%d, written=%.1f MB, evicted=%.1f MB)" % (
+            self.hits, self.misses, self.bytes_written / 2 ** 20, self.bytes_evicted / 2 ** 20)
+
+
+class SampleCache(object):
+    """size-bounded directory of cached samples, shared by all configs"""
+
+    def __init__(self, cache_dir, max_bytes=20 * 2 ** 30):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self.stats = SampleCacheStats()
+        # bytes in cache_dir as seen by this process, counted on the first write
+        self._bytes = None
+
+    def entries(self, config_digest=None):
+        """(mtime, size, path) of every cached sample, of one config when given"""
+        if config_digest is not None:
+            dirs = [os.path.join(self.cache_dir, config_digest)]
+        elif os.path.isdir(self.cache_dir):
+            dirs = [e.path for e in os.scandir(self.cache_dir) if e.is_dir()]
+        else:
+            dirs = []
+        entries = []
+        for directory in dirs:
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.name.endswith(SAMPLE_SUFFIX):
+                            try:
+                                st = entry.stat()
+                            except OSError:
+                                continue
+                            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            except OSError:
+                pass
+        return entries
+
+    def usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, target_bytes):
+        """remove the least recently used samples until at most target_bytes are left"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats.bytes_evicted += size
+        self._bytes = total
+        return total
+
+    def clear(self, config_digest=None):
+        """remove all samples, or those of one config, returns the number of bytes freed"""
+        freed = 0
+        for _, size, path in self.entries(config_digest):
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        self._bytes = None
+        return freed
+
+    def register(self, config_digest, key):
+        directory = os.path.join(self.cache_dir, config_digest)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "config.json")
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                json.dump(key, f, indent=1)
+
+    def path(self, config_digest, key):
+        return os.path.join(self.cache_dir, config_digest, _digest(key) + SAMPLE_SUFFIX)
+
+    def get(self, path):
+        try:
+            sample = read_sample(path)
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print("ignoring unreadable cached sample %s: %s" % (path, e))
+            self.stats.misses += 1
+            return None
+        try:
+            # mtime is the recency used by evict
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats.hits += 1
+        return sample
+
+    def put(self, path, sample, grid_size, ignore_label):
+        try:
+            size = write_sample(path, sample, grid_size, ignore_label)
+        except OSError as e:
+            print("could not write cached sample %s: %s" % (path, e))
+            return
+        self.stats.bytes_written += size
+        if self._bytes is None:
+            self._bytes = self.usage()
+        else:
+            self._bytes += size
+        if self._bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * _LOW_WATER))
+
+
+class CachedDataset(data.Dataset):
+    """
+    dataset wrapper whose samples are served from a SampleCache.
+
+    Only deterministic wrappers can be cached: no augmentation, no ds_sample
+    and no voxel_position, which is a full grid per sample.
+    """
+
+    def __init__(self, dataset, cache, label_mapping):
+        augmentor = getattr(dataset, "augmentor", None)
+        if (augmentor is not None and augmentor.enabled) or getattr(dataset, "ds_sample", False):
+            raise ValueError("samples of an augmented dataset cannot be cached")
+        if dataset.voxelizer.return_voxel_position:
+            raise ValueError("samples with return_voxel_position cannot be cached")
+        self.dataset = dataset
+        self.cache = cache
+        self.key = config_key(dataset, label_mapping)
+        self.config_digest = _digest(self.key)
+        cache.register(self.config_digest, self.key)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, name):
+        # expose the wrapped dataset, e.g. voxelizer or point_cloud_dataset
+        if name.startswith("__") or name == "dataset":
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def sample_path(self, index):
+        sources = [file_identity(p) for p in sample_sources(self.dataset.point_cloud_dataset, index)]
+        return self.cache.path(self.config_digest, [index, sources])
+
+    def __getitem__(self, index):
+        path = self.sample_path(index)
+        sample = self.cache.get(path)
+        if sample is None:
+            sample = self.dataset[index]
+            voxelizer = self.dataset.voxelizer
+            self.cache.put(path, sample, voxelizer.grid_size, voxelizer.ignore_label)
+        return sample
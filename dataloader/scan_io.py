@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+# @file: scan_io.py
+
+import os
+import sys
+import numpy as np
+
+
+class ReadStats(object):
+    """
+    Bytes read from disk and bytes copied into private memory by a dataset.
+
+    Counters are per process, so with num_workers > 0 every DataLoader worker
+    keeps its own totals.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.bytes_read = 0
+        self.bytes_copied = 0
+
+    def update(self, bytes_read=0, bytes_copied=0):
+        self.bytes_read += bytes_read
+        self.bytes_copied += bytes_copied
+
+    def count_sample(self):
+        self.samples += 1
+
+    def per_sample(self):
+        n = max(self.samples, 1)
+        return self.bytes_read / n, self.bytes_copied / n
+
+    def __repr__(self):
+        bytes_read, bytes_copied = self.per_sample()
+        return "ReadStats(samples=%d, read/sample=%.2f MB, copied/sample=%.2f MB)" % (
+            self.samples, bytes_read / 2 ** 20, bytes_copied / 2 ** 20)
+
+
+def _read(path, dtype, use_memmap, stats):
+    if use_memmap and os.path.getsize(path) > 0:
+        # read-only view of the page cache, nothing is copied until someone writes
+        array = np.asarray(np.memmap(path, dtype=dtype, mode="r"))
+        copied = 0
+    else:
+        array = np.fromfile(path, dtype=dtype)
+        copied = array.nbytes
+    if stats is not None:
+        stats.update(array.nbytes, copied)
+    return array
+
+
+def read_points(path, use_memmap=False, stats=None, dims=4):
+    """read a float32 velodyne scan as an (N, dims) array"""
+    return _read(path, np.float32, use_memmap, stats).reshape((-1, dims))
+
+
+def read_label(path, use_memmap=False, stats=None):
+    """
+    read a SemanticKITTI .label file.
+
+    Returns the (N,) semantic (low 16 bits) and instance (high 16 bits) ids as
+    uint16 arrays. On little-endian hosts both are strided views of the file.
+    """
+    label = _read(path, np.uint32, use_memmap, stats)
+    if sys.byteorder == "little":
+        halves = label.view(np.uint16).reshape((-1, 2))
+        return halves[:, 0], halves[:, 1]
+    semantic = (label & 0xFFFF).astype(np.uint16)
+    instance = (label >> 16).astype(np.uint16)
+    if stats is not None:
+        stats.update(bytes_copied=semantic.nbytes + instance.nbytes)
+    return semantic, instance
+
+
+def ensure_writeable(array, stats=None):
+    """return array when it can be modified in place, otherwise a private copy of it"""
+    if array.flags.writeable:
+        return array
+    if stats is not None:
+        stats.update(bytes_copied=array.nbytes)
+    return np.array(array)
+
+
+_PCD_TYPES = {
+    ("F", 4): "<f4", ("F", 8): "<f8",
+    ("U", 1): "u1", ("U", 2): "<u2", ("U", 4): "<u4", ("U", 8): "<u8",
+    ("I", 1): "i1", ("I", 2): "<i2", ("I", 4): "<i4", ("I", 8): "<i8",
+}
+
+
+def _read_pcd_header(f):
+    header = {}
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PCD header ended before the DATA line")
+        line = line.decode("ascii", "replace").strip()
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.partition(" ")
+        header[key.upper()] = value.split()
+        if key.upper() == "DATA":
+            return header
+
+
+def _unpack_rgb(packed):
+    packed = packed.astype(np.uint32, copy=False)
+    rgb = np.empty((len(packed), 3), dtype=np.uint8)
+    rgb[:, 0] = packed >> 16
+    rgb[:, 1] = packed >> 8
+    rgb[:, 2] = packed
+    return rgb
+
+
+def _read_pcd_open3d(path, with_points):
+    import open3d as o3d
+
+    pcd = o3d.io.read_point_cloud(path)
+    xyz = np.asarray(pcd.points, dtype=np.float32) if with_points else None
+    return xyz, (np.asarray(pcd.colors) * 255.0).astype(np.uint8)
+
+
+def read_pcd(path, with_points=True):
+    """
+    read the x y z and rgb fields of a .pcd file without building an Open3D point cloud.
+
+    Returns xyz as (N, 3) float32 (None if with_points is False) and rgb as
+    (N, 3) uint8, which equals Open3D's colors * 255. ascii and binary files
+    are decoded with NumPy, other encodings fall back to Open3D.
+    """
+    with open(path, "rb") as f:
+        header = _read_pcd_header(f)
+        fields = header["FIELDS"]
+        sizes = [int(v) for v in header["SIZE"]]
+        types = [t.upper() for t in header["TYPE"]]
+        counts = [int(v) for v in header.get("COUNT", ["1"] * len(fields))]
+        encoding = header["DATA"][0].lower()
+        color = "rgb" if "rgb" in fields else "rgba"
+        if (encoding not in ("ascii", "binary") or color not in fields
+                or any((t, s) not in _PCD_TYPES for t, s in zip(types, sizes))):
+            return _read_pcd_open3d(path, with_points)
+        if "POINTS" in header:
+            num_points = int(header["POINTS"][0])
+        else:
+            num_points = int(header["WIDTH"][0]) * int(header["HEIGHT"][0])
+
+        wanted = ["x", "y", "z", color] if with_points else [color]
+        if encoding == "binary":
+            # names can repeat (e.g. "_" padding), so key the record by position
+            dtype = np.dtype([("f%d" % i, _PCD_TYPES[(t, s)], (c,) if c > 1 else ())
+                              for i, (t, s, c) in enumerate(zip(types, sizes, counts))])
+            data = np.fromfile(f, dtype=dtype, count=num_points)
+            columns = {name: data["f%d" % fields.index(name)] for name in wanted}
+        else:
+            data = np.array(f.read().split(), dtype=np.float64).reshape((num_points, -1))
+            offsets = np.cumsum([0] + counts)
+            columns = {name: data[:, offsets[fields.index(name)]] for name in wanted}
+            # packed float colors must be rounded to float32 before reinterpreting the bits
+            rgb_type = np.float32 if types[fields.index(color)] == "F" else np.uint32
+            columns[color] = columns[color].astype(rgb_type)
+
+    packed = columns[color]
+    if packed.dtype.kind == "f":
+        packed = packed.view(np.uint32)
+    xyz = None
+    if with_points:
+        xyz = np.stack((columns["x"], columns["y"], columns["z"]), axis=1).astype(np.float32, copy=False)
+    return xyz, _unpack_rgb(packed)
@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+# @file: shared_cache.py
+
+"""
+In-memory cache of voxelized val samples shared by all DataLoader workers.
+
+The val loader of the training scripts forks new workers for every eval pass,
+and each worker reads and voxelizes its share of the split again. With
+shared_cache_gb set in val_data_loader, SharedCachedDataset keeps every
+sample it produced in a multiprocessing.shared_memory segment, packed like
+the on-disk cache (see sample_cache.py). Any worker of this and every later
+eval pass of the run serves it from there.
+
+A directory segment created by the main process holds, per dataset index,
+the size, last use and generation of the sample's segment. It is only read
+and written under one lock. When an insert would exceed the budget the least
+recently used samples are unlinked. Segments are named after the main process
+and removed by close(), which runs at exit of the main process.
+"""
+
+import atexit
+import multiprocessing
+import os
+import uuid
+from multiprocessing import shared_memory
+import numpy as np
+from torch.utils import data
+
+from dataloader.sample_cache import pack_sample, unpack_sample
+
+# directory columns
+_SIZE, _TICK, _GENERATION = 0, 1, 2
+
+
+class SharedCacheStats(object):
+    """counters are per process, i.e. per DataLoader worker"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return "SharedCacheStats(hits=%d, misses=%d, evictions=%d)" % (self.hits, self.misses, self.evictions)
+
+
+class SharedCachedDataset(data.Dataset):
+    def __init__(self, dataset, max_bytes):
+        augmentor = getattr(dataset, "augmentor", None)
+        if (augmentor is not None and augmentor.enabled) or getattr(dataset, "ds_sample", False):
+            raise ValueError("samples of an augmented dataset cannot be cached")
+        self.dataset = dataset
+        self.max_bytes = max_bytes
+        self.stats = SharedCacheStats()
+        self.prefix = "c3d_%d_%s" % (os.getpid(), uuid.uuid4().hex[:8])
+        self._owner = os.getpid()
+        self._lock = multiprocessing.Lock()
+        # row 0 holds the total bytes and the clock, row i + 1 sample i
+        self._dir_shm = shared_memory.SharedMemory(create=True, size=(len(dataset) + 1) * 3 * 8,
+                                                   name=self.prefix + "_dir")
+        self._table[:] = 0
+        atexit.register(self.close)
+
+    @property
+    def _table(self):
+        if self._dir_shm is None:
+            self._dir_shm = shared_memory.SharedMemory(name=self.prefix + "_dir")
+        return np.ndarray((len(self.dataset) + 1, 3), dtype=np.int64, buffer=self._dir_shm.buf)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, name):
+        # expose the wrapped dataset, e.g. voxelizer or point_cloud_dataset
+        if name.startswith("__") or name in ("dataset", "_dir_shm"):
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __getstate__(self):
+        # spawned workers attach to the directory by name
+        state = self.__dict__.copy()
+        state["_dir_shm"] = None
+        state["stats"] = SharedCacheStats()
+        return state
+
+    def _name(self, index, generation):
+        return "%s_%d_%d" % (self.prefix, index, generation)
+
+    def _unlink(self, index, generation):
+        try:
+            shm = shared_memory.SharedMemory(name=self._name(index, generation))
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    def _get(self, index):
+        table = self._table
+        with self._lock:
+            size, _, generation = table[index + 1]
+            if size == 0:
+                return None
+            table[0, _TICK] += 1
+            table[index + 1, _TICK] = table[0, _TICK]
+        try:
+            shm = shared_memory.SharedMemory(name=self._name(index, generation))
+        except FileNotFoundError:
+            # evicted between the lookup and the attach
+            return None
+        try:
+            # a private copy, the segment may be unlinked while the sample is in use
+            buffer = np.frombuffer(shm.buf, dtype=np.uint8, count=size).copy()
+        finally:
+            shm.close()
+        return unpack_sample(buffer)
+
+    def _evict(self, table, needed):
+        # caller holds the lock
+        while table[0, _SIZE] + needed > self.max_bytes:
+            filled = np.flatnonzero(table[1:, _SIZE])
+            if len(filled) == 0:
+                return
+            victim = filled[np.argmin(table[filled + 1, _TICK])]
+            self._unlink(victim, table[victim + 1, _GENERATION])
+            table[0, _SIZE] -= table[victim + 1, _SIZE]
+            table[victim + 1, _SIZE] = 0
+            self.stats.evictions += 1
+
+    def _put(self, index, sample):
+        voxelizer = self.dataset.voxelizer
+        packed = pack_sample(sample, voxelizer.grid_size, voxelizer.ignore_label)
+        if packed.nbytes > self.max_bytes:
+            return
+        table = self._table
+        with self._lock:
+            if table[index + 1, _SIZE]:
+                return
+            self._evict(table, packed.nbytes)
+            generation = table[index + 1, _GENERATION] + 1
+            try:
+                shm = shared_memory.SharedMemory(create=True, size=packed.nbytes, name=self._name(index, generation))
+            except OSError as e:
+                print("could not cache sample %d in shared memory: %s" % (index, e))
+                return
+            try:
+                packed.copy_into(shm.buf)
+            finally:
+                shm.close()
+            table[0, _SIZE] += packed.nbytes
+            table[0, _TICK] += 1
+            table[index + 1] = (packed.nbytes, table[0, _TICK], generation)
+
+    def __getitem__(self, index):
+        sample = self._get(index)
+        if sample is not None:
+            self.stats.hits += 1
+            return sample
+        self.stats.misses += 1
+        sample = self.dataset[index]
+        self._put(index, sample)
+        return sample
+
+    def usage(self):
+        """bytes cached and number of cached samples"""
+        table = self._table
+        with self._lock:
+            return int(table[0, _SIZE]), int(np.count_nonzero(table[1:, _SIZE]))
+
+    def close(self):
+        """unlink every segment, only in the process that created the cache"""
+        if os.getpid() != self._owner or self._dir_shm is None:
+            return
+        table = self._table
+        with self._lock:
+            for index in np.flatnonzero(table[1:, _SIZE]):
+                self._unlink(index, table[index + 1, _GENERATION])
+            table[:] = 0
+        # the table is a view of the segment, it has to go before the segment is closed
+        del table
+        self._dir_shm.close()
+        self._dir_shm.unlink()
+        self._dir_shm = None
@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+# @file: sparse_labels.py
+
+"""
+Sparse voxel label targets.
+
+A scan occupies a few tens of thousands of the 480x360x32 voxels, yet the
+dense target is a full grid of the ignore label per sample, collated to int64
+and copied to the GPU. With sparse_label set in dataset_params the dataset
+wrappers return a SparseVoxelLabel (occupied voxel coordinates plus their
+majority label) instead, and the collate functions batch them into a
+SparseVoxelLabelBatch with the sample index as first coordinate.
+
+loss_builder.voxel_loss gathers the logits of the occupied voxels and gives
+the same loss as the dense target, whose empty voxels are all ignored. Code
+that edits or indexes the dense volume goes through as_dense_label, which
+scatters the batch into the dense volume on the device it lives on, and is a
+no-op for dense targets.
+"""
+
+import numpy as np
+import torch
+
+from dataloader.voxel_labels import DEFAULT_METHOD, process_label, vote_label
+
+
+class SparseVoxelLabel(object):
+    """
+    majority labels of the occupied voxels of one sample.
+
+    coords: (M, 3) int32 voxel indices, labels: (M,) uint8
+    """
+
+    def __init__(self, coords, labels, grid_size, ignore_label):
+        self.coords = coords
+        self.labels = labels
+        self.grid_size = tuple(int(g) for g in grid_size)
+        self.ignore_label = int(ignore_label)
+
+    @classmethod
+    def from_points(cls, grid_ind, labels, grid_size, ignore_label, method=DEFAULT_METHOD):
+        voxels, best = vote_label(grid_ind, labels, grid_size, method)
+        coords = np.stack(np.unravel_index(voxels, tuple(grid_size)), axis=1).astype(np.int32)
+        return cls(coords, best, grid_size, ignore_label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def dense(self):
+        processed_label = np.full(self.grid_size, self.ignore_label, dtype=np.uint8)
+        processed_label[self.coords[:, 0], self.coords[:, 1], self.coords[:, 2]] = self.labels
+        return processed_label
+
+
+class SparseVoxelLabelBatch(object):
+    """
+    collated SparseVoxelLabel.
+
+    coords: (K, 4) [batch, x, y, z], labels: (K,)
+    Mirrors the tensor calls the scripts make on the dense target, i.e.
+    .to(device).long(). coords are int32 until they are moved and int64
+    after.
+    """
+
+    def __init__(self, coords, labels, batch_size, grid_size, ignore_label):
+        self.coords = coords
+        self.labels = labels
+        self.batch_size = batch_size
+        self.grid_size = tuple(grid_size)
+        self.ignore_label = ignore_label
+
+    @classmethod
+    def collate(cls, samples):
+        coords = torch.from_numpy(np.concatenate([
+            np.concatenate([np.full((len(s), 1), b, dtype=np.int32), s.coords], axis=1)
+            for b, s in enumerate(samples)]))
+        labels = torch.from_numpy(np.concatenate([s.labels for s in samples]))
+        return cls(coords, labels, len(samples), samples[0].grid_size, samples[0].ignore_label)
+
+    def _replace(self, coords, labels):
+        return SparseVoxelLabelBatch(coords, labels, self.batch_size, self.grid_size, self.ignore_label)
+
+    def __len__(self):
+        return self.batch_size
+
+    @property
+    def device(self):
+        return self.labels.device
+
+    def type(self, dtype):
+        # only the labels change type, coordinates stay int64 for indexing
+        labels = self.labels.type(dtype)
+        return self._replace(self.coords.to(labels.device).long(), labels)
+
+    def long(self):
+        return self._replace(self.coords.long(), self.labels.long())
+
+    def to(self, *args, **kwargs):
+        labels = self.labels.to(*args, **kwargs)
+        coords = self.coords.to(labels.device, non_blocking=kwargs.get("non_blocking", False))
+        return self._replace(coords.long(), labels)
+
+    def gather(self, outputs):
+        """(K, C) logits of the occupied voxels from (B, C, *grid_size) outputs"""
+        b, x, y, z = self.coords.unbind(1)
+        return outputs.permute(0, 2, 3, 4, 1)[b, x, y, z]
+
+    def dense(self):
+        """(B, *grid_size) target, empty voxels hold the ignore label"""
+        processed_label = torch.full((self.batch_size,) + self.grid_size, self.ignore_label,
+                                     dtype=self.labels.dtype, device=self.labels.device)
+        b, x, y, z = self.coords.unbind(1)
+        processed_label[b, x, y, z] = self.labels
+        return processed_label
+
+
+def voxel_label(grid_ind, labels, grid_size, ignore_label, sparse=False):
+    """dense uint8 grid of majority labels, or the SparseVoxelLabel when sparse"""
+    if sparse:
+        return SparseVoxelLabel.from_points(grid_ind, labels, grid_size, ignore_label)
+    processed_label = np.ones(grid_size, dtype=np.uint8) * ignore_label
+    return process_label(processed_label, grid_ind, labels)
+
+
+def collate_voxel_label(samples):
+    """stack dense labels to a uint8 tensor, batch SparseVoxelLabel"""
+    if samples[0] is None:
+        # labels are voxelized after collate, see batch_voxelizer.py
+        return None
+    if isinstance(samples[0], SparseVoxelLabel):
+        return SparseVoxelLabelBatch.collate(samples)
+    return torch.from_numpy(np.stack(samples))
+
+
+def as_dense_label(label):
+    """dense (B, *grid_size) target from a dense or sparse one"""
+    if isinstance(label, SparseVoxelLabelBatch):
+        return label.dense()
+    return label
@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+# @file: voxel_grid.py
+
+import functools
+import numpy as np
+
+
+@functools.lru_cache(maxsize=4)
+def _voxel_position(grid_size, min_bound, max_bound, polar):
+    grid_size = np.asarray(grid_size)
+    min_bound = np.asarray(min_bound)
+    intervals = (np.asarray(max_bound) - min_bound) / (grid_size - 1)
+    dim_array = np.ones(len(grid_size) + 1, int)
+    dim_array[0] = -1
+    voxel_position = np.indices(grid_size) * intervals.reshape(dim_array) + min_bound.reshape(dim_array)
+    if polar:
+        voxel_position = np.stack((voxel_position[0] * np.cos(voxel_position[1]),
+                                   voxel_position[0] * np.sin(voxel_position[1]),
+                                   voxel_position[2]), axis=0)
+    # collate used to cast to float32 anyway
+    voxel_position = voxel_position.astype(np.float32)
+    voxel_position.flags.writeable = False
+    return voxel_position
+
+
+def cached_voxel_position(grid_size, min_bound, max_bound, polar=True):
+    """
+    (3, *grid_size) float32 lower corner of every voxel, in cartesian coordinates
+    when the grid is polar.
+
+    The grid only depends on its size and bounds, so it is computed once per
+    process and shared read-only by every sample with the same volume.
+    """
+    key = lambda a: tuple(np.asarray(a, dtype=np.float64).tolist())
+    return _voxel_position(tuple(int(g) for g in grid_size), key(min_bound), key(max_bound), polar)
+
+
+def stack_voxel_position(data):
+    """collate the first sample entries, None when the dataset omits voxel_position"""
+    if data[0][0] is None:
+        return None
+    return np.stack([d[0] for d in data]).astype(np.float32)
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+# @file: voxel_index.py
+
+"""
+Occupied voxels and point -> voxel index computed by the data pipeline.
+
+cylinder_fea pools the point features of every occupied voxel. Without help
+it finds the voxels with torch.unique(..., dim=0) over the (N, 4) batch
+indices, a sort of the whole batch in the forward pass. With voxel_index set
+in dataset_params the dataset wrappers append a VoxelIndex to every sample,
+computed in the workers with the slot table of voxel_labels.py, and the
+collate functions set the VoxelIndexBatch with batch-global voxel rows as
+batch.voxel_index, see sample_batch.py.
+
+    for i_iter, train_batch in enumerate(loader):
+        _, train_vox_label, train_grid, train_pt_labs, train_pt_fea = train_batch
+        voxel_index = train_batch.voxel_index.to(pytorch_device) if train_batch.voxel_index is not None else None
+        outputs = my_model(train_pt_fea_ten, train_vox_ten, len(train_pt_fea), voxel_index=voxel_index)
+
+coords and inverse are exactly the unq and unq_inv torch.unique returns.
+"""
+
+import numpy as np
+import torch
+
+from dataloader.voxel_labels import voxel_inverse
+
+
+class VoxelIndex(object):
+    """
+    occupied voxels of one sample.
+
+    coords: (M, 3) int32 voxel indices in increasing order, inverse: (N,) int32 row of every point
+    """
+
+    def __init__(self, coords, inverse):
+        self.coords = coords
+        self.inverse = inverse
+
+    @classmethod
+    def from_grid(cls, grid_ind, grid_size):
+        voxels, inverse = voxel_inverse(grid_ind, grid_size)
+        coords = np.stack(np.unravel_index(voxels, tuple(grid_size)), axis=1).astype(np.int32)
+        return cls(coords, inverse.astype(np.int32))
+
+    def __len__(self):
+        return len(self.coords)
+
+
+class VoxelIndexBatch(object):
+    """
+    collated VoxelIndex.
+
+    coords: (K, 4) [batch, x, y, z], inverse: (N,) row of every point of the
+    concatenated samples. Both are int32 in the batch and int64 once moved to
+    the device.
+    """
+
+    def __init__(self, coords, inverse):
+        self.coords = coords
+        self.inverse = inverse
+
+    @classmethod
+    def collate(cls, samples):
+        coords = np.concatenate([
+            np.concatenate([np.full((len(s), 1), b, dtype=np.int32), s.coords], axis=1)
+            for b, s in enumerate(samples)])
+        # rows of a sample start after the voxels of the samples before it
+        offsets = np.cumsum([0] + [len(s) for s in samples[:-1]]).astype(np.int32)
+        inverse = np.concatenate([s.inverse + o for s, o in zip(samples, offsets)])
+        return cls(torch.from_numpy(coords), torch.from_numpy(inverse))
+
+    @property
+    def device(self):
+        return self.inverse.device
+
+    def to(self, *args, **kwargs):
+        return VoxelIndexBatch(self.coords.to(*args, **kwargs).long(), self.inverse.to(*args, **kwargs).long())
+
@@ -0,0 +1,235 @@
+# -*- coding:utf-8 -*-
+# @file: voxel_labels.py
+
+"""
+Per-voxel majority labels without sorting.
+
+Voxel indices are linearized to int64 ids and mapped to compact rows through a
+dense slot table of the grid size, which is kept per thread and reset after
+every call, so a call costs O(points) and never touches the whole grid. Ties
+go to the smallest label, exactly like nb_process_label's argmax.
+
+method "numba" counts serially, "numba_parallel" partitions the points by
+the thread that owns their voxel and counts every partition on its own thread
+(numba.get_num_threads() threads), "bincount" needs NumPy only.
+
+    process_label(processed_label, grid_ind, labels)
+
+is a drop-in for
+
+    pair = np.concatenate([grid_ind, labels], axis=1)
+    pair = pair[np.lexsort((grid_ind[:, 0], grid_ind[:, 1], grid_ind[:, 2])), :]
+    nb_process_label(np.copy(processed_label), pair)
+
+and vote_label(grid_ind, labels, grid_size) returns the same labels as a list
+of occupied voxels, see dataloader/sparse_labels.py. voxel_inverse gives the
+occupied voxels and the voxel of every point, see dataloader/voxel_index.py.
+"""
+
+import threading
+import numba as nb
+import numpy as np
+
+VOXEL_LABEL_METHODS = ("numba", "numba_parallel", "bincount")
+DEFAULT_METHOD = "numba"
+
+# voxel ids per slot table cache line, the owner thread of a voxel is (id >> _OWNER_SHIFT) % threads
+_OWNER_SHIFT = 4
+
+_local = threading.local()
+
+
+def _slot_table(num_voxels):
+    """(num_voxels,) int32 table of -1, reused by later calls of the same thread"""
+    tables = getattr(_local, "tables", None)
+    if tables is None:
+        tables = _local.tables = {}
+    table = tables.get(num_voxels)
+    if table is None:
+        table = tables[num_voxels] = np.full(num_voxels, -1, dtype=np.int32)
+    return table
+
+
+def linear_voxel_ids(grid_ind, grid_size):
+    grid_ind = np.asarray(grid_ind, dtype=np.int64)
+    return (grid_ind[:, 0] * grid_size[1] + grid_ind[:, 1]) * grid_size[2] + grid_ind[:, 2]
+
+
+@nb.jit("i4[:](i8[:],i4[:],i8[:])", nopython=True, cache=True)
+def nb_assign_rows(voxel_ids, slot, voxels):
+    # compact row of every point, voxels[row] gets the voxel id of the row
+    rows = np.empty(voxel_ids.shape[0], dtype=np.int32)
+    num_rows = 0
+    for i in range(voxel_ids.shape[0]):
+        v = voxel_ids[i]
+        r = slot[v]
+        if r < 0:
+            r = num_rows
+            slot[v] = r
+            voxels[r] = v
+            num_rows += 1
+        rows[i] = r
+    return rows
+
+
+@nb.jit("i8(i8[:],u1[:],i4[:],i8,i8[:],u1[:])", nopython=True, cache=True)
+def nb_vote_label(voxel_ids, labels, slot, num_labels, voxels, best):
+    # voxels[:num_rows] gets the occupied voxel ids, best[:num_rows] their majority labels
+    rows = nb_assign_rows(voxel_ids, slot, voxels)
+    num_rows = rows.max() + 1 if rows.shape[0] > 0 else 0
+    counts = np.zeros((num_rows, num_labels), dtype=np.int32)
+    for i in range(rows.shape[0]):
+        counts[rows[i], labels[i]] += 1
+    for r in range(num_rows):
+        b = 0
+        for l in range(1, num_labels):
+            if counts[r, l] > counts[r, b]:
+                b = l
+        best[r] = b
+        slot[voxels[r]] = -1
+    return num_rows
+
+
+@nb.jit("i8(i8[:],u1[:],i4[:],i8,i8[:],u1[:])", nopython=True, parallel=True)
+def nb_vote_label_parallel(voxel_ids, labels, slot, num_labels, voxels, best):
+    # every voxel has one owner thread, the points are partitioned by owner and each
+    # thread counts only its own voxels, so no two threads write the same slot or counter
+    n = voxel_ids.shape[0]
+    num_threads = nb.get_num_threads()
+    chunk = (n + num_threads - 1) // num_threads
+    hist = np.zeros((num_threads, num_threads), dtype=np.int64)
+    for c in nb.prange(num_threads):
+        for i in range(c * chunk, min(n, (c + 1) * chunk)):
+            hist[c, (voxel_ids[i] >> _OWNER_SHIFT) % num_threads] += 1
+    # points of owner t, chunk c start at offsets[c, t], owner t's points at starts[t]
+    offsets = np.empty((num_threads, num_threads), dtype=np.int64)
+    starts = np.empty(num_threads + 1, dtype=np.int64)
+    pos = 0
+    for t in range(num_threads):
+        starts[t] = pos
+        for c in range(num_threads):
+            offsets[c, t] = pos
+            pos += hist[c, t]
+    starts[num_threads] = pos
+    order = np.empty(n, dtype=np.int64)
+    for c in nb.prange(num_threads):
+        for i in range(c * chunk, min(n, (c + 1) * chunk)):
+            t = (voxel_ids[i] >> _OWNER_SHIFT) % num_threads
+            order[offsets[c, t]] = i
+            offsets[c, t] += 1
+
+    # rows of owner t are compacted from starts[t] in owner_voxels / owner_best
+    owner_voxels = np.empty(n, dtype=np.int64)
+    owner_best = np.empty(n, dtype=np.uint8)
+    owner_rows = np.zeros(num_threads + 1, dtype=np.int64)
+    for t in nb.prange(num_threads):
+        start = starts[t]
+        rows = np.empty(starts[t + 1] - start, dtype=np.int32)
+        num_rows = 0
+        for j in range(rows.shape[0]):
+            v = voxel_ids[order[start + j]]
+            r = slot[v]
+            if r < 0:
+                r = num_rows
+                slot[v] = r
+                owner_voxels[start + r] = v
+                num_rows += 1
+            rows[j] = r
+        counts = np.zeros((num_rows, num_labels), dtype=np.int32)
+        for j in range(rows.shape[0]):
+            counts[rows[j], labels[order[start + j]]] += 1
+        for r in range(num_rows):
+            b = 0
+            for l in range(1, num_labels):
+                if counts[r, l] > counts[r, b]:
+                    b = l
+            owner_best[start + r] = b
+            slot[owner_voxels[start + r]] = -1
+        owner_rows[t + 1] = num_rows
+    for t in range(num_threads):
+        owner_rows[t + 1] += owner_rows[t]
+    for t in nb.prange(num_threads):
+        for r in range(owner_rows[t + 1] - owner_rows[t]):
+            voxels[owner_rows[t] + r] = owner_voxels[starts[t] + r]
+            best[owner_rows[t] + r] = owner_best[starts[t] + r]
+    return owner_rows[num_threads]
+
+
+def bincount_vote_label(voxel_ids, labels, slot, num_labels, voxels, best):
+    """NumPy-only variant of nb_vote_label"""
+    # the last point of every voxel becomes its representative, ranks of the representatives are the rows
+    slot[voxel_ids] = np.arange(len(voxel_ids), dtype=np.int32)
+    last = slot[voxel_ids]
+    is_rep = np.zeros(len(voxel_ids), dtype=bool)
+    is_rep[last] = True
+    rank = np.cumsum(is_rep, dtype=np.int64) - 1
+    rows = rank[last]
+    num_rows = int(rank[-1]) + 1 if len(rank) else 0
+
+    counts = np.bincount(rows * num_labels + labels, minlength=num_rows * num_labels)
+    voxels[:num_rows] = voxel_ids[is_rep]
+    best[:num_rows] = counts.reshape((num_rows, num_labels)).argmax(axis=1)
+    slot[voxel_ids] = -1
+    return num_rows
+
+
+_VOTE_FUNCS = {
+    "numba": nb_vote_label,
+    "numba_parallel": nb_vote_label_parallel,
+    "bincount": bincount_vote_label,
+}
+
+
+def vote_label(grid_ind, labels, grid_size, method=DEFAULT_METHOD):
+    """
+    majority label of every occupied voxel.
+
+    grid_ind: (N, 3) voxel indices, labels: (N,) or (N, 1) labels below 256
+    returns the (M,) int64 linear ids of the occupied voxels, in no particular
+    order, and their (M,) uint8 labels
+    """
+    labels = np.ascontiguousarray(labels, dtype=np.uint8).reshape(-1)
+    if len(labels) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+    voxel_ids = linear_voxel_ids(grid_ind, grid_size)
+    slot = _slot_table(int(np.prod(grid_size)))
+    voxels = np.empty(len(labels), dtype=np.int64)
+    best = np.empty(len(labels), dtype=np.uint8)
+    num_rows = _VOTE_FUNCS[method](voxel_ids, labels, slot, int(labels.max()) + 1, voxels, best)
+    return voxels[:num_rows], best[:num_rows]
+
+
+def voxel_inverse(grid_ind, grid_size):
+    """
+    occupied voxels of a scan and the voxel of every point, like
+    np.unique(linear_voxel_ids(grid_ind, grid_size), return_inverse=True).
+
+    Only the occupied voxels are sorted, the points are assigned with the slot table.
+    returns the (M,) int64 increasing linear ids of the occupied voxels and
+    the (N,) int64 position of every point's voxel in them
+    """
+    voxel_ids = linear_voxel_ids(grid_ind, grid_size)
+    if len(voxel_ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    slot = _slot_table(int(np.prod(grid_size)))
+    voxels = np.empty(len(voxel_ids), dtype=np.int64)
+    rows = nb_assign_rows(voxel_ids, slot, voxels)
+    voxels = voxels[:rows.max() + 1]
+    slot[voxels] = -1
+    order = np.argsort(voxels)
+    rank = np.empty(len(voxels), dtype=np.int64)
+    rank[order] = np.arange(len(voxels))
+    return voxels[order], rank[rows]
+
+
+def process_label(processed_label, grid_ind, labels, method=DEFAULT_METHOD):
+    """
+    write the majority label of every occupied voxel into a copy of processed_label.
+
+    processed_label: uint8 grid filled with the ignore label
+    grid_ind: (N, 3) voxel indices, labels: (N,) or (N, 1) labels below 256
+    """
+    processed_label = np.array(processed_label, dtype=np.uint8, order="C")
+    voxels, best = vote_label(grid_ind, labels, processed_label.shape, method)
+    processed_label.reshape(-1)[voxels] = best
+    return processed_label
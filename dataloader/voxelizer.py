@@ -0,0 +1,228 @@
+# -*- coding:utf-8 -*-
+# @file: voxelizer.py
+
+"""
+Point augmentation and voxelization shared by the dataset wrappers.
+
+Every wrapper in dataset_semantickitti.py and dataset_nuscenes.py runs the
+same augment -> cart2polar -> bounds -> grid_ind -> features pipeline, they
+only differ in the rotation range, the enabled augmentations and what they
+do with instances before. PointAugmentor and CylindricalVoxelizer hold that
+pipeline once and keep it in float32: bounds and intervals are float32 and,
+with fixed_volume_space, computed once in the constructor.
+"""
+
+import numpy as np
+from torch.utils import data
+
+from dataloader.sparse_labels import voxel_label
+from dataloader.voxel_grid import cached_voxel_position
+from dataloader.voxel_index import VoxelIndex
+from dataloader.voxel_labels import linear_voxel_ids
+
+
+def cart2polar(input_xyz):
+    rho = np.sqrt(input_xyz[:, 0] ** 2 + input_xyz[:, 1] ** 2)
+    phi = np.arctan2(input_xyz[:, 1], input_xyz[:, 0])
+    return np.stack((rho, phi, input_xyz[:, 2]), axis=1)
+
+
+class PointAugmentor(object):
+    """
+    random rotation around z in rotate_range (degrees), flip of x, y or both,
+    xy scaling in [0.95, 1.05] and gaussian translation.
+
+    The enabled transforms are composed into one 3x3 matrix plus translation
+    and applied with a single float32 matmul. Random numbers come from a
+    np.random.Generator per process: the main process seeds it with seed,
+    DataLoader workers with seed and their worker seed, which torch derives
+    from the loader's generator for every epoch. seed=None draws fresh
+    entropy in the main process.
+    """
+
+    def __init__(self, rotate_aug=False, rotate_range=(-45, 45), flip_aug=False, scale_aug=False,
+                 transform_aug=False, trans_std=(0.1, 0.1, 0.1), seed=None):
+        self.rotate_aug = rotate_aug
+        self.rotate_range = rotate_range
+        self.flip_aug = flip_aug
+        self.scale_aug = scale_aug
+        self.transform_aug = transform_aug
+        self.trans_std = trans_std
+        self.seed = seed
+        self._rng = None
+        self._rng_key = None
+
+    @property
+    def enabled(self):
+        return self.rotate_aug or self.flip_aug or self.scale_aug or self.transform_aug
+
+    @property
+    def rng(self):
+        # a forked worker inherits the parent's generator, it gets its own on first use
+        worker = data.get_worker_info()
+        key = worker.seed if worker is not None else None
+        if self._rng is None or key != self._rng_key:
+            entropy = [key] if key is not None else []
+            if self.seed is not None:
+                entropy.append(self.seed)
+            self._rng = np.random.default_rng(np.random.SeedSequence(entropy or None))
+            self._rng_key = key
+        return self._rng
+
+    def sample(self):
+        """(3, 3) float32 matrix and (3,) translation of one random draw, applied as xyz @ matrix + translation"""
+        rng = self.rng
+        matrix = np.eye(3)
+        translation = np.zeros(3)
+        if self.rotate_aug:
+            low, high = self.rotate_range
+            rotate_rad = np.deg2rad(rng.random() * (high - low) + low)
+            c, s = np.cos(rotate_rad), np.sin(rotate_rad)
+            matrix[:2, :2] = [[c, s], [-s, c]]
+        # flip x, y or x+y
+        if self.flip_aug:
+            flip_type = rng.integers(4)
+            if flip_type & 1:
+                matrix[:, 0] = -matrix[:, 0]
+            if flip_type & 2:
+                matrix[:, 1] = -matrix[:, 1]
+        if self.scale_aug:
+            matrix[:, :2] *= rng.uniform(0.95, 1.05)
+        if self.transform_aug:
+            translation = rng.normal(0, self.trans_std)
+        return matrix.astype(np.float32), translation.astype(np.float32)
+
+    def __call__(self, xyz):
+        """augmented copy of (N, 3) xyz, xyz itself when no augmentation is enabled"""
+        if not self.enabled:
+            return xyz
+        matrix, translation = self.sample()
+        xyz = np.matmul(np.asarray(xyz, dtype=np.float32), matrix)
+        if self.transform_aug:
+            xyz += translation
+        return xyz
+
+
+class CylindricalVoxelizer(object):
+    """
+    grid indices, point features and voxel targets of a scan.
+
+    polar=True bins (rho, phi, z) and gives the 9 (10 with intensity) point
+    features [xyz_pol - voxel center, xyz_pol, x, y]; polar=False bins x, y, z
+    like voxel_dataset and gives [xyz - voxel center, xyz].
+    Without fixed_volume_space the volume is the bounding box of every scan.
+    With raw_points the scan is only passed on as [x, y, z(, intensity)] and
+    voxelized per batch by BatchVoxelizer, see batch_voxelizer.py.
+    return_voxel_index has the wrappers append the VoxelIndex of the scan,
+    see voxel_index.py, it is ignored with raw_points.
+
+    Samples are kept compact until they reach the device: grid_ind is int16
+    (int32 for grids with more than 32767 cells along an axis), point labels
+    are a flat uint8 array and the point features are computed in float32 and
+    stored as feature_dtype, "float32" or "float16". The loops widen them
+    after the copy, see point_tensors in point_batch.py.
+    """
+
+    def __init__(self, grid_size, fixed_volume_space=False, max_volume_space=(50, np.pi, 2),
+                 min_volume_space=(0, -np.pi, -4), ignore_label=0, polar=True, sparse_label=False,
+                 return_voxel_position=False, raw_points=False, return_voxel_index=False,
+                 feature_dtype="float32"):
+        self.grid_size = np.asarray(grid_size)
+        if feature_dtype not in ("float32", "float16"):
+            raise ValueError("feature_dtype must be float32 or float16, got %s" % feature_dtype)
+        self.feature_dtype = np.dtype(feature_dtype)
+        self.index_dtype = np.int16 if self.grid_size.max() <= np.iinfo(np.int16).max else np.int32
+        self.fixed_volume_space = fixed_volume_space
+        self.ignore_label = ignore_label
+        self.polar = polar
+        self.sparse_label = sparse_label
+        self.return_voxel_position = return_voxel_position
+        self.raw_points = raw_points
+        self.return_voxel_index = return_voxel_index and not raw_points
+        self.fixed_bounds = None
+        if fixed_volume_space:
+            self.fixed_bounds = self._intervals(np.asarray(min_volume_space, dtype=np.float32),
+                                                np.asarray(max_volume_space, dtype=np.float32))
+
+    def _intervals(self, min_bound, max_bound):
+        intervals = ((max_bound - min_bound) / (self.grid_size - 1)).astype(np.float32)
+        if (intervals == 0).any():
+            print("Zero interval!")
+        return min_bound, max_bound, intervals
+
+    def bounds(self, xyz_vox):
+        """min_bound, max_bound and voxel size of the volume"""
+        if self.fixed_bounds is not None:
+            return self.fixed_bounds
+        return self._intervals(xyz_vox.min(axis=0), xyz_vox.max(axis=0))
+
+    @staticmethod
+    def polar_coordinates(xyz):
+        """
+        float32 (rho, phi, z) of float32 xyz, computed in float64: numpy and
+        torch round float32 sqrt / atan2 differently, their float64 results
+        rounded to float32 agree (see batch_voxelizer.py)
+        """
+        return cart2polar(xyz.astype(np.float64)).astype(np.float32)
+
+    def grid_indices(self, xyz_vox, min_bound, max_bound, intervals):
+        return np.floor((np.clip(xyz_vox, min_bound, max_bound) - min_bound) / intervals).astype(self.index_dtype)
+
+    def occupied_voxels(self, xyz):
+        """number of voxels the (N, 3) points fall into"""
+        xyz = np.asarray(xyz, dtype=np.float32)
+        xyz_vox = self.polar_coordinates(xyz) if self.polar else xyz
+        grid_ind = self.grid_indices(xyz_vox, *self.bounds(xyz_vox))
+        return len(np.unique(linear_voxel_ids(grid_ind, self.grid_size)))
+
+    def voxel_label(self, grid_ind, labels):
+        """majority label volume, or SparseVoxelLabel with sparse_label"""
+        if self.raw_points:
+            return None
+        return voxel_label(grid_ind, labels, self.grid_size, self.ignore_label, sparse=self.sparse_label)
+
+    def point_labels(self, labels):
+        """(N,) uint8 point labels"""
+        return np.asarray(labels, dtype=np.uint8).reshape(-1)
+
+    def voxel_index(self, grid_ind):
+        """occupied voxels and point -> voxel index of the scan"""
+        return VoxelIndex.from_grid(grid_ind, self.grid_size)
+
+    def __call__(self, xyz, labels, sig=None):
+        """
+        xyz: (N, 3) points, labels: (N, 1) point labels, sig: (N,) intensity or None
+        returns voxel_position (None unless requested), voxel labels,
+        (N, 3) int16/int32 grid_ind and (N, 8/9/10) feature_dtype point features
+        """
+        xyz = np.asarray(xyz, dtype=np.float32)
+        if self.raw_points:
+            points = xyz if sig is None else np.concatenate((xyz, np.reshape(sig, (-1, 1))), axis=1)
+            return None, None, None, np.ascontiguousarray(points, dtype=np.float32)
+
+        xyz_vox = self.polar_coordinates(xyz) if self.polar else xyz
+        min_bound, max_bound, intervals = self.bounds(xyz_vox)
+
+        grid_ind = self.grid_indices(xyz_vox, min_bound, max_bound, intervals)
+
+        # only built on request and then shared by all samples with the same volume
+        voxel_position = None
+        if self.return_voxel_position:
+            voxel_position = cached_voxel_position(self.grid_size, min_bound, max_bound, polar=self.polar)
+
+        processed_label = self.voxel_label(grid_ind, labels)
+
+        # center data on each voxel for PTnet, features are written into one preallocated array
+        num_fea = 8 if self.polar else 6
+        return_fea = np.empty((len(xyz), num_fea + (sig is not None)), dtype=np.float32)
+        voxel_centers = (grid_ind.astype(np.float32) + 0.5) * intervals + min_bound
+        np.subtract(xyz_vox, voxel_centers, out=return_fea[:, 0:3])
+        return_fea[:, 3:6] = xyz_vox
+        if self.polar:
+            return_fea[:, 6:8] = xyz[:, :2]
+        if sig is not None:
+            return_fea[:, num_fea] = sig
+        if self.feature_dtype != np.float32:
+            return_fea = return_fea.astype(self.feature_dtype)
+
+        return voxel_position, processed_label, grid_ind, return_fea
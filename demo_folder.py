@@ -15,9 +15,12 @@ import yaml
 from utils.metric_util import per_class_iu, fast_hist_crop
 from dataloader.pc_dataset import get_SemKITTI_label_name
 from builder import data_builder, model_builder, loss_builder
+from dataloader.point_batch import point_tensors
+from dataloader.sparse_labels import as_dense_label
 from config.config import load_config_data
 from dataloader.dataset_semantickitti import get_model_class, collate_fn_BEV
 from dataloader.pc_dataset import get_pc_model_class
+from dataloader.label_utils import LabelRemapper
 
 from utils.load_save_util import load_checkpoint
 
@@ -29,7 +32,8 @@ warnings.filterwarnings("ignore")
 def build_dataset(dataset_config,
                   data_dir,
                   grid_size=[480, 360, 32],
-                  demo_label_dir=None):
+                  demo_label_dir=None,
+                  use_memmap=False):
 
     if demo_label_dir == '':
         imageset = "demo"
@@ -40,7 +44,8 @@ def build_dataset(dataset_config,
     SemKITTI_demo = get_pc_model_class('SemKITTI_demo')
 
     demo_pt_dataset = SemKITTI_demo(data_dir, imageset=imageset,
-                              return_ref=True, label_mapping=label_mapping, demo_label_path=demo_label_dir)
+                              return_ref=True, label_mapping=label_mapping, demo_label_path=demo_label_dir,
+                              use_memmap=use_memmap)
 
     demo_dataset = get_model_class(dataset_config['dataset_type'])(
         demo_pt_dataset,
@@ -90,10 +95,9 @@ def main(args):
     loss_func, lovasz_softmax = loss_builder.build(wce=True, lovasz=True,
                                                    num_class=num_class, ignore_label=ignore_label)
 
-    demo_dataset_loader = build_dataset(dataset_config, data_dir, grid_size=grid_size, demo_label_dir=demo_label_dir)
-    with open(dataset_config["label_mapping"], 'r') as stream:
-        semkittiyaml = yaml.safe_load(stream)
-    inv_learning_map = semkittiyaml['learning_map_inv']
+    demo_dataset_loader = build_dataset(dataset_config, data_dir, grid_size=grid_size, demo_label_dir=demo_label_dir,
+                                        use_memmap=configs['val_data_loader']['use_memmap'])
+    label_remapper = LabelRemapper.from_yaml(dataset_config["label_mapping"])
 
     my_model.eval()
     hist_list = []
@@ -101,10 +105,8 @@ def main(args):
     with torch.no_grad():
         for i_iter_demo, (_, demo_vox_label, demo_grid, demo_pt_labs, demo_pt_fea) in enumerate(
                 demo_dataset_loader):
-            demo_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in
-                              demo_pt_fea]
-            demo_grid_ten = [torch.from_numpy(i).to(pytorch_device) for i in demo_grid]
-            demo_label_tensor = demo_vox_label.type(torch.LongTensor).to(pytorch_device)
+            demo_pt_fea_ten, demo_grid_ten = point_tensors(demo_pt_fea, demo_grid, pytorch_device)
+            demo_label_tensor = as_dense_label(demo_vox_label.to(pytorch_device).long())
 
             predict_labels = my_model(demo_pt_fea_ten, demo_grid_ten, demo_batch_size)
             loss = lovasz_softmax(torch.nn.functional.softmax(predict_labels).detach(), demo_label_tensor,
@@ -116,8 +118,7 @@ def main(args):
                                                     count, demo_grid[count][:, 0], demo_grid[count][:, 1],
                                                     demo_grid[count][:, 2]], demo_pt_labs[count],
                                                 unique_label))
-                inv_labels = np.vectorize(inv_learning_map.__getitem__)(predict_labels[count, demo_grid[count][:, 0], demo_grid[count][:, 1], demo_grid[count][:, 2]]) 
-                inv_labels = inv_labels.astype('uint32')
+                inv_labels = label_remapper.inverse(predict_labels[count, demo_grid[count][:, 0], demo_grid[count][:, 1], demo_grid[count][:, 2]])
                 outputPath = save_dir + str(i_iter_demo).zfill(6) + '.label'
                 inv_labels.tofile(outputPath)
                 print("save " + outputPath)
@@ -52,26 +52,43 @@ class cylinder_fea(nn.Module):
         else:
             self.pt_fea_dim = self.pool_dim
 
-    def forward(self, pt_fea, xy_ind):
-        cur_dev = pt_fea[0].get_device()
-
-        # concate everything
-        cat_pt_ind = []
-        for i_batch in range(len(xy_ind)):
-            cat_pt_ind.append(F.pad(xy_ind[i_batch], (1, 0), 'constant', value=i_batch))
-
-        cat_pt_fea = torch.cat(pt_fea, dim=0)
-        cat_pt_ind = torch.cat(cat_pt_ind, dim=0)
-        pt_num = cat_pt_ind.shape[0]
+    def forward(self, pt_fea, xy_ind, voxel_index=None):
+        """
+        pt_fea: per sample point features, or a PointBatch holding the
+        features and grid indices of the whole batch, see
+        dataloader/point_batch.py. xy_ind is not used with a PointBatch.
+        voxel_index: optional VoxelIndexBatch from the data pipeline on the
+        device of pt_fea, see dataloader/voxel_index.py. It holds the unique
+        voxels and the point -> voxel index, so torch.unique is skipped.
+        """
+        point_batch = None
+        if isinstance(pt_fea, (list, tuple)):
+            cat_pt_fea = torch.cat(pt_fea, dim=0)
+        else:
+            point_batch = pt_fea
+            cat_pt_fea = point_batch.features
+        pt_num = cat_pt_fea.shape[0]
 
         # shuffle the data
-        shuffled_ind = torch.randperm(pt_num, device=cur_dev)
+        shuffled_ind = torch.randperm(pt_num, device=cat_pt_fea.device)
         cat_pt_fea = cat_pt_fea[shuffled_ind, :]
-        cat_pt_ind = cat_pt_ind[shuffled_ind, :]
 
-        # unique xy grid index
-        unq, unq_inv, unq_cnt = torch.unique(cat_pt_ind, return_inverse=True, return_counts=True, dim=0)
-        unq = unq.type(torch.int64)
+        if voxel_index is not None:
+            unq = voxel_index.coords.type(torch.int64)
+            unq_inv = voxel_index.inverse[shuffled_ind]
+        else:
+            if point_batch is not None:
+                cat_pt_ind = point_batch.indices[shuffled_ind, :]
+            else:
+                # concate everything
+                cat_pt_ind = []
+                for i_batch in range(len(xy_ind)):
+                    cat_pt_ind.append(F.pad(xy_ind[i_batch], (1, 0), 'constant', value=i_batch))
+                cat_pt_ind = torch.cat(cat_pt_ind, dim=0)[shuffled_ind, :]
+
+            # unique xy grid index
+            unq, unq_inv, unq_cnt = torch.unique(cat_pt_ind, return_inverse=True, return_counts=True, dim=0)
+            unq = unq.type(torch.int64)
 
         # process feature
         processed_cat_pt_fea = self.PPmodel(cat_pt_fea)
@@ -38,78 +38,78 @@ class cylinder_asym(nn.Module):
 
         self.sparse_shape = sparse_shape
 
-    def forward(self, train_pt_fea_ten, train_vox_ten, batch_size):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward(self, train_pt_fea_ten, train_vox_ten, batch_size, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg(features_3d, coords, batch_size)
 
         return spatial_features
 
-    def forward_dummy(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy(features_3d, coords, batch_size, ood_num)
 
         return spatial_features
 
-    def forward_dummy_2(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, point_label_tensor):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy_2(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, point_label_tensor, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy_2(features_3d, coords, batch_size, ood_num, point_label_tensor)
 
         return spatial_features
 
-    def forward_dummy_3(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy_3(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy_3(features_3d, coords, batch_size, ood_num)
 
         return spatial_features
 
-    def forward_dummy_4(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy_4(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy_4(features_3d, coords, batch_size, ood_num)
 
         return spatial_features
 
-    def forward_dummy_final(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy_final(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy_final(features_3d, coords, batch_size, ood_num)
 
         return spatial_features
 
-    def forward_dummy_upper(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dummy_upper(self, train_pt_fea_ten, train_vox_ten, batch_size, ood_num, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dummy_upper(features_3d, coords, batch_size, ood_num)
 
         return spatial_features
 
-    def forward_DML(self, train_pt_fea_ten, train_vox_ten, batch_size):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_DML(self, train_pt_fea_ten, train_vox_ten, batch_size, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_DML(features_3d, coords, batch_size)
 
         return spatial_features
 
-    def forward_dropout(self, train_pt_fea_ten, train_vox_ten, batch_size):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dropout(self, train_pt_fea_ten, train_vox_ten, batch_size, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dropout(features_3d, coords, batch_size)
 
         return spatial_features
 
-    def forward_dropout_eval(self, train_pt_fea_ten, train_vox_ten, batch_size):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_dropout_eval(self, train_pt_fea_ten, train_vox_ten, batch_size, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_dropout_eval(features_3d, coords, batch_size)
 
         return spatial_features
 
-    def forward_incremental(self, train_pt_fea_ten, train_vox_ten, batch_size, incre_cls=None):
-        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten)
+    def forward_incremental(self, train_pt_fea_ten, train_vox_ten, batch_size, incre_cls=None, voxel_index=None):
+        coords, features_3d = self.cylinder_3d_generator(train_pt_fea_ten, train_vox_ten, voxel_index)
 
         spatial_features = self.cylinder_3d_spconv_seg.forward_incremental(features_3d, coords, batch_size, incre_cls)
 
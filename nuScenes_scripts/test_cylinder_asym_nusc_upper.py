@@ -17,6 +17,8 @@ import spconv.pytorch as spconv
 from utils.metric_util import per_class_iu, fast_hist_crop
 from dataloader.pc_dataset import get_SemKITTI_label_name
 from builder import data_builder, model_builder, loss_builder
+from dataloader.point_batch import point_tensors
+from dataloader.sparse_labels import as_dense_label
 from config.config import load_config_data
 
 from utils.load_save_util import load_checkpoint, load_checkpoint_1b1
@@ -85,10 +87,8 @@ def main(args):
         for i_iter_val, (_, val_vox_label, val_grid, val_pt_labs, val_pt_fea, sd_token) in enumerate(
                 val_dataset_loader):
 
-            val_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in
-                              val_pt_fea]
-            val_grid_ten = [torch.from_numpy(i).to(pytorch_device) for i in val_grid]
-            val_label_tensor = val_vox_label.type(torch.LongTensor).to(pytorch_device)
+            val_pt_fea_ten, val_grid_ten = point_tensors(val_pt_fea, val_grid, pytorch_device)
+            val_label_tensor = as_dense_label(val_vox_label.to(pytorch_device).long())
 
             predict_labels = my_model.forward(val_pt_fea_ten, val_grid_ten, val_batch_size)
 
@@ -15,6 +15,8 @@ from tqdm import tqdm
 from utils.metric_util import per_class_iu, fast_hist_crop
 from dataloader.pc_dataset import get_nuScenes_label_name
 from builder import data_builder, model_builder, loss_builder
+from dataloader.point_batch import point_tensors
+from dataloader.sparse_labels import as_dense_label
 from config.config import load_config_data
 
 from utils.load_save_util import load_checkpoint, load_checkpoint_1b1
@@ -90,10 +92,8 @@ def main(args):
                     for i_iter_val, (_, val_vox_label, val_grid, val_pt_labs, val_pt_fea, idx) in enumerate(
                             val_dataset_loader):
 
-                        val_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in
-                                          val_pt_fea]
-                        val_grid_ten = [torch.from_numpy(i).to(pytorch_device) for i in val_grid]
-                        val_label_tensor = val_vox_label.type(torch.LongTensor).to(pytorch_device)
+                        val_pt_fea_ten, val_grid_ten = point_tensors(val_pt_fea, val_grid, pytorch_device)
+                        val_label_tensor = as_dense_label(val_vox_label.to(pytorch_device).long())
 
                         predict_labels = my_model.forward_dropout(val_pt_fea_ten, val_grid_ten, val_batch_size)
                         loss = lovasz_softmax(torch.nn.functional.softmax(predict_labels).detach(), val_label_tensor,
@@ -126,15 +126,14 @@ def main(args):
                 print('Current val loss is %.3f' %
                       (np.mean(val_loss_list)))
 
-            train_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in train_pt_fea]
-            train_vox_ten = [torch.from_numpy(i).to(pytorch_device) for i in train_grid]
-            point_label_tensor = train_vox_label.type(torch.LongTensor).to(pytorch_device)
+            train_pt_fea_ten, train_vox_ten = point_tensors(train_pt_fea, train_grid, pytorch_device)
+            point_label_tensor = as_dense_label(train_vox_label.to(pytorch_device).long())
             unknown_clss = [1,5,8,9]
             for unknown_cls in unknown_clss:
                 point_label_tensor[point_label_tensor == unknown_cls] = 0
 
             # forward + backward + optimize
-            outputs = my_model.forward_dropout(train_pt_fea_ten, train_vox_ten, train_batch_size)
+            outputs = my_model.forward_dropout(train_pt_fea_ten, train_vox_ten, len(train_pt_fea))
             loss = lovasz_softmax(torch.nn.functional.softmax(outputs), point_label_tensor, ignore=0) + loss_func(
                 outputs, point_label_tensor)
             loss.backward()
@@ -16,6 +16,8 @@ from tqdm import tqdm
 from utils.metric_util import per_class_iu, fast_hist_crop
 from dataloader.pc_dataset import get_SemKITTI_label_name
 from builder import data_builder, model_builder, loss_builder
+from dataloader.point_batch import point_tensors
+from dataloader.batch_voxelizer import for_dataset
 from config.config import load_config_data
 
 from utils.load_save_util import load_checkpoint
@@ -68,6 +70,9 @@ def main(args):
                                                                   train_dataloader_config,
                                                                   val_dataloader_config,
                                                                   grid_size=grid_size)
+    # set when the scans are voxelized per batch on the device, see dataloader/batch_voxelizer.py
+    train_voxelizer = for_dataset(train_dataset_loader.dataset, pytorch_device)
+    val_voxelizer = for_dataset(val_dataset_loader.dataset, pytorch_device)
 
     # training
     epoch = 0
@@ -81,24 +86,30 @@ def main(args):
         pbar = tqdm(total=len(train_dataset_loader))
         time.sleep(10)
         # lr_scheduler.step(epoch)
-        for i_iter, (_, train_vox_label, train_grid, _, train_pt_fea) in enumerate(train_dataset_loader):
+        for i_iter, train_batch in enumerate(train_dataset_loader):
+            _, train_vox_label, train_grid, train_pt_labs, train_pt_fea = train_batch
             if global_iter % check_iter == 0 and epoch >= 0:
                 my_model.eval()
                 hist_list = []
                 val_loss_list = []
                 with torch.no_grad():
-                    for i_iter_val, (_, val_vox_label, val_grid, val_pt_labs, val_pt_fea, idx) in enumerate(
-                            val_dataset_loader):
-
-                        val_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in
-                                          val_pt_fea]
-                        val_grid_ten = [torch.from_numpy(i).to(pytorch_device) for i in val_grid]
-                        val_label_tensor = val_vox_label.type(torch.LongTensor).to(pytorch_device)
-
-                        predict_labels = my_model(val_pt_fea_ten, val_grid_ten, val_batch_size)
+                    for i_iter_val, val_batch in enumerate(val_dataset_loader):
+                        _, val_vox_label, val_grid, val_pt_labs, val_pt_fea, idx = val_batch
+
+                        if val_voxelizer is not None:
+                            val_label_tensor, val_grid_ten, val_pt_fea_ten = val_voxelizer(val_pt_fea, val_pt_labs)
+                            val_grid = [i.cpu().numpy() for i in val_grid_ten]
+                        else:
+                            val_pt_fea_ten, val_grid_ten = point_tensors(val_pt_fea, val_grid, pytorch_device)
+                            val_label_tensor = val_vox_label.to(pytorch_device).long()
+
+                        val_voxel_index = val_batch.voxel_index
+                        if val_voxel_index is not None:
+                            val_voxel_index = val_voxel_index.to(pytorch_device)
+                        predict_labels = my_model(val_pt_fea_ten, val_grid_ten, val_batch_size,
+                                                  voxel_index=val_voxel_index)
                         # aux_loss = loss_fun(aux_outputs, point_label_tensor)
-                        loss = lovasz_softmax(torch.nn.functional.softmax(predict_labels).detach(), val_label_tensor,
-                                              ignore=0) + loss_func(predict_labels.detach(), val_label_tensor)
+                        loss = loss_builder.voxel_loss(predict_labels.detach(), val_label_tensor, loss_func)
                         predict_labels = torch.argmax(predict_labels, dim=1)
                         predict_labels = predict_labels.cpu().detach().numpy()
                         for count, i_val_grid in enumerate(val_grid):
@@ -127,17 +138,23 @@ def main(args):
                 print('Current val loss is %.3f' %
                       (np.mean(val_loss_list)))
 
-            train_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in train_pt_fea]
-            # train_grid_ten = [torch.from_numpy(i[:,:2]).to(pytorch_device) for i in train_grid]
-            train_vox_ten = [torch.from_numpy(i).to(pytorch_device) for i in train_grid]
-            point_label_tensor = train_vox_label.type(torch.LongTensor).to(pytorch_device)
+            if train_voxelizer is not None:
+                point_label_tensor, train_vox_ten, train_pt_fea_ten = train_voxelizer(train_pt_fea, train_pt_labs)
+            else:
+                train_pt_fea_ten, train_vox_ten = point_tensors(train_pt_fea, train_grid, pytorch_device)
+                # train_grid_ten = [torch.from_numpy(i[:,:2]).to(pytorch_device) for i in train_grid]
+                point_label_tensor = train_vox_label.to(pytorch_device).long()
+
+            # unique voxels and point -> voxel index of the batch, set with voxel_index in dataset_params
+            train_voxel_index = train_batch.voxel_index
+            if train_voxel_index is not None:
+                train_voxel_index = train_voxel_index.to(pytorch_device)
 
             # forward + backward + optimize
-            outputs = my_model(train_pt_fea_ten, train_vox_ten, train_batch_size)
+            outputs = my_model(train_pt_fea_ten, train_vox_ten, len(train_pt_fea), voxel_index=train_voxel_index)
             # print(point_label_tensor.shape) # [2, 480, 360, 32]
             # print(outputs.shape) # [2, 20, 480, 360, 32]
-            loss = lovasz_softmax(torch.nn.functional.softmax(outputs), point_label_tensor, ignore=0) + loss_func(
-                outputs, point_label_tensor)
+            loss = loss_builder.voxel_loss(outputs, point_label_tensor, loss_func)
             loss.backward()
             optimizer.step()
             loss_list.append(loss.item())
@@ -18,6 +18,8 @@ from tqdm import tqdm
 from utils.metric_util import per_class_iu, fast_hist_crop
 from dataloader.pc_dataset import get_SemKITTI_label_name
 from builder import data_builder, model_builder, loss_builder
+from dataloader.point_batch import point_tensors
+from dataloader.sparse_labels import as_dense_label
 from config.config import load_config_data
 
 from utils.load_save_util import load_checkpoint
@@ -101,10 +103,8 @@ def main(args):
                     for i_iter_val, (_, val_vox_label, val_grid, val_pt_labs, val_pt_fea, idx) in enumerate(
                             val_dataset_loader):
 
-                        val_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in
-                                          val_pt_fea]
-                        val_grid_ten = [torch.from_numpy(i).to(pytorch_device) for i in val_grid]
-                        val_label_tensor = val_vox_label.type(torch.LongTensor).to(pytorch_device)
+                        val_pt_fea_ten, val_grid_ten = point_tensors(val_pt_fea, val_grid, pytorch_device)
+                        val_label_tensor = as_dense_label(val_vox_label.to(pytorch_device).long())
 
                         coor_ori, y_in, y_out_dummy, predict_labels = my_model.forward_incremental(val_pt_fea_ten, val_grid_ten, val_batch_size)
                         # aux_loss = loss_fun(aux_outputs, point_label_tensor)
@@ -139,11 +139,10 @@ def main(args):
                 print('Current val loss is %.3f' %
                       (np.mean(val_loss_list)))
 
-            train_pt_fea_ten = [torch.from_numpy(i).type(torch.FloatTensor).to(pytorch_device) for i in train_pt_fea]
+            train_pt_fea_ten, train_vox_ten = point_tensors(train_pt_fea, train_grid, pytorch_device)
             # train_grid_ten = [torch.from_numpy(i[:,:2]).to(pytorch_device) for i in train_grid]
-            train_vox_ten = [torch.from_numpy(i).to(pytorch_device) for i in train_grid]
-            point_label_tensor = train_vox_label.type(torch.LongTensor).to(pytorch_device)
-            dis_label_tensor = dis_labels.type(torch.LongTensor).to(pytorch_device)
+            point_label_tensor = as_dense_label(train_vox_label.to(pytorch_device).long())
+            dis_label_tensor = as_dense_label(dis_labels.to(pytorch_device).long())
 
             point_label_tensor[point_label_tensor == 5] = 21
             if 21 not in torch.unique(point_label_tensor):
@@ -158,7 +157,7 @@ def main(args):
                 continue
 
             # forward + backward + optimize
-            coor_ori, y_in, y_normal_dummy, _ = my_model.forward_incremental(train_pt_fea_ten, train_vox_ten, train_batch_size)
+            coor_ori, y_in, y_normal_dummy, _ = my_model.forward_incremental(train_pt_fea_ten, train_vox_ten, len(train_pt_fea))
 
             voxel_label_origin = point_label_tensor[coor_ori.permute(1,0).chunk(chunks=4, dim=0)].squeeze()
             dis_label_origin = dis_label_tensor[coor_ori.permute(1, 0).chunk(chunks=4, dim=0)].squeeze()
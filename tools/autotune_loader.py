@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-
+# @file: autotune_loader.py
+
+"""
+Measure the samples/s of the train or val loader over a grid of DataLoader
+profiles (see dataloader/loader_profile.py) and write the fastest one to the
+config. Only the lines of the settings that changed are rewritten, settings
+the section does not have yet are appended to it.
+
+    python autotune_loader.py -y ../config/semantickitti.yaml --loader val
+    python autotune_loader.py -y ../config/semantickitti.yaml --loader train --workers 4,8,16 --prefetch 2,4,8
+
+Grid values are comma separated, --affinity values semicolon separated
+("none" for no affinity). Every profile runs --passes passes over the first
+--batches batches of the split with worker start-up included, so
+persistent_workers only pays off with two passes or more, like the eval passes
+of a training run. The datasets are built once and shared by all profiles,
+turn shared_cache_gb off for the val loader or the first profile warms the
+cache for all others.
+"""
+
+import argparse
+import copy
+import gc
+import itertools
+import os
+import sys
+import time
+sys.path.append("..")
+import torch
+
+from builder import data_builder
+from config.config import load_config_data, update_config_file
+from dataloader.loader_profile import PROFILE_KEYS, loader_kwargs
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def _bools(text):
+    return [bool(v) for v in _ints(text)]
+
+
+def profiles(args, loader_config):
+    """distinct profiles of the grid, settings that need workers are dropped without them"""
+    affinities = [a.strip() for a in args.affinity.split(";")] if args.affinity else [loader_config["cpu_affinity"]]
+    affinities = ["" if a == "none" else a for a in affinities]
+    seen = set()
+    for num_workers, prefetch_factor, pin_memory, persistent_workers, worker_threads, cpu_affinity in itertools.product(
+            _ints(args.workers), _ints(args.prefetch), _bools(args.pin), _bools(args.persistent),
+            _ints(args.threads), affinities):
+        if num_workers == 0:
+            prefetch_factor, persistent_workers, worker_threads, cpu_affinity = 2, False, 0, ""
+        profile = dict(zip(PROFILE_KEYS, (num_workers, persistent_workers, prefetch_factor, pin_memory,
+                                          cpu_affinity, worker_threads)))
+        key = tuple(profile.values())
+        if key not in seen:
+            seen.add(key)
+            yield profile
+
+
+def measure(dataset_loader, batches, passes):
+    """samples/s of passes over the first batches batches"""
+    samples = 0
+    start = time.perf_counter()
+    for _ in range(passes):
+        for i_iter, batch in enumerate(dataset_loader):
+            samples += batch.batch_size
+            if i_iter + 1 == batches:
+                break
+    return samples / (time.perf_counter() - start)
+
+
+def main(args):
+    configs = load_config_data(args.config_path)
+    section = "%s_data_loader" % args.loader
+    loader_config = configs[section]
+    train_dataset_loader, val_dataset_loader = data_builder.build(configs["dataset_params"],
+                                                                  configs["train_data_loader"],
+                                                                  configs["val_data_loader"],
+                                                                  grid_size=configs["model_params"]["output_shape"])
+    base_loader = train_dataset_loader if args.loader == "train" else val_dataset_loader
+
+    results = []
+    for profile in profiles(args, loader_config):
+        profile_config = copy.deepcopy(loader_config)
+        profile_config.update(profile)
+        if base_loader.batch_size is None:
+            # batches packed under a budget, see dataloader/budget_sampler.py
+            batching = dict(batch_sampler=base_loader.batch_sampler)
+        else:
+            batching = dict(batch_size=base_loader.batch_size, shuffle=False, drop_last=base_loader.drop_last)
+        dataset_loader = torch.utils.data.DataLoader(dataset=base_loader.dataset,
+                                                     collate_fn=base_loader.collate_fn,
+                                                     **batching,
+                                                     **loader_kwargs(profile_config))
+        rate = measure(dataset_loader, args.batches, args.passes)
+        # shut down persistent workers before the next profile starts its own
+        del dataset_loader
+        gc.collect()
+        results.append((rate, profile))
+        print("%8.2f samples/s  %s" % (rate, profile))
+
+    rate, best = max(results, key=lambda r: r[0])
+    print("best: %.2f samples/s  %s" % (rate, best))
+    changed = {key: value for key, value in best.items() if loader_config.get(key) != value}
+    if args.dry_run or not changed:
+        return
+    update_config_file(args.config_path, section, changed)
+    print("wrote %s to %s of %s" % (", ".join(sorted(changed)), section, args.config_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('-y', '--config_path', default='../config/semantickitti.yaml')
+    parser.add_argument('--loader', choices=['train', 'val'], default='val')
+    parser.add_argument('--workers', default=','.join(str(w) for w in (0, 2, 4, 8) if w <= os.cpu_count()),
+                        help='num_workers values')
+    parser.add_argument('--prefetch', default='2,4', help='prefetch_factor values')
+    parser.add_argument('--pin', default='0,1' if torch.cuda.is_available() else '0', help='pin_memory values, 0/1')
+    parser.add_argument('--persistent', default='0,1', help='persistent_workers values, 0/1')
+    parser.add_argument('--threads', default='0,1', help='worker_threads values')
+    parser.add_argument('--affinity', default='', help='cpu_affinity values, default the one of the config')
+    parser.add_argument('--batches', type=int, default=50, help='batches per pass')
+    parser.add_argument('--passes', type=int, default=2)
+    parser.add_argument('--dry_run', action='store_true', help='only report, do not write the config')
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
@@ -0,0 +1,47 @@
+# -*- coding:utf-8 -*-
+# @file: build_nusc_index.py
+
+"""
+Resolve lidar paths, label paths and sample-data tokens of nuScenes info pkls
+into the sample index read by the nuScenes pc_datasets.
+
+    python build_nusc_index.py --data_path .../nuScenes/ --version v1.0-trainval \
+        --infos .../nuscenes_infos_train.pkl .../nuscenes_infos_val.pkl
+
+Each index is written next to its pkl as <pkl name>_index.npz.
+"""
+
+import argparse
+import os
+import pickle
+import sys
+sys.path.append("..")
+
+from dataloader.nusc_index import NuscSampleIndex, nusc_index_path
+
+
+def main(args):
+    from nuscenes import NuScenes
+
+    nusc = NuScenes(version=args.version, dataroot=args.data_path, verbose=True)
+    for infos_path in args.infos:
+        with open(infos_path, "rb") as f:
+            infos = pickle.load(f)["infos"]
+        index = NuscSampleIndex.build(infos, nusc, os.path.getsize(infos_path))
+        out = nusc_index_path(infos_path)
+        index.save(out)
+        num_lidarseg = (index.columns["lidarseg_path"] != b"").sum()
+        num_panoptic = (index.columns["panoptic_path"] != b"").sum()
+        print("%s: %d samples, %d with lidarseg, %d with panoptic labels" % (out, len(index), num_lidarseg, num_panoptic))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--data_path', required=True, help='nuScenes dataroot')
+    parser.add_argument('--version', default='v1.0-trainval')
+    parser.add_argument('--infos', nargs='+', required=True, help='nuscenes_infos_*.pkl files to index')
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
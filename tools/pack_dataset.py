@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+# @file: pack_dataset.py
+
+"""
+Pack a SemanticKITTI or nuScenes split into the sharded format read by the
+SemKITTI_packed / SemKITTI_packed_panop pc_datasets.
+
+    python pack_dataset.py --dataset semantickitti --data_path .../sequences \
+        --label_mapping ../config/label_mapping/semantic-kitti.yaml --imageset train --out .../packed
+    python pack_dataset.py --dataset nuscenes --data_path .../nuScenes/ \
+        --imageset .../nuscenes_infos_val.pkl --split val --labels panoptic --out .../packed
+
+Afterwards point data_path at --out and imageset at the split name.
+"""
+
+import argparse
+import os
+import sys
+sys.path.append("..")
+import numpy as np
+import yaml
+from tqdm import tqdm
+
+from dataloader.nusc_index import NuscSampleIndex, has_nusc_index
+from dataloader.packed_scans import PackedScanWriter
+from dataloader.pc_dataset import absoluteFilePaths
+from dataloader.scan_io import read_label, read_points
+
+
+def semantickitti_samples(args):
+    with open(args.label_mapping, "r") as stream:
+        semkittiyaml = yaml.safe_load(stream)
+    split = semkittiyaml["split"]["valid" if args.imageset == "val" else args.imageset]
+    im_idx = []
+    for i_folder in split:
+        im_idx += absoluteFilePaths("/".join([args.data_path, str(i_folder).zfill(2), "velodyne"]))
+
+    has_labels = args.imageset != "test"
+    yield has_labels, len(im_idx)
+    for path in im_idx:
+        points = read_points(path)
+        if has_labels:
+            semantic, instance = read_label(path.replace("velodyne", "labels")[:-3] + "label")
+            yield points, semantic, instance, path
+        else:
+            # same save path SemKITTI_sk returns for the test split
+            path_save = path.replace("velodyne", "predictions").replace("bin", "label")
+            path_save = path_save.replace("dataset", "predictions_test/predictions_incre_latest")
+            yield points, None, None, path_save
+
+
+def nuscenes_samples(args):
+    nusc = None
+    if not has_nusc_index(args.imageset):
+        from nuscenes import NuScenes
+        nusc = NuScenes(version=args.nusc_version, dataroot=args.data_path, verbose=True)
+    sample_index = NuscSampleIndex.for_infos(args.imageset, nusc)
+
+    has_labels = args.imageset.find("test") == -1
+    yield has_labels, len(sample_index)
+    for i in range(len(sample_index)):
+        points = read_points(os.path.join(args.data_path, sample_index.get("lidar_path", i)), dims=5)
+        lidar_sd_token = sample_index.get("lidar_sd_token", i)
+        if not has_labels:
+            yield points, None, None, lidar_sd_token
+        elif args.labels == "panoptic":
+            label_path = os.path.join(args.data_path, sample_index.get("panoptic_path", i))
+            points_label = np.load(label_path)["data"]
+            yield points, points_label // 1000, points_label % 1000, lidar_sd_token
+        else:
+            label_path = os.path.join(args.data_path, sample_index.get("lidarseg_path", i))
+            yield points, np.fromfile(label_path, dtype=np.uint8), None, lidar_sd_token
+
+
+def main(args):
+    if args.dataset == "semantickitti":
+        samples = semantickitti_samples(args)
+        split = args.split or args.imageset
+    else:
+        samples = nuscenes_samples(args)
+        split = args.split or os.path.splitext(os.path.basename(args.imageset))[0]
+
+    has_labels, num_samples = next(samples)
+    writer = PackedScanWriter(args.out, split, has_labels=has_labels, shard_bytes=args.shard_size_mb << 20)
+    for points, semantic, instance, name in tqdm(samples, total=num_samples):
+        writer.add(points, semantic, instance, name)
+    writer.close()
+    print("packed %d scans into %d shards under %s" % (len(writer.index), len(writer.shards), writer.out_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--dataset', choices=['semantickitti', 'nuscenes'], required=True)
+    parser.add_argument('--data_path', required=True, help='sequences folder (SemanticKITTI) or dataroot (nuScenes)')
+    parser.add_argument('--imageset', required=True, help='train/val/test (SemanticKITTI) or an info pkl (nuScenes)')
+    parser.add_argument('--out', required=True, help='root folder of the packed dataset')
+    parser.add_argument('--split', default='', help='name of the packed split, derived from --imageset if empty')
+    parser.add_argument('--label_mapping', default='../config/label_mapping/semantic-kitti.yaml')
+    parser.add_argument('--labels', choices=['lidarseg', 'panoptic'], default='lidarseg')
+    parser.add_argument('--nusc_version', default='v1.0-trainval')
+    parser.add_argument('--shard_size_mb', type=int, default=1024)
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
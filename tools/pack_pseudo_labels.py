@@ -0,0 +1,49 @@
+# -*- coding:utf-8 -*-
+# @file: pack_pseudo_labels.py
+
+"""
+Pack the per-frame int32 .label files written by the generate_incre_labels
+scripts into the uint8 pseudo label store read by SemKITTI_sk_panop_incre and
+SemKITTI_nusc_panop_incre.
+
+    python pack_pseudo_labels.py --pred_dir .../predictions_base_train
+
+The store is written to <pred_dir>_store unless --out is given.
+"""
+
+import argparse
+import os
+import sys
+sys.path.append("..")
+import numpy as np
+from tqdm import tqdm
+
+from dataloader.file_manifest import scan_files
+from dataloader.pseudo_labels import PseudoLabelWriter, pseudo_label_store_path
+
+
+def main(args):
+    out = args.out or pseudo_label_store_path(args.pred_dir)
+    label_files, _ = scan_files([args.pred_dir], contains=".label")
+    label_files.sort()
+
+    writer = PseudoLabelWriter(out)
+    for path in tqdm(label_files):
+        key = os.path.splitext(os.path.basename(path))[0]
+        writer.add(key, np.fromfile(path, dtype=np.int32))
+    writer.close()
+
+    packed_bytes = os.path.getsize(os.path.join(out, "labels.bin"))
+    print("packed %d frames into %s (%.1f MB, was %.1f MB)"
+          % (len(writer.keys), out, packed_bytes / 2 ** 20, packed_bytes * 4 / 2 ** 20))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('--pred_dir', required=True, help='folder with the per-frame .label pseudo labels')
+    parser.add_argument('--out', default='', help='store folder, <pred_dir>_store by default')
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    main(args)
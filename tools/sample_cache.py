@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+# @file: sample_cache.py
+
+"""
+Warm, inspect or clear the on-disk cache of voxelized val/test samples.
+
+    python sample_cache.py warm -y ../config/semantickitti.yaml
+    python sample_cache.py info --cache_dir .../sample_cache
+    python sample_cache.py clear -y ../config/semantickitti.yaml
+
+The cache folder and size bound are val_data_loader's sample_cache and
+sample_cache_gb unless --cache_dir / --max_gb are given. clear with a config
+only removes the samples of that config, without one the whole cache.
+"""
+
+import argparse
+import json
+import os
+import sys
+sys.path.append("..")
+from tqdm import tqdm
+
+from builder import data_builder
+from config.config import load_config_data
+from dataloader.sample_cache import SampleCache
+
+
+def _configs(args):
+    configs = load_config_data(args.config_path)
+    val_dataloader_config = configs["val_data_loader"]
+    if args.cache_dir:
+        val_dataloader_config["sample_cache"] = args.cache_dir
+    if args.max_gb is not None:
+        val_dataloader_config["sample_cache_gb"] = args.max_gb
+    if not val_dataloader_config["sample_cache"]:
+        raise SystemExit("no cache folder, set val_data_loader.sample_cache or pass --cache_dir")
+    if args.num_workers is not None:
+        val_dataloader_config["num_workers"] = args.num_workers
+    return configs
+
+
+def _val_loader(configs):
+    _, val_dataset_loader = data_builder.build(configs["dataset_params"], configs["train_data_loader"],
+                                               configs["val_data_loader"],
+                                               grid_size=configs["model_params"]["output_shape"])
+    return val_dataset_loader
+
+
+def _cache(args):
+    if args.config_path:
+        val_dataloader_config = _configs(args)["val_data_loader"]
+        return SampleCache(val_dataloader_config["sample_cache"],
+                           int(val_dataloader_config["sample_cache_gb"] * 2 ** 30))
+    if not args.cache_dir:
+        raise SystemExit("pass a config (-y) or --cache_dir")
+    return SampleCache(args.cache_dir)
+
+
+def warm(args):
+    val_dataset_loader = _val_loader(_configs(args))
+    cache = val_dataset_loader.dataset.cache
+    before = cache.usage()
+    for _ in tqdm(val_dataset_loader):
+        pass
+    print("cache %s: %.1f MB -> %.1f MB" % (cache.cache_dir, before / 2 ** 20, cache.usage() / 2 ** 20))
+
+
+def info(args):
+    cache = _cache(args)
+    if not os.path.isdir(cache.cache_dir):
+        print("cache %s is empty" % cache.cache_dir)
+        return
+    for entry in sorted(os.scandir(cache.cache_dir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        samples = cache.entries(entry.name)
+        try:
+            with open(os.path.join(entry.path, "config.json"), "r") as f:
+                key = json.load(f)
+            described = "%s/%s %s" % (key["dataset"], key["pc_dataset"], key["imageset"])
+        except (OSError, ValueError, KeyError):
+            described = "?"
+        print("%s  %-50s %6d samples %9.1f MB" % (entry.name, described, len(samples),
+                                                  sum(size for _, size, _ in samples) / 2 ** 20))
+
+
+def clear(args):
+    cache = _cache(args)
+    config_digest = None
+    if args.config_path:
+        config_digest = _val_loader(_configs(args)).dataset.config_digest
+    freed = cache.clear(config_digest)
+    print("removed %.1f MB from %s" % (freed / 2 ** 20, cache.cache_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('command', choices=['warm', 'info', 'clear'])
+    parser.add_argument('-y', '--config_path', default='', help='config whose val split is warmed or cleared')
+    parser.add_argument('--cache_dir', default='', help='overrides val_data_loader.sample_cache')
+    parser.add_argument('--max_gb', type=float, default=None, help='overrides val_data_loader.sample_cache_gb')
+    parser.add_argument('--num_workers', type=int, default=None, help='overrides val_data_loader.num_workers')
+    args = parser.parse_args()
+
+    print(' '.join(sys.argv))
+    print(args)
+    if args.command == 'warm' and not args.config_path:
+        parser.error('warm needs a config (-y)')
+    {'warm': warm, 'info': info, 'clear': clear}[args.command](args)